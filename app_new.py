@@ -1,20 +1,31 @@
 import streamlit as st
-import io
-import chardet
-from docx import Document
-import requests
-from bs4 import BeautifulSoup
 import re
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-from pptx import Presentation
-from pptx.util import Inches, Pt
-from pptx.dml.color import RGBColor
-from pptx.enum.text import PP_ALIGN
 import tempfile
 import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextvars import copy_context
+from collections import deque
+# 重量级依赖（langchain、python-pptx、BeautifulSoup等）在各步骤首次用到时导入，见 startup.py
+import startup
+from llm_client import get_gate, error_status
+from llm_output import parse_extraction
+from metrics import span, llm_span, traced, text_bytes
+from doc_store import DocumentStore, DocumentTooLarge
+import doc_store
+from pipeline_store import get_store, new_job_id
+from speculative import SpeculativeExtractor, config_key
+from model_router import route, tier_span, load_tiers, estimate_tokens, TIER_LABELS
+import scheduler
+from dedupe import find_duplicates, unique_chunks
+import hierarchical
+import batch_jobs
+import endpoint_pool
+import media_utils
+from document_readers import parse_files, combine_documents, split_sections, merge_sections, allocate_chunks
+from prompts import extract_prompt, title_prompt, reask_prompt, reduce_prompt, prompt_token_savings
+import metrics
+import profiling
+from profiling import profiled
 
 # 设置页面
 st.set_page_config(
@@ -108,82 +119,42 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-def detect_encoding(file_content):
-    """检测文件编码"""
-    result = chardet.detect(file_content)
-    return result['encoding']
-
-def extract_text_from_txt(file):
-    """从txt文件中提取文本"""
-    try:
-        content = file.read()
-        encoding = detect_encoding(content)
-        text = content.decode(encoding)
-        return text
-    except Exception as e:
-        return f"错误：无法读取TXT文件。原因：{str(e)}"
-
-def extract_text_from_docx(file):
-    """从docx文件中提取文本"""
-    try:
-        # 检查文件大小
-        file.seek(0, 2)
-        file_size = file.tell()
-        file.seek(0)
-        
-        if file_size == 0:
-            return "错误：文件为空。请确保上传了有效的Word文档。"
-            
-        file_content = file.read()
-        file_in_memory = io.BytesIO(file_content)
-        
-        try:
-            doc = Document(file_in_memory)
-        except Exception as doc_error:
-            if "There is no item named 'NULL' in the archive" in str(doc_error):
-                return "错误：文件格式不正确。请确保：\n1. 文件是真正的.docx格式（不是重命名的.doc文件）\n2. 文件未被损坏\n3. 文件不是空白文档"
-            else:
-                return f"错误：无法读取DOCX文件。原因：{str(doc_error)}"
-        
-        full_text = []
-        for para in doc.paragraphs:
-            if para.text.strip():
-                full_text.append(para.text)
-        
-        text = '\n\n'.join(full_text)
-        
-        if not text:
-            return "错误：文档内容为空。请确保文档包含文本内容。"
-            
-        return text
-        
-    except Exception as e:
-        error_msg = str(e)
-        if "Permission denied" in error_msg:
-            return "错误：无法访问文件。请确保文件未被其他程序占用。"
-        elif "not a zip file" in error_msg.lower():
-            return "错误：文件格式不正确。请确保上传的是正确的.docx格式文件。"
-        else:
-            return f"错误：无法读取DOCX文件。原因：{error_msg}"
-
 def extract_article_from_url(url):
     """从URL中提取文章内容"""
+    import requests
     try:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
+        with span('fetch') as fetch_span:
+            response = requests.get(url, headers=headers, timeout=10)
+            response.raise_for_status()
+            fetch_span['bytes_in'] = len(response.content)
         
         if response.encoding == 'ISO-8859-1':
             response.encoding = response.apparent_encoding
         
-        soup = BeautifulSoup(response.text, 'html.parser')
+        return extract_article_from_html(response.text, base_url=response.url)
+
+    except requests.RequestException as e:
+        return f"错误：无法访问该URL。原因：{str(e)}"
+    except Exception as e:
+        return f"错误：提取文章内容失败。原因：{str(e)}"
+
+@profiled('parse_html')
+@traced('parse_html', bytes_in=text_bytes, bytes_out=text_bytes)
+def extract_article_from_html(html, base_url=None):
+    """从HTML文本中提取文章内容；传入网页地址时下载正文中的图片并替换为图片标记"""
+    try:
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html, 'html.parser')
         
         # 移除不需要的标签
         for script in soup(["script", "style", "meta", "link", "header", "footer", "nav"]):
             script.decompose()
         
+        images = []
+
         # 查找可能的文章内容容器
         article_containers = soup.find_all(['article', 'div'], class_=re.compile(r'article|content|post|text|body'))
         
@@ -201,7 +172,8 @@ def extract_article_from_url(url):
                         for br in p.find_all('br'):
                             br.replace_with('\n')
                         text_blocks.append(text)
-                text = '\n\n'.join(text_blocks)
+                        text_blocks.extend(image_placeholder(img, base_url, images) for img in p.find_all('img'))
+                text = '\n\n'.join(block for block in text_blocks if block)
             else:
                 return "错误：无法从该网页提取有效的文章内容。"
         else:
@@ -228,6 +200,9 @@ def extract_article_from_url(url):
                 elif element.name == 'li':
                     # 保留列表项格式
                     text_blocks.append(f"• {element.get_text().strip()}\n")
+                elif element.name == 'img':
+                    # 图片按在正文中的位置插入占位符
+                    text_blocks.append(image_placeholder(element, base_url, images))
             
             text = '\n'.join(text_blocks)
         
@@ -238,14 +213,42 @@ def extract_article_from_url(url):
         if len(text) < 100:
             return "错误：提取的文本内容过短，可能不是有效的文章。"
         
-        return text
+        # 并行下载和缩放图片，占位符替换为图片标记
+        return media_utils.embed_images(text, images)
         
-    except requests.RequestException as e:
-        return f"错误：无法访问该URL。原因：{str(e)}"
     except Exception as e:
         return f"错误：提取文章内容失败。原因：{str(e)}"
 
+def image_placeholder(img, base_url, images):
+    """为网页中的图片返回占位符并记录图片地址；没有网页地址或图片明显是图标时返回空字符串"""
+    if base_url is None:
+        return ''
+    url = media_utils.image_url(img.attrs, base_url)
+    if not url:
+        return ''
+    images.append(url)
+    return f"\n\n{media_utils.placeholder(len(images) - 1)}\n\n"
+
+@profiled('split')
+@traced('split', bytes_in=lambda text, num_chunks: text_bytes(text),
+        bytes_out=lambda chunks: sum(text_bytes(c) for c in chunks or []))
 def recursive_split_text(text, num_chunks):
+    """按指定的块数分割文本；多个文档合并而成时按长度分配各文档的块数，文本块不跨越文档
+
+    文档数多于块数时，较短的相邻文档合并为一块，总块数不超过指定值。
+    """
+    sections = merge_sections(split_sections(text), num_chunks)
+    if len(sections) == 1:
+        return split_section(text, num_chunks)
+    chunks = []
+    for section, count in zip(sections, allocate_chunks([len(s) for s in sections], num_chunks)):
+        section_chunks = split_section(section, count)
+        if section_chunks is None:
+            return None
+        chunks.extend(section_chunks)
+    return chunks
+
+def split_section(text, num_chunks):
     """使用递归字符分割文本，基于指定的块数进行分割"""
     try:
         # 计算每个块的大致大小
@@ -255,6 +258,7 @@ def recursive_split_text(text, num_chunks):
         # 确保chunk_size不会太小
         chunk_size = max(chunk_size, 100)
 
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=0,
@@ -330,211 +334,304 @@ def recursive_split_text(text, num_chunks):
         st.error(f"递归分割失败：{str(e)}")
         return None
 
-def extract_content(text_block, api_key, base_url):
+# 已知不支持JSON模式（response_format）的API端点，之后直接使用普通文本输出
+_json_mode_unsupported = set()
+
+def make_llm(decision, api_key, base_url):
+    """按路由结果创建模型客户端，重试由调用闸门统一控制，关闭客户端自带的重试"""
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        openai_api_key=api_key,
+        openai_api_base=base_url,
+        temperature=decision.temperature,
+        model_name=decision.model,
+        max_retries=0
+    )
+
+# 端点池中各端点的模型客户端（不对冲时复用，保留连接池）
+_endpoint_llms = {}
+
+def retarget_llm(llm, endpoint, http_client=None):
+    """把按主端点创建的模型客户端改为指向端点池中的某个端点（保留绑定的参数，例如JSON模式）"""
+    from langchain_core.runnables import RunnableBinding
+    if isinstance(llm, RunnableBinding):
+        return retarget_llm(llm.bound, endpoint, http_client).bind(**llm.kwargs)
+    model_name = endpoint.model or llm.model_name
+    key = (endpoint.base_url, endpoint.api_key, model_name, llm.temperature)
+    if http_client is None and key in _endpoint_llms:
+        return _endpoint_llms[key]
+    from langchain_openai import ChatOpenAI
+    retargeted = ChatOpenAI(
+        openai_api_key=endpoint.api_key,
+        openai_api_base=endpoint.base_url,
+        temperature=llm.temperature,
+        model_name=model_name,
+        max_retries=0,
+        http_client=http_client,
+        http_async_client=endpoint_pool.shared_async_client()
+    )
+    if http_client is None:
+        _endpoint_llms[key] = retargeted
+    return retargeted
+
+def llm_concurrency(api_key, base_url):
+    """提炼线程数：配置了端点池时为各端点并发上限之和"""
+    pool = endpoint_pool.current_pool(base_url)
+    return pool.max_concurrency() if pool else get_gate(base_url, api_key).limiter.max_limit
+
+# 全局调度按每分钟token预算放行时，在输入估算之外为系统提示词和输出预留的token数
+REQUEST_TOKEN_OVERHEAD = 800
+
+def invoke_llm(llm, prompt, inputs, api_key, base_url, stage, bytes_in=0):
+    """通过调用闸门执行一次大模型请求并记录计时，返回输出文本"""
+    from langchain.chains import LLMChain
+    tokens = estimate_tokens(''.join(str(value) for value in inputs.values())) + REQUEST_TOKEN_OVERHEAD
+    pool = endpoint_pool.current_pool(base_url)
+    with llm_span(stage, bytes_in=bytes_in) as call_span:
+        if pool is None:
+            chain = LLMChain(llm=llm, prompt=prompt)
+            result = get_gate(base_url, api_key).call(chain.invoke, inputs, tokens=tokens)
+        else:
+            # 配置了备用端点时由端点池选择端点，失败时换端点，慢请求可对冲
+            def run(endpoint, http_client):
+                return LLMChain(llm=retarget_llm(llm, endpoint, http_client), prompt=prompt).invoke(inputs)
+            result = pool.call(run, stage, tokens=tokens)
+        call_span['bytes_out'] = text_bytes(result['text'])
+    return result['text']
+
+def extract_content(text_block, api_key, base_url, raise_errors=False, prompt_variant='full',
+                    json_mode=False, model_tiers=None):
     """使用大模型提炼文本内容并生成标题"""
     try:
-        llm = ChatOpenAI(
-            openai_api_key=api_key,
-            openai_api_base=base_url,
-            temperature=0.7,
-            model_name="gpt-3.5-turbo"
-        )
-
-        prompt_template = """##目标
-提取并总结输入内容的关键信息，形成层次分明的要点说明，同时生成一个简短的标题（不超过20个字）。
-
-##要求：
-（1）内容完整性：
-- 保持原文的主要内容和关键信息，在原文基础上适度精简
-- 保留重要的数据、案例和专业术语
-- 确保每个要点都有充分的解释和必要的上下文
-
-（2）层级结构：
-- 识别并保持原文的层级关系
-- 使用缩进表示不同层级（每个子层级缩进2个空格）
-- 保持原文的逻辑组织结构
-- 对并列关系、递进关系、因果关系等进行清晰的层级划分
-
-（3）格式规范：
-- 使用数字编号标识主要层级（1. 2. 3.）
-- 使用字母编号标识次级层级（a. b. c.）
-- 使用符号标识更深层级（- 或 •）
-- 每个层级的标题使用3-8个字的短语
-- 在标题后详细展开该层级的具体内容
-- 使用分号分隔复杂内容中的多个方面
-
-（4）表达方式：
-- 保持专业性和准确性
-- 使用清晰、简洁的语言
-- 避免过度概括和模糊表达
-- 保留原文的重要表述方式和专业用语
-
-##特别说明：
-即使原文已经包含分点内容，也必须重新组织和提炼，确保内容更加精炼和结构化。
-
-##输入
-{text_block}
-
-##输出格式
-标题：[简短的标题]
-
-内容：
-1. [一级标题]：
-  a. [二级要点]：[详细说明]
-    - [三级要点]：[具体内容]
-  b. [二级要点]：[详细说明]
-2. [一级标题]：
-  a. [二级要点]：[详细说明]
-    - [三级要点]：[具体内容]
-……
-
-注意：
-1. 严格遵守缩进规则，确保层级关系清晰
-2. 保持原文的重要细节和专业表述
-3. 适度精简但不过度概括
-4. 确保每个层级都有充分的说明和解释
-"""
-
-        prompt = PromptTemplate(
-            template=prompt_template,
-            input_variables=["text_block"]
-        )
+        # 图片标记只用于导出时定位图片，不发送给大模型
+        text_block = media_utils.strip_images(text_block)
+        # 按文本长度和结构密度选择模型档位
+        decision = route(text_block, 'extract', model_tiers)
+        with tier_span(decision):
+            return _extract_with_model(text_block, api_key, base_url, decision,
+                                       prompt_variant, json_mode, model_tiers)
+    except Exception as e:
+        if raise_errors:
+            raise
+        st.error(f"内容提炼失败：{str(e)}")
+        return None, None, False
 
-        chain = LLMChain(llm=llm, prompt=prompt)
-        result = chain.invoke({
-            "text_block": text_block
-        })
+def _extract_with_model(text_block, api_key, base_url, decision, prompt_variant, json_mode,
+                        model_tiers):
+    """使用选定的模型提炼一个文本块，返回 (内容, 标题, False)"""
+    llm = make_llm(decision, api_key, base_url)
 
-        # 解析结果，分离标题和内容
-        output_text = result['text']
-        title = ""
-        content = ""
-        
-        # 分离标题和内容
-        lines = output_text.split('\n')
-        for i, line in enumerate(lines):
-            if line.startswith('标题：'):
-                title = line.replace('标题：', '').strip()
-            elif line.startswith('内容：'):
-                content = '\n'.join(lines[i+1:]).strip()
-                break
+    # 固定规则作为系统前缀，文本块作为用户后缀，便于后端复用前缀缓存
+    use_json = json_mode and base_url not in _json_mode_unsupported
+    inputs = {"text_block": text_block}
+    try:
+        output_text = invoke_llm(
+            llm.bind(response_format={"type": "json_object"}) if use_json else llm,
+            extract_prompt(prompt_variant, use_json),
+            inputs, api_key, base_url, 'llm_extract', text_bytes(text_block)
+        )
+    except Exception as e:
+        if not (use_json and error_status(e) == 400 and 'response_format' in str(e)):
+            raise
+        # 后端不支持JSON模式时退回普通文本输出
+        _json_mode_unsupported.add(base_url)
+        output_text = invoke_llm(
+            llm, extract_prompt(prompt_variant), inputs,
+            api_key, base_url, 'llm_extract', text_bytes(text_block)
+        )
 
-        return content, title, False  # 返回提炼内容、标题和一个标志表示这不是分点内容
+    # 解析结果，分离标题和内容（兼容JSON、加粗、英文冒号等常见偏差）
+    title, content = parse_extraction(output_text)
 
-    except Exception as e:
-        st.error(f"内容提炼失败：{str(e)}")
-        return None, None, False
+    # 本地修复失败时，只针对该块重问一次格式，不重新发送原文；整理格式使用轻量档位
+    if not (title and content) and output_text.strip():
+        reask_llm = make_llm(route(output_text, 'reask', model_tiers), api_key, base_url)
+        repaired = invoke_llm(
+            reask_llm, reask_prompt(), {"previous_output": output_text},
+            api_key, base_url, 'llm_reask', text_bytes(output_text)
+        )
+        title, content = parse_extraction(repaired)
+
+    return content, title, False  # 返回提炼内容、标题和一个标志表示这不是分点内容
+
+# 提炼过程中回调进度的最长间隔（秒）
+PROGRESS_INTERVAL = 0.5
+
+def run_extraction(chunks, api_key, base_url, on_progress=None, prompt_variant='full',
+                   json_mode=False, model_tiers=None, speculation=None, deduplicate=True,
+                   on_result=None):
+    """并发提炼多个文本块，返回按原顺序排列的结果和失败的块序号
+
+    并发度由端点的自适应闸门控制；单个块在重试耗尽后记为失败，不影响其余块。
+    传入 speculation 时，内容和配置均未变化的块直接复用后台预提炼的任务。
+    相同或近似重复的块只提炼一次，复用代表块的结果。
+    on_result(序号, 结果) 在调用线程中随每个块完成回调，用于逐块替换草稿。
+    """
+    results = [None] * len(chunks)
+    errors = {}
+    done = 0
+    duplicates = find_duplicates(chunks) if deduplicate else {}
+
+    with ThreadPoolExecutor(max_workers=llm_concurrency(api_key, base_url)) as executor:
+        # 每个任务复制当前上下文，使工作线程中的计时记录归属到本会话
+        config = config_key(api_key, base_url, prompt_variant, json_mode, model_tiers)
+        futures = {}
+        reused = 0
+        for i, chunk in enumerate(chunks):
+            if i in duplicates:
+                continue
+            future = speculation.future_for(chunk, config) if speculation else None
+            # 内容完全相同的块各自提交，避免同一个任务对应多个序号
+            if future is None or future in futures:
+                future = executor.submit(copy_context().run, extract_content, chunk, api_key,
+                                         base_url, True, prompt_variant, json_mode, model_tiers)
+            else:
+                reused += 1
+            futures[future] = i
+        if speculation is not None:
+            metrics.record('speculative_reuse', 0.0, cache_hits=reused)
+        if duplicates:
+            metrics.record('dedupe', 0.0, cache_hits=len(duplicates))
+        # 定期回调进度（即使没有新完成的块），界面可借此刷新全局排队位置
+        pending = set(futures)
+        while pending:
+            finished, pending = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in finished:
+                i = futures[future]
+                try:
+                    content, title, _ = future.result()
+                    if content and title:
+                        results[i] = {
+                            'title': title,
+                            'content': content,
+                            'chunk_index': i
+                        }
+                        if on_result:
+                            on_result(i, results[i])
+                    else:
+                        errors[i] = "模型输出中没有找到标题或内容"
+                except Exception as e:
+                    errors[i] = str(e)
+                done += 1
+            if on_progress:
+                on_progress(done, len(futures))
+
+    for i, (source, _) in duplicates.items():
+        if results[source]:
+            results[i] = {**results[source], 'chunk_index': i}
+            if on_result:
+                on_result(i, results[i])
+        else:
+            errors[i] = errors.get(source, "重复块的代表块提炼失败")
+    return results, errors
+
+def reduce_content(children, api_key, base_url, model_tiers=None):
+    """层级汇总：把一组相邻的提炼结果归纳为一个章节，返回 (内容, 标题)"""
+    sections = hierarchical.format_children(children)
+    decision = route(sections, 'reduce', model_tiers)
+    with tier_span(decision):
+        output_text = invoke_llm(
+            make_llm(decision, api_key, base_url), reduce_prompt(), {"sections": sections},
+            api_key, base_url, 'llm_reduce', text_bytes(sections)
+        )
+    title, content = parse_extraction(output_text)
+    return content, title
+
+def run_hierarchical(chunks, api_key, base_url, on_progress=None, prompt_variant='full',
+                     json_mode=False, model_tiers=None, speculation=None,
+                     fan_out=hierarchical.FAN_OUT, max_depth=hierarchical.MAX_DEPTH,
+                     include_details=False, on_result=None):
+    """层级汇总：并行提炼全部文本块，再逐层归纳为章节，返回幻灯片列表、失败的块序号和归纳失败的组数"""
+    results, errors = run_extraction(chunks, api_key, base_url, on_progress, prompt_variant,
+                                     json_mode, model_tiers, speculation, on_result=on_result)
+    leaves = [item for item in results if item]
+    if not leaves:
+        return [], errors, 0
+
+    def reduce_fn(children):
+        return reduce_content(children, api_key, base_url, model_tiers)
+
+    sections, failed_groups = hierarchical.build_tree(
+        leaves, reduce_fn, fan_out, max_depth, llm_concurrency(api_key, base_url)
+    )
+    return hierarchical.deck_items(sections, include_details), errors, failed_groups
 
-def generate_main_title(extracted_contents):
+def generate_main_title(extracted_contents, api_key=None, base_url=None, model_tiers=None):
     """基于全文内容生成总标题"""
     try:
-        # 收集所有文本内容
+        api_key = api_key or st.session_state.get('api_key')
+        if not api_key or all(item.get('draft') for item in extracted_contents):
+            # 没有API密钥或全部为本地草稿时，总标题同样在本地生成
+            from extractive import draft_main_title
+            return draft_main_title(extracted_contents)
+        base_url = base_url or st.session_state['base_url']
+        model_tiers = model_tiers or st.session_state.get('model_tiers')
+
+        # 收集所有文本内容；层级汇总的详细页已由章节页概括，不再重复传入
         all_content = ""
         for item in extracted_contents:
+            if item.get('level') == 'detail':
+                continue
             all_content += item['title'] + "\n" + item['content'] + "\n\n"
 
-        # 使用LLM生成总标题
-        llm = ChatOpenAI(
-            openai_api_key=st.session_state['api_key'],
-            openai_api_base=st.session_state['base_url'],
-            temperature=0.7,
-            model_name="gpt-3.5-turbo"
-        )
-
-        prompt_template = """请基于以下文章内容，生成一个简短的总标题（不超过20个字）。标题应该：
-1. 准确概括文章的核心主题
-2. 使用简洁有力的语言
-3. 避免过于笼统的表述
-4. 突出文章的独特性和价值
-
-文章内容：
-{text}
-
-请直接输出标题，不要添加任何其他内容。"""
-
-        prompt = PromptTemplate(
-            template=prompt_template,
-            input_variables=["text"]
-        )
-
-        chain = LLMChain(llm=llm, prompt=prompt)
-        result = chain.invoke({
-            "text": all_content
-        })
+        # 使用LLM生成总标题，标题生成固定使用轻量档位
+        decision = route(all_content, 'title', model_tiers)
+        with tier_span(decision):
+            result_text = invoke_llm(
+                make_llm(decision, api_key, base_url), title_prompt(), {"text": all_content},
+                api_key, base_url, 'llm_title', text_bytes(all_content)
+            )
 
-        return result['text'].strip()
+        return result_text.strip()
     except Exception as e:
         st.error(f"生成总标题失败：{str(e)}")
         return "内容提炼报告"
 
-def create_ppt(extracted_contents):
-    """创建PPT文件"""
+def cached_main_title(extracted_contents):
+    """标题集合未变化时复用已生成（或从任务存储恢复）的总标题"""
+    from incremental_export import titles_hash
+    key = titles_hash(extracted_contents)
+    cached = st.session_state.get('main_title')
+    if cached and cached[0] == key:
+        return cached[1]
+    main_title = generate_main_title(extracted_contents)
+    st.session_state['main_title'] = (key, main_title)
+    if st.session_state.get('job_id'):
+        get_store().save_title(st.session_state['job_id'], key, main_title)
+    return main_title
+
+@profiled('create_ppt')
+@traced('render', bytes_out=os.path.getsize)
+def create_ppt(extracted_contents, export_cache=None):
+    """创建PPT文件，传入增量导出缓存时只重建内容变化的幻灯片"""
+    from pptx import Presentation
+    from pptx.util import Inches
+    from ppt_utils import SLIDE_WIDTH, SLIDE_HEIGHT, fill_cover_slide, fill_content_slide
+
+    if export_cache is not None:
+        ppt_data = export_cache.export(extracted_contents, cached_main_title)
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.pptx') as tmp:
+            tmp.write(ppt_data)
+            return tmp.name
+
     prs = Presentation()
     
     # 设置幻灯片尺寸为16:9
-    prs.slide_width = Inches(16)
-    prs.slide_height = Inches(9)
+    prs.slide_width = Inches(SLIDE_WIDTH)
+    prs.slide_height = Inches(SLIDE_HEIGHT)
 
     # 创建封面
     cover_slide = prs.slides.add_slide(prs.slide_layouts[0])
     
     # 生成总标题
-    main_title = generate_main_title(extracted_contents)
-    
-    # 设置主标题
-    title = cover_slide.shapes.title
-    title.text = main_title
-    title.text_frame.paragraphs[0].font.size = Pt(60)
-    title.text_frame.paragraphs[0].font.color.rgb = RGBColor(31, 118, 210)  # 使用蓝色
-    title.text_frame.paragraphs[0].alignment = PP_ALIGN.CENTER
-    
-    # 设置副标题
-    subtitle = cover_slide.placeholders[1]
-    subtitle.text = "内容提炼报告"
-    subtitle.text_frame.paragraphs[0].font.size = Pt(40)
-    subtitle.text_frame.paragraphs[0].font.color.rgb = RGBColor(31, 118, 210)  # 使用蓝色
-    subtitle.text_frame.paragraphs[0].alignment = PP_ALIGN.CENTER
+    main_title = cached_main_title(extracted_contents)
+    fill_cover_slide(cover_slide, main_title)
 
     # 为每个提炼内容创建幻灯片
     for item in extracted_contents:
         # 创建新的幻灯片（使用空白布局）
         slide = prs.slides.add_slide(prs.slide_layouts[6])  # 使用完全空白的布局
-        
-        # 添加标题
-        title_box = slide.shapes.add_textbox(Inches(1), Inches(0.5), Inches(14), Inches(1))
-        title_frame = title_box.text_frame
-        title_frame.text = item['title']
-        title_para = title_frame.paragraphs[0]
-        title_para.font.size = Pt(40)
-        title_para.font.color.rgb = RGBColor(31, 118, 210)  # 使用蓝色
-        title_para.font.bold = True
-        
-        # 添加内容
-        content_box = slide.shapes.add_textbox(Inches(1), Inches(1.5), Inches(14), Inches(6.5))
-        content_frame = content_box.text_frame
-        
-        # 解析并添加内容
-        lines = item['content'].split('\n')
-        for line in lines:
-            if line.strip():
-                p = content_frame.add_paragraph()
-                p.text = line.strip()
-                
-                # 设置字体格式
-                p.font.size = Pt(18)  # 统一使用18号字
-                p.line_spacing = 1.5  # 设置1.5倍行距
-                
-                if line.strip().startswith(('1.', '2.', '3.', '4.', '5.')):  # 一级标题
-                    p.font.bold = True
-                    p.font.size = Pt(28)  # 一级标题保持28号字
-                elif line.strip().startswith(('a.', 'b.', 'c.', 'd.')):  # 二级要点
-                    p.font.bold = True
-                    p.level = 1
-                elif line.strip().startswith(('-', '•')):  # 三级要点
-                    p.font.bold = True
-                    p.level = 2
-                else:  # 普通内容
-                    p.level = 3
+        fill_content_slide(slide, item['title'], item['content'], item.get('images'))
     
     # 保存PPT
     with tempfile.NamedTemporaryFile(delete=False, suffix='.pptx') as tmp:
@@ -546,22 +643,44 @@ def main():
     # 初始化session state
     if 'step' not in st.session_state:
         st.session_state['step'] = 1
-    if 'extracted_text' not in st.session_state:
-        st.session_state['extracted_text'] = None
-    if 'edited_text' not in st.session_state:
-        st.session_state['edited_text'] = None
+    if 'doc_store' not in st.session_state:
+        st.session_state['doc_store'] = DocumentStore()
     if 'is_editing' not in st.session_state:
         st.session_state['is_editing'] = False
-    if 'chunks' not in st.session_state:
-        st.session_state['chunks'] = None
-    if 'edited_chunks' not in st.session_state:
-        st.session_state['edited_chunks'] = []
     if 'extracted_contents' not in st.session_state:
         st.session_state['extracted_contents'] = []
     if 'api_key_confirmed' not in st.session_state:
         st.session_state['api_key_confirmed'] = False
     if 'block_operations' not in st.session_state:
         st.session_state['block_operations'] = {'insert_index': None}
+    if 'failed_chunks' not in st.session_state:
+        st.session_state['failed_chunks'] = {}
+    if 'speculation' not in st.session_state:
+        st.session_state['speculation'] = SpeculativeExtractor()
+    if 'timing_spans' not in st.session_state:
+        st.session_state['timing_spans'] = deque(maxlen=500)
+    if 'scheduler_user' not in st.session_state:
+        st.session_state['scheduler_user'] = new_job_id()
+
+    # 全局调度按会话公平排队，工作线程复制上下文后沿用同一用户标识
+    scheduler.bind_user(st.session_state['scheduler_user'])
+    # 配置了备用端点时，本会话的大模型请求经过端点池
+    endpoint_pool.bind_pool(llm_pool())
+
+    # 计时数据写入本会话，设置了PPT_METRICS_PORT时启动指标服务
+    metrics.bind_session(st.session_state['timing_spans'])
+    metrics.start_metrics_server()
+    show_timing_panel()
+
+    # 按链接中的任务编号恢复进度，并记录当前步骤
+    if 'job_id' not in st.session_state:
+        restore_job(st.query_params.get('job'))
+    persist('step', st.session_state['step'])
+    show_job_link()
+
+    # 转存空闲会话的文档，控制全部会话的文档内存
+    doc_store.enforce_limits(current=st.session_state['doc_store'])
+    show_memory_usage()
 
     # 设置页面标题和样式
     st.title("智能PPT生成器")
@@ -569,7 +688,8 @@ def main():
     # 显示当前步骤
     st.markdown(f"### 当前步骤：{st.session_state['step']}/3")
     
-    # 根据步骤显示不同的页面
+    # 根据步骤显示不同的页面，渲染前确保该步骤的依赖已导入
+    startup.ensure_step(st.session_state['step'])
     if st.session_state['step'] == 1:
         show_step1()
     elif st.session_state['step'] == 2:
@@ -577,6 +697,429 @@ def main():
     elif st.session_state['step'] == 3:
         show_step3()
 
+    startup.record_first_paint()
+    # 页面渲染完成后再在后台预热下一步骤的依赖，不与首次渲染争用CPU
+    startup.warm_up(st.session_state['step'])
+    if startup.PROFILE:
+        show_startup_profile()
+
+def show_startup_profile():
+    """在侧边栏显示本进程的首次渲染耗时和各模块导入耗时"""
+    with st.sidebar.expander("启动耗时", expanded=False):
+        seconds = startup.first_paint.get('seconds')
+        if seconds is not None:
+            st.caption(f"进程启动到首次渲染：{seconds:.2f} 秒")
+        st.dataframe([
+            {'模块': name, '导入耗时(秒)': round(value, 3)}
+            for name, value in sorted(startup.import_times.items(), key=lambda item: -item[1])
+        ], hide_index=True, use_container_width=True)
+
+def get_export_cache():
+    """返回本会话的增量导出缓存（首次导出时创建）"""
+    if 'export_cache' not in st.session_state:
+        from incremental_export import IncrementalExporter
+        st.session_state['export_cache'] = IncrementalExporter()
+    return st.session_state['export_cache']
+
+def with_images(extracted_contents):
+    """为每页附上对应原文块中标记的图片编号，用于导出和缩略图；目录页和章节页不附图片"""
+    store = st.session_state['doc_store']
+    chunk_count = len(store.edited_chunks)
+    items = []
+    for item in extracted_contents:
+        index = item.get('chunk_index')
+        images = []
+        if item.get('level') not in ('agenda', 'section') and index is not None and index < chunk_count:
+            images = media_utils.find_images(store.chunk(index))
+        items.append({**item, 'images': images} if images else item)
+    return items
+
+def draft_contents(chunks):
+    """本地抽取式草稿，文本块未变化时复用上次的结果"""
+    import hashlib
+    from extractive import draft_items
+    key = hashlib.sha256("\x00".join(chunks).encode('utf-8')).hexdigest()
+    cached = st.session_state.get('draft_contents')
+    if not cached or cached[0] != key:
+        with span('draft'):
+            cached = st.session_state['draft_contents'] = (key, draft_items(chunks))
+    return cached[1]
+
+def llm_pool():
+    """按API设置中的备用端点返回端点池，没有备用端点时返回None"""
+    extra = st.session_state.get('extra_endpoints')
+    if not (extra and st.session_state.get('api_key') and st.session_state.get('base_url')):
+        return None
+    return endpoint_pool.get_pool(st.session_state['base_url'], st.session_state['api_key'], extra,
+                                  st.session_state.get('hedge', endpoint_pool.HEDGE_DEFAULT))
+
+def show_endpoint_settings(api_key):
+    """备用端点设置和各端点状态"""
+    default_key = st.session_state.get('api_key') or api_key
+    # 环境变量中的端点含有运维人员的密钥，只在服务端合并，界面上只显示地址
+    try:
+        env_endpoints = endpoint_pool.parse_endpoints(endpoint_pool.DEFAULT_ENDPOINTS, default_key)
+    except ValueError as e:
+        env_endpoints = []
+        st.error(f"环境变量 PPT_LLM_ENDPOINTS 配置有误：{str(e)}")
+    if env_endpoints:
+        st.caption(f"来自环境变量的端点 {len(env_endpoints)} 个："
+                   + "、".join(base_url for base_url, _, _ in env_endpoints))
+
+    endpoints_text = st.text_area(
+        "备用API端点（可选）",
+        value=st.session_state.get('extra_endpoints_text', ''),
+        height=80,
+        help="每行一个：基础URL 密钥 [模型名]。密钥写 - 时使用上面的密钥；"
+             "自建端点的模型名称与模型路由中的设置不同时填写模型名。请求按各端点进行中的请求数分配，失败时换端点"
+    )
+    st.session_state['extra_endpoints_text'] = endpoints_text
+    try:
+        user_endpoints = endpoint_pool.parse_endpoints(endpoints_text, default_key)
+    except ValueError as e:
+        user_endpoints = []
+        st.error(f"备用端点配置有误：{str(e)}")
+    st.session_state['extra_endpoints'] = env_endpoints + [
+        endpoint for endpoint in user_endpoints if endpoint not in env_endpoints]
+    if not st.session_state['extra_endpoints']:
+        return
+
+    st.session_state['hedge'] = st.checkbox(
+        "对冲慢请求",
+        value=st.session_state.get('hedge', endpoint_pool.HEDGE_DEFAULT),
+        help="请求耗时超过近期p95时，向另一个端点发送相同请求，采用先返回的结果并取消另一个（对冲请求不超过总数的10%）"
+    )
+    pool = llm_pool()
+    endpoint_pool.bind_pool(pool)
+    if pool is None:
+        return
+    stats = pool.stats()
+    st.dataframe([
+        {
+            '端点': row['endpoint'],
+            '健康': row['healthy'],
+            '进行中': row['outstanding'],
+            '平均延迟(秒)': round(row['latency'], 2) if row['latency'] is not None else None,
+            '请求数': row['requests'],
+            '失败数': row['errors'],
+        }
+        for row in stats['endpoints']
+    ], hide_index=True, use_container_width=True)
+    if stats['hedges']:
+        st.caption(f"对冲请求 {stats['hedges']} 次，其中 {stats['hedge_wins']} 次对冲请求先返回")
+
+def queue_note():
+    """返回本会话在全局调度中的排队说明，没有排队时返回空字符串"""
+    sched = scheduler.get_scheduler()
+    if sched is None:
+        return ""
+    try:
+        status = sched.status(st.session_state['scheduler_user'])
+    except OSError:
+        return ""
+    if not status['waiting']:
+        return ""
+    return f"（全局排队中：前面还有 {status['position']} 个请求，本会话 {status['waiting']} 个请求等待中）"
+
+def hierarchical_options():
+    """返回本会话的层级汇总设置（首次使用时按默认值创建）"""
+    if 'hierarchical' not in st.session_state:
+        st.session_state['hierarchical'] = {
+            'enabled': False,
+            'fan_out': hierarchical.FAN_OUT,
+            'max_depth': hierarchical.MAX_DEPTH,
+            'include_details': False,
+        }
+    return st.session_state['hierarchical']
+
+def extraction_options():
+    """返回当前会话的提炼配置（API和提示词设置）"""
+    return {
+        'api_key': st.session_state.get('api_key'),
+        'base_url': st.session_state.get('base_url'),
+        'prompt_variant': st.session_state.get('prompt_variant', 'full'),
+        'json_mode': st.session_state.get('json_mode', False),
+        'model_tiers': st.session_state.get('model_tiers'),
+    }
+
+def show_batch_mode(chunks):
+    """批处理模式：把全部文本块作为一个批任务提交，轮询状态，完成后取回结果"""
+    job_id = st.session_state.get('job_id')
+    record = batch_jobs.load_record(job_id) if job_id else None
+    options = extraction_options()
+
+    with st.expander("批处理模式（离线）", expanded=record is not None):
+        st.caption("把全部文本块写成一个批任务提交，不受交互式限流影响，适合数千个文本块的夜间任务。"
+                   "提交后可以关闭页面，之后打开任务链接取回结果。")
+        if record is None:
+            backend_label = st.radio(
+                "批处理后端",
+                list(batch_jobs.BACKEND_LABELS.values()),
+                horizontal=True,
+                key="batch_backend",
+                help="本地模拟后端把请求逐个转发到上面设置的API，用于测试批处理流程"
+            )
+            backend_name = next(name for name, label in batch_jobs.BACKEND_LABELS.items() if label == backend_label)
+            if st.button("提交批处理任务", key="batch_submit"):
+                try:
+                    startup.ensure_step(3)
+                    backend = batch_jobs.get_backend(backend_name, options['api_key'], options['base_url'])
+                    record = batch_jobs.submit(
+                        chunks, backend, job_id,
+                        prompt_variant=options['prompt_variant'],
+                        json_mode=options['json_mode'],
+                        model_tiers=options['model_tiers']
+                    )
+                    st.success(f"已提交批任务 {record['batch_id']}，共 {record['requests']} 个请求")
+                except Exception as e:
+                    st.error(f"提交批处理任务失败：{str(e)}")
+            return
+
+        if record['chunks_key'] != batch_jobs.chunks_key(chunks):
+            st.warning("文本块在提交批任务之后有改动，取回的结果按提交时的文本块对应")
+        try:
+            backend = batch_jobs.get_backend(record['backend'], options['api_key'], options['base_url'])
+            status = backend.status(record['batch_id'])
+        except Exception as e:
+            st.error(f"查询批任务状态失败：{str(e)}")
+            status = None
+
+        if status:
+            label = batch_jobs.STATUS_LABELS.get(status['status'], status['status'])
+            st.caption(f"批任务 {record['batch_id']}：{label}，已完成 {status['completed']}/{status['total']}，"
+                       f"失败 {status['failed']}")
+            if status['total']:
+                st.progress(min(1.0, (status['completed'] + status['failed']) / status['total']))
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.button("刷新状态", key="batch_refresh")
+        with col2:
+            if status and status['status'] in batch_jobs.ACTIVE_STATUSES and st.button("取消批任务", key="batch_cancel"):
+                try:
+                    backend.cancel(record['batch_id'])
+                except Exception as e:
+                    st.error(f"取消批任务失败：{str(e)}")
+            # 进行中的批任务只能取消：只删除记录不会停止服务端处理和计费
+            elif (status is None or status['status'] in batch_jobs.FINAL_STATUSES) and st.button(
+                    "放弃该批任务", key="batch_discard",
+                    help="删除本任务的批任务记录；无法查询状态时，请确认服务端的批任务已结束或已取消"):
+                batch_jobs.clear_record(job_id)
+                st.rerun()
+        with col3:
+            if status and status['status'] in batch_jobs.FINAL_STATUSES and st.button("取回结果", key="batch_collect"):
+                try:
+                    results, errors = batch_jobs.collect(record, backend)
+                except Exception as e:
+                    st.error(f"取回批处理结果失败：{str(e)}")
+                    return
+                extracted_contents = [item for item in results if item]
+                if not extracted_contents:
+                    st.error("批任务没有可用的提炼结果")
+                    return
+                st.session_state['extracted_contents'] = extracted_contents
+                st.session_state['failed_chunks'] = errors
+                persist('results', extracted_contents)
+                batch_jobs.clear_record(job_id)
+                st.rerun()
+
+def start_speculation(chunks):
+    """API密钥已确认时，在后台提前提炼文本块"""
+    if not (st.session_state.get('api_key') and st.session_state.get('api_key_confirmed')):
+        return
+    # 后台任务会用到步骤3的依赖，先在界面线程中导入
+    startup.ensure_step(3)
+    try:
+        # 重复的块无需单独预提炼，步骤3会复用代表块的结果
+        st.session_state['speculation'].start(unique_chunks(chunks), extract_content, **extraction_options())
+    except Exception as e:
+        st.warning(f"后台预提炼启动失败：{str(e)}")
+
+def show_timing_panel():
+    """在侧边栏显示本会话各阶段的耗时、token和字节统计"""
+    spans = st.session_state['timing_spans']
+    with st.sidebar.expander("性能计时", expanded=False):
+        if not spans:
+            st.caption("暂无计时数据")
+            return
+
+        rows = []
+        for stage, stats in metrics.summarize(spans).items():
+            rows.append({
+                '阶段': stage,
+                '次数': stats['count'],
+                '总耗时(秒)': round(stats['seconds'], 3),
+                '输入token': stats['prompt_tokens'],
+                '输出token': stats['completion_tokens'],
+                '缓存命中': stats['cache_hits'],
+                '输入字节': stats['bytes_in'],
+                '输出字节': stats['bytes_out'],
+            })
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+
+        st.caption("最近10次调用")
+        st.dataframe([
+            {'阶段': entry['stage'], '耗时(秒)': round(entry['seconds'], 3), '失败': entry['error']}
+            for entry in list(spans)[-10:]
+        ], hide_index=True, use_container_width=True)
+
+        if st.button("清空计时数据", key="clear_timing"):
+            spans.clear()
+            st.rerun()
+
+def show_memory_usage():
+    """在侧边栏显示本会话和全部会话的文档内存占用"""
+    stats = st.session_state['doc_store'].stats()
+    st.sidebar.caption(
+        f"文档内存：本会话 {stats['resident_bytes'] / 1024:.1f} KB，"
+        f"全部会话 {doc_store.total_memory_bytes() / 1024:.1f} KB"
+    )
+
+def persist(kind, *args):
+    """把当前任务的一部分状态交给后台批量写入，写入失败不影响界面"""
+    job_id = st.session_state.get('job_id')
+    if not job_id:
+        return
+    try:
+        getattr(get_store(), f"save_{kind}")(job_id, *args)
+    except Exception as e:
+        st.warning(f"保存任务进度失败：{str(e)}")
+
+def persist_document():
+    store = st.session_state['doc_store']
+    edited_text = store.edited_text
+    persist('document', store.extracted_text,
+            None if edited_text == store.extracted_text else edited_text)
+
+def start_new_job():
+    """分配新的任务编号并写入链接"""
+    st.session_state['job_id'] = new_job_id()
+    st.query_params['job'] = st.session_state['job_id']
+
+def restore_job(job_id):
+    """从任务存储恢复文档、分割结果、提炼结果和总标题，不调用大模型"""
+    state = None
+    if job_id:
+        try:
+            with span('restore_job'):
+                state = get_store().load_job(job_id)
+        except Exception as e:
+            st.warning(f"恢复任务失败：{str(e)}")
+    if not state:
+        start_new_job()
+        return
+
+    st.session_state['job_id'] = job_id
+    store = st.session_state['doc_store']
+    store.load(state['source_text'])
+    if state['edited_text'] is not None:
+        store.edited_text = state['edited_text']
+    if state['chunks']:
+        store.set_chunks(state['chunks'])
+    st.session_state['extracted_contents'] = state['extracted_contents']
+    if state['main_title']:
+        st.session_state['main_title'] = (state['titles_key'], state['main_title'])
+    if any(item.get('level') for item in state['extracted_contents']):
+        # 层级汇总的结果只包含各章节的首块序号，不按文本块计算失败；恢复层级汇总设置，不提供逐块重试
+        hierarchical_options()['enabled'] = True
+    elif state['extracted_contents']:
+        # 没有提炼结果的文本块记为失败，可在步骤3重试
+        done = {item['chunk_index'] for item in state['extracted_contents']}
+        st.session_state['failed_chunks'] = {
+            i: "恢复的任务中没有该文本块的提炼结果"
+            for i in range(len(state['chunks'])) if i not in done
+        }
+    st.session_state['step'] = state['step']
+    st.toast(f"已恢复任务 {job_id}")
+
+def show_job_link():
+    """在侧边栏显示任务编号，重新打开带该编号的链接即可恢复进度"""
+    st.sidebar.caption(f"任务编号：{st.session_state['job_id']}")
+    st.sidebar.caption(f"恢复链接：?job={st.session_state['job_id']}")
+
+def load_document(text):
+    """把提取的文章载入会话文档存储"""
+    try:
+        st.session_state['doc_store'].load(text)
+        persist_document()
+    except DocumentTooLarge as e:
+        st.error(f"错误：{str(e)}，请拆分后分别处理")
+
+def show_large_document_mode(uploaded_files):
+    """大文档模式：流式读取、分块、提炼，并逐页生成幻灯片"""
+    from streaming_pipeline import CHUNK_SIZE, StreamingDeck, open_streams, run_pipeline
+    from slide_preview import render_thumbnails
+
+    if not (st.session_state.get('api_key') and st.session_state.get('api_key_confirmed')):
+        base_url = st.text_input("API基础URL", value=st.session_state.get('base_url', "https://api.gpt.ge/v1/"),
+                                 key="stream_base_url")
+        api_key = st.text_input("API密钥", type="password", value=st.session_state.get('api_key', ''),
+                                key="stream_api_key")
+    else:
+        base_url, api_key = st.session_state['base_url'], st.session_state['api_key']
+    chunk_size = st.slider("每个文本块的字数", min_value=500, max_value=5000, value=CHUNK_SIZE, step=100)
+
+    result = st.session_state.get('stream_result')
+    if uploaded_files and api_key and st.button("流式生成PPT"):
+        st.session_state['api_key'] = api_key
+        st.session_state['base_url'] = base_url
+        st.session_state['api_key_confirmed'] = True
+        options = extraction_options()
+        startup.ensure_step(3)
+
+        def extract(chunk):
+            return extract_content(chunk, api_key, base_url, True, options['prompt_variant'],
+                                   options['json_mode'], options['model_tiers'])
+
+        # 结果随生成写入会话，页面中途重新运行时已完成的部分不会丢失
+        result = st.session_state['stream_result'] = {'items': [], 'failed': 0, 'data': None}
+        deck = StreamingDeck()
+        status = st.empty()
+        gallery = st.container()
+        shown = 0
+        try:
+            for event in run_pipeline(open_streams(uploaded_files), extract, chunk_size,
+                                      llm_concurrency(api_key, base_url)):
+                if event['item'] is None:
+                    result['failed'] += 1
+                else:
+                    deck.add(event['item'])
+                    result['items'].append(event['item'])
+                status.text(f"已处理 {event['index'] + 1} 个文本块，生成 {len(deck.items)} 页，"
+                            f"失败 {result['failed']} 个，用时 {event['elapsed']:.1f} 秒" + queue_note())
+                # 定期显示新增幻灯片的缩略图
+                if deck.refresh_due():
+                    deck.mark_refreshed()
+                    with gallery:
+                        for path in render_thumbnails(deck.items[shown:]):
+                            st.image(path, use_column_width=True)
+                    shown = len(deck.items)
+            if deck.items:
+                result['data'] = deck.finish(generate_main_title)
+        except Exception as e:
+            st.error(f"大文档处理失败：{str(e)}")
+        status.empty()
+
+    if result and result['items']:
+        st.success(f"已生成 {len(result['items'])} 页幻灯片" +
+                   (f"，{result['failed']} 个文本块提炼失败" if result['failed'] else ""))
+        if result['data'] is None and st.button("导出已完成的部分"):
+            with st.spinner("正在生成PPT..."):
+                deck = StreamingDeck()
+                for item in result['items']:
+                    deck.add(item)
+                result['data'] = deck.finish(generate_main_title)
+        if result['data'] is not None:
+            st.download_button(
+                label="下载PPT文件",
+                data=result['data'],
+                file_name="content_summary.pptx",
+                mime="application/vnd.openxmlformats-officedocument.presentationml.presentation"
+            )
+        for i, item in enumerate(result['items']):
+            with st.expander(f"第 {i + 1} 页：{item['title']}"):
+                st.markdown(item['content'])
+
 def show_step1():
     """显示第一步：文件上传和内容提取"""
     st.markdown('<div class="step-box">', unsafe_allow_html=True)
@@ -586,7 +1129,9 @@ def show_step1():
 
     **提示：**
     - 支持的文件格式：.docx, .txt
+    - 可同时上传多个文件，合并为一份文档，分割时每个文本块只来自一个文件
     - 支持直接输入URL地址
+    - DOCX和网页中的图片会保留，导出时放在对应内容的幻灯片上
     - 文件大小限制：10MB
     """, unsafe_allow_html=True)
     st.markdown('</div>', unsafe_allow_html=True)
@@ -600,35 +1145,49 @@ def show_step1():
 
     if input_method == "上传文件":
         # 文档上传部分
-        uploaded_file = st.file_uploader(
+        uploaded_files = st.file_uploader(
             "上传文档",
             type=['txt', 'docx'],
-            help="支持的文件格式：TXT、DOCX"
+            accept_multiple_files=True,
+            help="支持的文件格式：TXT、DOCX；可同时上传多个文件，按上传顺序合并为一份文档"
         )
 
-        if uploaded_file:
+        # 大文档模式：读取、分块、提炼和生成幻灯片流水线式进行，不经过步骤2和步骤3
+        large_mode = st.checkbox(
+            "大文档模式（流式处理）",
+            help="适用于书籍等超长文档：边读取边分块提炼，幻灯片随结果逐页生成，内存占用与文档长度无关"
+        )
+        if large_mode:
+            show_large_document_mode(uploaded_files)
+            return
+
+        if uploaded_files:
             if st.button("提取文章"):
                 with st.spinner('正在提取文章内容...'):
-                    if uploaded_file.name.endswith('.txt'):
-                        text = extract_text_from_txt(uploaded_file)
-                    elif uploaded_file.name.endswith('.docx'):
-                        text = extract_text_from_docx(uploaded_file)
+                    # 多个文件在进程池中并行解析，结果保持上传顺序
+                    texts = parse_files([(file.name, file.getvalue()) for file in uploaded_files])
+                    if len(uploaded_files) == 1:
+                        load_document(texts[0])
                     else:
-                        text = "错误：不支持的文件格式"
-
-                    st.session_state['extracted_text'] = text
-                    st.session_state['edited_text'] = text
+                        documents = []
+                        for file, text in zip(uploaded_files, texts):
+                            if text.startswith("错误："):
+                                st.error(f"{file.name}：{text}")
+                            else:
+                                documents.append((file.name, text))
+                        if documents:
+                            load_document(combine_documents(documents))
 
     else:  # 输入URL
         url = st.text_input("输入文章URL", help="请输入包含文章的网页地址")
         if url and st.button("提取文章"):
             with st.spinner('正在从URL提取文章内容...'):
                 text = extract_article_from_url(url)
-                st.session_state['extracted_text'] = text
-                st.session_state['edited_text'] = text
+                load_document(text)
 
     # 显示提取的文章内容
-    if st.session_state['extracted_text']:
+    store = st.session_state['doc_store']
+    if store.extracted_text:
         st.write("### 文章内容")
         
         # 如果正在编辑
@@ -636,7 +1195,7 @@ def show_step1():
             # 创建文本编辑器
             edited_text = st.text_area(
                 "编辑文章内容",
-                value=st.session_state['edited_text'],
+                value=store.edited_text,
                 height=400
             )
             
@@ -648,17 +1207,23 @@ def show_step1():
             col1, col2 = st.columns(2)
             with col1:
                 if st.button("保存修改"):
-                    st.session_state['edited_text'] = edited_text
+                    store.edited_text = edited_text
+                    persist_document()
                     st.session_state['is_editing'] = False
                     st.rerun()
             with col2:
                 if st.button("取消修改"):
                     st.session_state['is_editing'] = False
-                    st.session_state['edited_text'] = st.session_state['extracted_text']
+                    store.revert()
+                    persist_document()
                     st.rerun()
         else:
             # 显示文章内容
-            st.markdown(f"<div class='article-display'>{st.session_state['edited_text']}</div>", unsafe_allow_html=True)
+            st.markdown(f"<div class='article-display'>{store.edited_text}</div>", unsafe_allow_html=True)
+            images = media_utils.find_images(store.edited_text)
+            if images:
+                st.caption(f"文中包含 {len(images)} 张图片，以“【图片：编号】”标记位置；"
+                           "编辑时删除或移动标记即可去掉图片或调整图片所在的页面")
             
             # 编辑按钮
             col1, col2 = st.columns(2)
@@ -691,28 +1256,53 @@ def show_step2():
     """, unsafe_allow_html=True)
     st.markdown('</div>', unsafe_allow_html=True)
 
-    # 分割参数设置
-    num_chunks = st.slider(
-        "分割块数",
-        min_value=2,
-        max_value=20,
-        value=5,
-        step=1,
-        help="将文章分割成几个部分"
+    store = st.session_state['doc_store']
+    options = hierarchical_options()
+
+    # 层级汇总模式：长文档切成大量小文本块，提炼后再归纳为章节
+    options['enabled'] = st.checkbox(
+        "层级汇总模式（长文档）",
+        value=options['enabled'],
+        help="把长文档切成大量小文本块并行提炼，再逐层归纳为章节页，并生成目录页"
     )
 
+    # 分割参数设置
+    if options['enabled']:
+        chunk_size = st.slider(
+            "每个文本块的字数",
+            min_value=500,
+            max_value=3000,
+            value=hierarchical.LEAF_CHUNK_SIZE,
+            step=100,
+            help="文本块越小，单次请求越快，归纳层数可能增加"
+        )
+        num_chunks = hierarchical.leaf_count(len(store.edited_text or ''), chunk_size)
+        st.caption(f"将分割为约 {num_chunks} 个文本块（上限 {hierarchical.MAX_CHUNKS} 个）")
+    else:
+        num_chunks = st.slider(
+            "分割块数",
+            min_value=2,
+            max_value=20,
+            value=5,
+            step=1,
+            help="将文章分割成几个部分"
+        )
+
     if st.button("应用分割", key="split_button"):
         with st.spinner('正在进行文本分割...'):
             chunks = recursive_split_text(
-                st.session_state['edited_text'],
+                store.edited_text,
                 num_chunks
             )
             if chunks:
-                st.session_state['chunks'] = chunks
-                st.session_state['edited_chunks'] = chunks.copy()
+                # 文本块以原文片段保存，不再另存一份全文
+                store.set_chunks(chunks)
+                persist('chunks', chunks)
+                # 用户整理文本块期间，后台先行提炼
+                start_speculation(chunks)
 
     # 显示分割结果
-    if st.session_state['chunks']:
+    if store.has_chunks:
         st.write("### 分割预览")
         
         # 使用容器增加宽度
@@ -725,13 +1315,14 @@ def show_step2():
             # 处理插入操作
             if st.session_state['block_operations']['insert_index'] is not None:
                 idx = st.session_state['block_operations']['insert_index']
-                if 0 <= idx <= len(st.session_state['edited_chunks']):
-                    st.session_state['edited_chunks'].insert(idx, "在这里输入新的内容...")
+                if 0 <= idx <= len(store.edited_chunks):
+                    store.edited_chunks.insert(idx, "在这里输入新的内容...")
                     st.session_state['block_operations']['insert_index'] = None
                     st.rerun()
 
-            # 显示所有块
-            for i, chunk in enumerate(st.session_state['edited_chunks']):
+            # 显示所有块；重复提示在全部块更新后再填入对应位置
+            duplicate_notes = []
+            for i, chunk in enumerate(store.edited_chunks):
                 st.markdown(f"#### 第 {i+1} 部分")
                 
                 # 计算所需的高度：每行25像素，额外加50像素作为缓冲
@@ -745,15 +1336,16 @@ def show_step2():
                     height=height,
                     key=f"chunk_{i}"
                 )
-                st.session_state['edited_chunks'][i] = edited_text
+                store.edited_chunks[i] = edited_text
+                duplicate_notes.append(st.empty())
 
                 # 操作按钮行
                 col1, col2 = st.columns([1, 9])
                 with col1:
                     # 删除按钮
-                    if len(st.session_state['edited_chunks']) > 1:  # 保持至少一个块
+                    if len(store.edited_chunks) > 1:  # 保持至少一个块
                         if st.button("🗑️", key=f"delete_{i}", help="删除此块"):
-                            st.session_state['edited_chunks'].pop(i)
+                            store.edited_chunks.pop(i)
                             st.rerun()
 
                 # 在每个块之后添加"新增文章块"按钮
@@ -763,22 +1355,62 @@ def show_step2():
 
                 st.markdown("---")
 
+            # 标记重复的文本块（网页中反复出现的免责声明、作者简介、导航等）
+            duplicates = find_duplicates(list(store.edited_chunks))
+            for i, (source, score) in duplicates.items():
+                duplicate_notes[i].info(
+                    f"与第 {source + 1} 部分重复（相似度 {score:.0%}），提炼时将直接复用第 {source + 1} 部分的结果"
+                )
+            if duplicates:
+                col1, col2 = st.columns([4, 1])
+                with col1:
+                    st.caption(f"发现 {len(duplicates)} 个重复的文本块，提炼时只处理一次；也可以直接删除重复块")
+                with col2:
+                    if st.button("删除重复块", key="collapse_duplicates"):
+                        for i in sorted(duplicates, reverse=True):
+                            del store.edited_chunks[i]
+                        st.rerun()
+
+            # 保存当前的文本块（后台合并写入）
+            persist('chunks', list(store.edited_chunks))
+
             # 在末尾添加"新增文章块"按钮
             if st.button("在末尾添加新块 ⬇", key="insert_end"):
-                st.session_state['block_operations']['insert_index'] = len(st.session_state['edited_chunks'])
+                st.session_state['block_operations']['insert_index'] = len(store.edited_chunks)
                 st.rerun()
 
+        # 后台预提炼进度
+        if st.session_state.get('api_key_confirmed'):
+            options = extraction_options()
+            done, total = st.session_state['speculation'].progress(
+                unique_chunks(store.edited_chunks),
+                config_key(options['api_key'], options['base_url'], options['prompt_variant'],
+                           options['json_mode'], options['model_tiers'])
+            )
+            if total:
+                col1, col2 = st.columns([4, 1])
+                with col1:
+                    st.caption(f"后台预提炼：已完成 {done}/{total} 个文本块，修改过的文本块将在下一步重新提炼")
+                with col2:
+                    if st.button("取消预提炼", key="cancel_speculation"):
+                        st.session_state['speculation'].cancel()
+                        st.rerun()
+
         # 操作按钮
         col1, col2 = st.columns(2)
         with col1:
             if st.button("返回上一步"):
                 st.session_state['step'] = 1
-                st.session_state['chunks'] = None
-                st.session_state['edited_chunks'] = []
+                store.clear_chunks()
+                persist('chunks', [])
+                st.session_state['speculation'].cancel()
                 st.rerun()
         
         with col2:
             if st.button("确认分割并进入下一步"):
+                # 丢弃已修改块的旧结果，并为修改后的块提前开始提炼
+                start_speculation(list(store.edited_chunks))
+                persist('chunks', list(store.edited_chunks))
                 st.session_state['step'] = 3
                 st.rerun()
 
@@ -797,7 +1429,7 @@ def show_step3():
     st.markdown('</div>', unsafe_allow_html=True)
 
     # 检查是否有文本块需要处理
-    if not st.session_state.get('edited_chunks'):
+    if not st.session_state['doc_store'].edited_chunks:
         st.warning("没有找到需要处理的文本块，请返回上一步添加内容。")
         if st.button("返回上一步"):
             st.session_state['step'] = 2
@@ -842,52 +1474,195 @@ def show_step3():
             else:
                 st.success("API密钥已确认，可以开始内容提炼")
 
-    # 内容提炼部分
-    if st.session_state.get('api_key') and st.session_state.get('api_key_confirmed', False):
-        if not st.session_state.get('extracted_contents'):
-            if st.button("开始内容提炼"):
+        # 精简提示词可减少每个文本块的输入token
+        token_counts = prompt_token_savings()
+        use_compact = st.checkbox(
+            "使用精简提示词",
+            value=st.session_state.get('prompt_variant') == 'compact',
+            help=f"完整提示词约 {token_counts['full']} 个token，精简提示词约 {token_counts['compact']} 个token（每个文本块）"
+        )
+        st.session_state['prompt_variant'] = 'compact' if use_compact else 'full'
+
+        # JSON模式：后端支持时要求模型输出JSON，不支持时自动退回文本格式
+        st.session_state['json_mode'] = st.checkbox(
+            "结构化输出（JSON模式）",
+            value=st.session_state.get('json_mode', False),
+            help="要求模型以JSON返回标题和内容，减少因格式偏差导致的提炼失败"
+        )
+
+        # 多端点：主端点之外的备用端点，慢请求可对冲到其他端点
+        show_endpoint_settings(api_key)
+
+    # 模型路由：按文本块长度和结构密度选择档位，总标题和格式重问使用轻量档位
+    with st.expander("模型路由"):
+        tiers = st.session_state.get('model_tiers') or load_tiers()
+        st.session_state['model_tiers'] = {
+            tier: st.text_input(label, value=tiers[tier], key=f"model_tier_{tier}").strip() or tiers[tier]
+            for tier, label in TIER_LABELS.items()
+        }
+
+    # 层级汇总：每组归纳的结果数和最大归纳层数
+    hier = hierarchical_options()
+    if hier['enabled']:
+        with st.expander("层级汇总", expanded=True):
+            hier['fan_out'] = st.slider("每组归纳的文本块数", min_value=2, max_value=20,
+                                        value=hier['fan_out'], step=1,
+                                        help="每个章节页由多少个相邻结果归纳而成")
+            hier['max_depth'] = st.slider("最大归纳层数", min_value=1, max_value=4,
+                                          value=hier['max_depth'], step=1,
+                                          help="总耗时约为一轮提炼加上每层一轮归纳")
+            hier['include_details'] = st.checkbox("在章节页之后附上各文本块的详细页",
+                                                  value=hier['include_details'])
+
+    # 内容提炼部分；恢复的任务已有提炼结果时，无需API密钥即可预览和导出
+    api_ready = bool(st.session_state.get('api_key') and st.session_state.get('api_key_confirmed', False))
+    extracted = st.session_state.get('extracted_contents')
+    drafts_only = bool(extracted) and all(item.get('draft') for item in extracted)
+
+    # 没有API密钥时，可以直接使用本地抽取式草稿预览和导出
+    if not api_ready and not extracted:
+        st.info("尚未确认API密钥。可以先使用本地生成的草稿（抽取原文要点，无需调用大模型）预览和导出，确认密钥后再用大模型提炼替换。")
+        if st.button("使用本地草稿"):
+            drafts = draft_contents(list(st.session_state['doc_store'].edited_chunks))
+            st.session_state['extracted_contents'] = [dict(item) for item in drafts]
+            persist('results', st.session_state['extracted_contents'])
+            st.rerun()
+
+    if api_ready or extracted:
+        if not extracted or (drafts_only and api_ready):
+            # 后台预提炼已全部完成时直接采用，无需再次点击
+            chunks = list(st.session_state['doc_store'].edited_chunks)
+            unique = unique_chunks(chunks)
+            options = extraction_options()
+            done, total = st.session_state['speculation'].progress(
+                unique,
+                config_key(options['api_key'], options['base_url'], options['prompt_variant'],
+                           options['json_mode'], options['model_tiers'])
+            )
+            speculation_ready = total == len(unique) and done == total
+            if total and not speculation_ready:
+                st.caption(f"后台已预提炼 {done}/{len(unique)} 个文本块，其余文本块将在开始后提炼")
+
+            # 批处理模式：整批离线提交，完成后取回结果
+            if not hier['enabled']:
+                show_batch_mode(chunks)
+
+            start_label = "用大模型提炼替换草稿" if drafts_only else "开始内容提炼"
+            if (speculation_ready and not drafts_only) or st.button(start_label):
                 progress_bar = st.progress(0)
                 status_text = st.empty()
 
-                # 存储提炼结果
-                extracted_contents = []
-                total_chunks = len(st.session_state['edited_chunks'])
-
-                for i, chunk in enumerate(st.session_state['edited_chunks']):
-                    status_text.text(f"正在处理第 {i+1}/{total_chunks} 个文本块...")
-                    progress_bar.progress((i + 1) / total_chunks)
+                def on_progress(done, total):
+                    status_text.text(f"已完成 {done}/{total} 个文本块..." + queue_note())
+                    progress_bar.progress(done / total)
+
+                # 先显示本地草稿，大模型结果到达后逐块替换
+                st.write("### 草稿预览")
+                slots = []
+                for i, draft in enumerate(draft_contents(chunks)):
+                    slots.append(st.empty())
+                    slots[i].markdown(f"**第 {i+1} 部分（草稿）：{draft['title']}**\n\n{draft['content']}")
+
+                # 每个块完成后立即保存，中途重启时已完成的结果不会丢失，恢复后其余块可重试
+                partial = {}
+
+                def on_result(i, item):
+                    slots[i].markdown(f"**第 {i+1} 部分 ✅ {item['title']}**\n\n{item['content']}")
+                    partial[i] = item
+                    persist('results', [partial[index] for index in sorted(partial)])
+
+                if hier['enabled']:
+                    # 提炼完成后逐层归纳为章节页，并生成目录页
+                    extracted_contents, errors, failed_groups = run_hierarchical(
+                        chunks,
+                        st.session_state['api_key'],
+                        st.session_state['base_url'],
+                        on_progress,
+                        prompt_variant=st.session_state['prompt_variant'],
+                        json_mode=st.session_state['json_mode'],
+                        model_tiers=st.session_state['model_tiers'],
+                        speculation=st.session_state['speculation'],
+                        fan_out=hier['fan_out'],
+                        max_depth=hier['max_depth'],
+                        include_details=hier['include_details'],
+                        on_result=on_result
+                    )
+                    if failed_groups:
+                        st.session_state['hierarchical_failed_groups'] = failed_groups
+                else:
+                    results, errors = run_extraction(
+                        chunks,
+                        st.session_state['api_key'],
+                        st.session_state['base_url'],
+                        on_progress,
+                        prompt_variant=st.session_state['prompt_variant'],
+                        json_mode=st.session_state['json_mode'],
+                        model_tiers=st.session_state['model_tiers'],
+                        speculation=st.session_state['speculation'],
+                        on_result=on_result
+                    )
+                    extracted_contents = [item for item in results if item]
 
-                    try:
-                        content, title, is_points = extract_content(
-                            chunk,
-                            st.session_state['api_key'],
-                            st.session_state['base_url']
-                        )
-                        
-                        if content and title:
-                            extracted_contents.append({
-                                'title': title,
-                                'content': content,
-                                'original': chunk
-                            })
-                    except Exception as e:
-                        st.error(f"处理文本块时发生错误：{str(e)}")
-                        break
+                # 存储提炼结果
+                st.session_state['failed_chunks'] = errors
 
                 if extracted_contents:
                     st.session_state['extracted_contents'] = extracted_contents
+                    persist('results', extracted_contents)
                     status_text.empty()
                     progress_bar.empty()
                     st.rerun()
                 else:
                     st.error("内容提炼失败，请检查API密钥是否正确或重试")
 
+        # 重试失败的文本块，已完成的结果保持不变
+        failed_chunks = st.session_state.get('failed_chunks') or {}
+        if st.session_state.get('extracted_contents') and failed_chunks:
+            st.warning(
+                f"有 {len(failed_chunks)} 个文本块提炼失败（第 "
+                + "、".join(str(i + 1) for i in sorted(failed_chunks))
+                + " 部分），其余结果已保留。"
+            )
+            if hier['enabled']:
+                # 章节页已按成功的结果归纳，单独补上失败的块会打乱目录结构
+                st.info("层级汇总模式下，失败的文本块未计入章节；如需包含，请返回上一步后重新提炼")
+            elif not api_ready:
+                st.info("确认API密钥后可以重试失败的文本块")
+            elif st.button("重试失败的文本块"):
+                with st.spinner("正在重试失败的文本块..."):
+                    chunks = list(st.session_state['doc_store'].edited_chunks)
+                    indices = [i for i in sorted(failed_chunks) if i < len(chunks)]
+                    results, errors = run_extraction(
+                        [chunks[i] for i in indices],
+                        st.session_state['api_key'],
+                        st.session_state['base_url'],
+                        prompt_variant=st.session_state['prompt_variant'],
+                        json_mode=st.session_state['json_mode'],
+                        model_tiers=st.session_state['model_tiers']
+                    )
+                    merged = list(st.session_state['extracted_contents'])
+                    for i, item in zip(indices, results):
+                        if item:
+                            item['chunk_index'] = i
+                            merged.append(item)
+                    merged.sort(key=lambda item: item.get('chunk_index', 0))
+                    st.session_state['extracted_contents'] = merged
+                    persist('results', merged)
+                    st.session_state['failed_chunks'] = {
+                        indices[j]: error for j, error in errors.items()
+                    }
+                    st.rerun()
+
+        failed_groups = st.session_state.pop('hierarchical_failed_groups', 0)
+        if failed_groups:
+            st.warning(f"有 {failed_groups} 组结果归纳失败，对应章节页改为列出各部分标题，可在下方编辑")
+
         # 显示提炼结果
         if st.session_state.get('extracted_contents'):
             st.write("### 内容提炼预览")
             
             for i, item in enumerate(st.session_state['extracted_contents']):
-                st.markdown(f"#### 第 {i+1} 部分：{item['title']}")
+                st.markdown(f"#### 第 {i+1} 部分{'（草稿）' if item.get('draft') else ''}：{item['title']}")
                 
                 # 使用列布局创建左右对照
                 col1, col2 = st.columns(2)
@@ -895,7 +1670,16 @@ def show_step3():
                 with col1:
                     st.markdown('<div class="comparison-box">', unsafe_allow_html=True)
                     st.markdown('<div class="content-title">原文内容</div>', unsafe_allow_html=True)
-                    st.markdown(f"<div class='article-display' style='height: 400px; overflow-y: auto;'>{item['original']}</div>", unsafe_allow_html=True)
+                    if item.get('level') in ('agenda', 'section'):
+                        # 目录页和章节页由多个文本块归纳而成，不对应单个原文块
+                        first, last = item.get('chunk_range') or (0, len(st.session_state['doc_store'].edited_chunks) - 1)
+                        source = f"由第 {first + 1}–{last + 1} 部分归纳"
+                    else:
+                        source = st.session_state['doc_store'].chunk(item['chunk_index'])
+                    st.markdown(f"<div class='article-display' style='height: 400px; overflow-y: auto;'>{source}</div>", unsafe_allow_html=True)
+                    images = media_utils.find_images(source)
+                    if images:
+                        st.image([media_utils.image_path(image_id) for image_id in images], width=160)
                     st.markdown('</div>', unsafe_allow_html=True)
                 
                 with col2:
@@ -903,15 +1687,46 @@ def show_step3():
                     st.markdown('<div class="content-title">提炼结果</div>', unsafe_allow_html=True)
                     st.markdown(f"<div class='article-display' style='height: 400px; overflow-y: auto;'>{item['content']}</div>", unsafe_allow_html=True)
                     st.markdown('</div>', unsafe_allow_html=True)
+
+                    # 编辑本页的标题和内容
+                    with st.expander("编辑本页", expanded=False):
+                        item['title'] = st.text_input(
+                            "标题",
+                            value=item['title'],
+                            key=f"edit_title_{i}"
+                        )
+                        item['content'] = st.text_area(
+                            "内容",
+                            value=item['content'],
+                            height=300,
+                            key=f"edit_content_{i}"
+                        )
                 
                 st.markdown("---")
 
+            # 保存编辑后的提炼结果（后台合并写入）
+            persist('results', st.session_state['extracted_contents'])
+
+            # 幻灯片缩略图预览，与导出版式一致
+            with st.expander("PPT缩略图预览", expanded=False):
+                from ppt_utils import preview_ppt_in_streamlit
+                preview_ppt_in_streamlit(with_images(st.session_state['extracted_contents']))
+
+            incremental = st.checkbox(
+                "增量导出",
+                value=True,
+                help="只重新生成修改过的幻灯片，标题集合不变时不重新生成总标题"
+            )
+
             # 添加导出PPT按钮
             if st.button("导出为PPT"):
                 with st.spinner("正在生成PPT..."):
                     try:
                         # 创建PPT文件
-                        ppt_path = create_ppt(st.session_state['extracted_contents'])
+                        ppt_path = create_ppt(
+                            with_images(st.session_state['extracted_contents']),
+                            export_cache=get_export_cache() if incremental else None
+                        )
                         
                         # 读取文件内容
                         with open(ppt_path, 'rb') as file:
@@ -940,20 +1755,87 @@ def show_step3():
         if st.button("返回上一步"):
             st.session_state['step'] = 2
             st.session_state['extracted_contents'] = []
+            st.session_state['failed_chunks'] = {}
+            persist('results', [])
             st.rerun()
     
     with col2:
         if st.button("重新开始"):
             # 重置所有状态
             st.session_state['step'] = 1
-            st.session_state['extracted_text'] = None
-            st.session_state['edited_text'] = None
             st.session_state['is_editing'] = False
-            st.session_state['chunks'] = None
-            st.session_state['edited_chunks'] = []
             st.session_state['extracted_contents'] = []
             st.session_state['api_key_confirmed'] = False
+            st.session_state['failed_chunks'] = {}
+            st.session_state.pop('export_cache', None)
+            st.session_state.pop('stream_result', None)
+            st.session_state['speculation'].cancel()
+            st.session_state['doc_store'].reset()
+            st.session_state.pop('main_title', None)
+            start_new_job()
             st.rerun()
 
+def run_app():
+    """运行页面；开启性能剖析时剖析本次运行"""
+    if not profiling.AVAILABLE:
+        main()
+        return
+
+    if 'profiles' not in st.session_state:
+        st.session_state['profiles'] = deque(maxlen=10)
+    profiling.bind_session(st.session_state['profiles'])
+    if profiling.ENABLED or st.session_state.pop('profile_next_run', False):
+        with profiling.profile_run(f"step{st.session_state.get('step', 1)}") as run:
+            # 其他会话正在剖析时本次不剖析，手动请求的剖析顺延到下一次运行
+            st.session_state['profile_busy'] = run is None
+            if run is None and not profiling.ENABLED:
+                st.session_state['profile_next_run'] = True
+            main()
+    else:
+        st.session_state.pop('profile_busy', None)
+        main()
+    show_profiling_panel()
+
+def request_profile():
+    st.session_state['profile_next_run'] = True
+
+def show_profiling_panel():
+    """在侧边栏显示性能剖析开关和本会话的剖析结果下载"""
+    with st.sidebar.expander("性能剖析", expanded=False):
+        if profiling.ENABLED:
+            st.caption("已通过 PPT_PROFILE 开启，每次运行都会剖析")
+        else:
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("剖析下一次操作", key="profile_next"):
+                    st.session_state['profile_next_run'] = True
+            with col2:
+                # 回调在本次运行开始前执行，点击触发的这次运行即被剖析
+                st.button("剖析本页刷新", key="profile_now", on_click=request_profile)
+            if st.session_state.get('profile_next_run'):
+                st.caption("下一次操作将被剖析")
+        if st.session_state.get('profile_busy'):
+            st.caption("另一个剖析正在进行，本次运行未剖析")
+
+        runs = list(st.session_state['profiles'])
+        if not runs:
+            st.caption("暂无剖析结果")
+            return
+        for run in reversed(runs):
+            sections = "，".join(f"{s['name']} {s['seconds']:.2f}秒" for s in run['sections'])
+            st.caption(f"{run['label']}：{run['seconds']:.2f} 秒" + (f"（{sections}）" if sections else ""))
+            try:
+                data = profiling.archive(run)
+            except OSError:
+                st.caption("结果文件已被清理")
+                continue
+            st.download_button(
+                label="下载剖析结果",
+                data=data,
+                file_name=f"{os.path.basename(run['path'])}.zip",
+                mime="application/zip",
+                key=f"profile_download_{os.path.basename(run['path'])}",
+            )
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    run_app() 
\ No newline at end of file
@@ -0,0 +1,436 @@
+"""批处理模式：把全部文本块的提炼请求写成一个JSONL批任务离线提交，完成后取回结果"""
+import os
+import io
+import json
+import time
+import uuid
+import hashlib
+import logging
+import tempfile
+import threading
+
+from metrics import span
+from dedupe import find_duplicates
+from llm_output import parse_extraction
+from model_router import route
+from prompts import extract_prompt
+from media_utils import strip_images
+
+logger = logging.getLogger(__name__)
+
+BATCH_DIR = os.environ.get('PPT_BATCH_DIR', os.path.join(tempfile.gettempdir(), 'ppt_batches'))
+ENDPOINT = '/v1/chat/completions'
+COMPLETION_WINDOW = '24h'
+# 命令行等待批任务完成时的轮询间隔（秒）
+POLL_INTERVAL = 30.0
+
+# 批任务状态：进行中和已结束
+ACTIVE_STATUSES = ('validating', 'in_progress', 'finalizing', 'cancelling')
+FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+STATUS_LABELS = {
+    'validating': "校验中",
+    'in_progress': "处理中",
+    'finalizing': "整理结果中",
+    'cancelling': "取消中",
+    'completed': "已完成",
+    'failed': "失败",
+    'expired': "已过期",
+    'cancelled': "已取消",
+}
+
+class BatchError(Exception):
+    """批任务提交、查询或取回结果失败"""
+
+def custom_id(index, chunk, config=''):
+    """稳定的请求编号：文本块序号加内容和配置的哈希"""
+    digest = hashlib.sha1(f"{config}\x00{chunk}".encode('utf-8')).hexdigest()[:12]
+    return f"chunk-{index:05d}-{digest}"
+
+def chunks_key(chunks):
+    """文本块列表的哈希，用于判断提交后文本块是否有改动"""
+    return hashlib.sha256("\x00".join(chunks).encode('utf-8')).hexdigest()
+
+def chunk_index(request_id):
+    """从请求编号中取出文本块序号"""
+    return int(request_id.split('-')[1])
+
+def _role(message_type):
+    return {'system': 'system', 'human': 'user', 'ai': 'assistant'}.get(message_type, message_type)
+
+def build_requests(chunks, prompt_variant='full', json_mode=False, model_tiers=None):
+    """为每个文本块生成一行批处理请求，返回 (请求列表, 重复块映射)
+
+    提示词与同步提炼使用同一个模板；重复的块不单独请求，取回结果时复用代表块的结果。
+    """
+    prompt = extract_prompt(prompt_variant, json_mode)
+    duplicates = find_duplicates(chunks)
+    config = f"{prompt_variant}|{int(bool(json_mode))}"
+    requests = []
+    for i, chunk in enumerate(chunks):
+        if i in duplicates:
+            continue
+        text_block = strip_images(chunk)
+        decision = route(text_block, 'extract', model_tiers)
+        body = {
+            'model': decision.model,
+            'temperature': decision.temperature,
+            'messages': [
+                {'role': _role(message.type), 'content': message.content}
+                for message in prompt.format_messages(text_block=text_block)
+            ],
+        }
+        if json_mode:
+            body['response_format'] = {'type': 'json_object'}
+        requests.append({
+            'custom_id': custom_id(i, chunk, f"{config}|{decision.model}"),
+            'method': 'POST',
+            'url': ENDPOINT,
+            'body': body,
+        })
+    return requests, duplicates
+
+def to_jsonl(lines):
+    """把请求或结果列表序列化为JSONL字节"""
+    return "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines).encode('utf-8')
+
+def parse_jsonl(data):
+    """解析JSONL文本，跳过空行和无法解析的行"""
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    lines = []
+    for line in data.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            lines.append(json.loads(line))
+        except ValueError:
+            logger.warning("批处理结果中有无法解析的行：%s", line[:200])
+    return lines
+
+def response_text(line):
+    """从一行批处理结果中取出模型输出文本，请求失败时抛出 BatchError"""
+    if line.get('error'):
+        error = line['error']
+        raise BatchError(error.get('message') if isinstance(error, dict) else str(error))
+    response = line.get('response') or {}
+    if response.get('status_code', 200) != 200:
+        body = response.get('body') or {}
+        message = (body.get('error') or {}).get('message') if isinstance(body, dict) else None
+        raise BatchError(message or f"请求失败（状态 {response.get('status_code')}）")
+    try:
+        return response['body']['choices'][0]['message']['content'] or ''
+    except (KeyError, IndexError, TypeError):
+        raise BatchError("批处理结果格式不正确")
+
+# 后端
+
+class OpenAIBatchBackend:
+    """OpenAI兼容的批处理接口（/v1/files + /v1/batches）"""
+
+    name = 'openai'
+
+    def __init__(self, api_key, base_url):
+        from openai import OpenAI
+        self.client = OpenAI(api_key=api_key, base_url=base_url, max_retries=3)
+
+    def submit(self, data, metadata=None):
+        """上传JSONL并创建批任务，返回批任务编号"""
+        upload = self.client.files.create(file=('batch.jsonl', io.BytesIO(data)), purpose='batch')
+        batch = self.client.batches.create(
+            input_file_id=upload.id,
+            endpoint=ENDPOINT,
+            completion_window=COMPLETION_WINDOW,
+            metadata=metadata or None,
+        )
+        return batch.id
+
+    def status(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        return {
+            'status': batch.status,
+            'completed': counts.completed if counts else 0,
+            'failed': counts.failed if counts else 0,
+            'total': counts.total if counts else 0,
+        }
+
+    def results(self, batch_id):
+        """返回全部结果行（成功和失败的请求）"""
+        batch = self.client.batches.retrieve(batch_id)
+        lines = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                lines.extend(parse_jsonl(self.client.files.content(file_id).text))
+        return lines
+
+    def cancel(self, batch_id):
+        self.client.batches.cancel(batch_id)
+
+def _pid_alive(pid):
+    try:
+        import psutil
+        return psutil.pid_exists(pid)
+    except ImportError:
+        return pid == os.getpid()
+
+def local_responder(api_key=None, base_url=None):
+    """本地后端处理单个请求的函数：给出API时逐个转发请求，否则用本地抽取式摘要作答"""
+    if api_key and base_url:
+        from openai import OpenAI
+        client = OpenAI(api_key=api_key, base_url=base_url, max_retries=2)
+
+        def respond(body):
+            return client.chat.completions.create(**body).model_dump()
+        return respond
+
+    def respond(body):
+        from extractive import summarize
+        title, content = summarize(body['messages'][-1]['content'])
+        return {
+            'object': 'chat.completion',
+            'model': body.get('model'),
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': f"标题：{title}\n\n内容：\n{content}"}}],
+        }
+    return respond
+
+class LocalFileBackend:
+    """基于本地文件的批处理替身：每个批任务一个目录，后台线程逐行处理并追加结果
+
+    进程重启后查询状态时，从已写出的结果之后继续处理。
+    """
+
+    name = 'local'
+    _threads = {}
+    _threads_lock = threading.Lock()
+    _status_lock = threading.Lock()
+
+    def __init__(self, directory=None, respond=None, delay=0.0):
+        self.directory = directory or os.path.join(BATCH_DIR, 'local')
+        self.respond = respond or local_responder()
+        self.delay = delay
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, batch_id, name):
+        return os.path.join(self.directory, batch_id, name)
+
+    def _read_status(self, batch_id):
+        try:
+            with open(self._path(batch_id, 'status.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise BatchError(f"找不到批任务 {batch_id}")
+
+    def _write_status(self, batch_id, status):
+        path = self._path(batch_id, 'status.json')
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(status, f)
+        os.replace(tmp_path, path)
+
+    def _update_status(self, batch_id, changes, final=None):
+        """把处理线程的进度合并到磁盘上的最新状态；期间已被取消时保留取消状态，结束时记为已取消"""
+        with self._status_lock:
+            status = self._read_status(batch_id)
+            cancelling = status['status'] == 'cancelling'
+            status.update(changes)
+            if cancelling:
+                status['status'] = 'cancelled' if final else 'cancelling'
+            elif final:
+                status['status'] = final
+            self._write_status(batch_id, status)
+            return status
+
+    def submit(self, data, metadata=None):
+        batch_id = f"batch_local_{uuid.uuid4().hex[:16]}"
+        os.makedirs(os.path.join(self.directory, batch_id))
+        with open(self._path(batch_id, 'input.jsonl'), 'wb') as f:
+            f.write(data)
+        total = len(parse_jsonl(data))
+        self._write_status(batch_id, {'status': 'validating', 'total': total, 'completed': 0,
+                                      'failed': 0, 'pid': os.getpid(), 'metadata': metadata or {}})
+        self._start(batch_id)
+        return batch_id
+
+    def _start(self, batch_id):
+        with self._threads_lock:
+            thread = self._threads.get(batch_id)
+            if thread is not None and thread.is_alive():
+                return
+            thread = threading.Thread(target=self._process, args=(batch_id,),
+                                      name=f'batch-{batch_id}', daemon=True)
+            self._threads[batch_id] = thread
+            thread.start()
+
+    def _process(self, batch_id):
+        status = self._update_status(batch_id, {'status': 'in_progress', 'pid': os.getpid()})
+        # 只有处理线程修改计数，写回时与磁盘上的状态合并，不覆盖期间写入的取消请求
+        counts = {'completed': status['completed'], 'failed': status['failed']}
+        with open(self._path(batch_id, 'input.jsonl'), encoding='utf-8') as f:
+            requests = parse_jsonl(f.read())
+        output_path = self._path(batch_id, 'output.jsonl')
+        done = set()
+        if os.path.exists(output_path):
+            with open(output_path, encoding='utf-8') as f:
+                done = {line['custom_id'] for line in parse_jsonl(f.read())}
+
+        with open(output_path, 'a', encoding='utf-8') as out:
+            for request in requests:
+                if request['custom_id'] in done:
+                    continue
+                if self._read_status(batch_id)['status'] == 'cancelling':
+                    self._update_status(batch_id, counts, final='cancelled')
+                    return
+                line = {'id': f"req_{uuid.uuid4().hex[:12]}", 'custom_id': request['custom_id']}
+                try:
+                    body = self.respond(request['body'])
+                    line.update(response={'status_code': 200, 'body': body}, error=None)
+                    counts['completed'] += 1
+                except Exception as e:
+                    line.update(response=None, error={'code': type(e).__name__, 'message': str(e)})
+                    counts['failed'] += 1
+                out.write(json.dumps(line, ensure_ascii=False) + "\n")
+                out.flush()
+                self._update_status(batch_id, counts)
+                if self.delay:
+                    time.sleep(self.delay)
+        self._update_status(batch_id, counts, final='completed')
+
+    def status(self, batch_id):
+        status = self._read_status(batch_id)
+        # 处理线程所在的进程已退出时，由当前进程接着处理
+        if status['status'] in ACTIVE_STATUSES and status['status'] != 'cancelling':
+            with self._threads_lock:
+                thread = self._threads.get(batch_id)
+                running_here = thread is not None and thread.is_alive()
+            if not running_here and not (status['pid'] != os.getpid() and _pid_alive(status['pid'])):
+                self._start(batch_id)
+        return {key: status[key] for key in ('status', 'completed', 'failed', 'total')}
+
+    def results(self, batch_id):
+        try:
+            with open(self._path(batch_id, 'output.jsonl'), encoding='utf-8') as f:
+                return parse_jsonl(f.read())
+        except OSError:
+            return []
+
+    def cancel(self, batch_id):
+        with self._status_lock:
+            status = self._read_status(batch_id)
+            if status['status'] in ACTIVE_STATUSES:
+                status['status'] = 'cancelling'
+                self._write_status(batch_id, status)
+
+BACKENDS = {
+    'openai': OpenAIBatchBackend,
+    'local': LocalFileBackend,
+}
+BACKEND_LABELS = {
+    'openai': "OpenAI批处理接口",
+    'local': "本地模拟（测试用）",
+}
+
+def get_backend(name, api_key=None, base_url=None):
+    """按名称创建批处理后端；本地后端给出API时逐个转发请求，否则离线作答"""
+    if name == 'local':
+        return LocalFileBackend(respond=local_responder(api_key, base_url))
+    if name not in BACKENDS:
+        raise BatchError(f"未知的批处理后端：{name}")
+    return BACKENDS[name](api_key, base_url)
+
+# 批任务记录
+
+def _record_path(job_id):
+    return os.path.join(BATCH_DIR, f"{job_id}.json")
+
+def save_record(job_id, record):
+    os.makedirs(BATCH_DIR, exist_ok=True)
+    path = _record_path(job_id)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def load_record(job_id):
+    """读取任务编号对应的批任务记录，没有时返回None"""
+    try:
+        with open(_record_path(job_id), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def clear_record(job_id):
+    try:
+        os.unlink(_record_path(job_id))
+    except OSError:
+        pass
+
+def submit(chunks, backend, job_id=None, prompt_variant='full', json_mode=False, model_tiers=None):
+    """写出批处理请求并提交，返回批任务记录（有任务编号时同时保存）"""
+    with span('batch_submit') as data:
+        requests, duplicates = build_requests(chunks, prompt_variant, json_mode, model_tiers)
+        payload = to_jsonl(requests)
+        data['bytes_out'] = len(payload)
+        batch_id = backend.submit(payload, {'job_id': job_id} if job_id else None)
+    record = {
+        'batch_id': batch_id,
+        'backend': backend.name,
+        'submitted': time.time(),
+        'chunk_count': len(chunks),
+        'chunks_key': chunks_key(chunks),
+        'requests': len(requests),
+        # 序号 -> 代表块序号（JSON的键只能是字符串）
+        'duplicates': {str(i): source for i, (source, _) in duplicates.items()},
+    }
+    if job_id:
+        save_record(job_id, record)
+    return record
+
+def collect(record, backend):
+    """取回批任务结果，返回按文本块顺序排列的结果和失败的块序号（与 run_extraction 相同）"""
+    results = [None] * record['chunk_count']
+    errors = {}
+    with span('batch_collect') as data:
+        lines = backend.results(record['batch_id'])
+        data['bytes_in'] = sum(len(json.dumps(line, ensure_ascii=False)) for line in lines)
+        for line in lines:
+            try:
+                i = chunk_index(line['custom_id'])
+            except (KeyError, IndexError, ValueError):
+                continue
+            if not 0 <= i < len(results):
+                continue
+            try:
+                title, content = parse_extraction(response_text(line))
+                if title and content:
+                    results[i] = {'title': title, 'content': content, 'chunk_index': i}
+                    errors.pop(i, None)
+                else:
+                    errors[i] = "模型输出中没有找到标题或内容"
+            except BatchError as e:
+                errors[i] = str(e)
+
+    duplicates = {int(i): source for i, source in record.get('duplicates', {}).items()}
+    for i in range(len(results)):
+        if results[i] is None and i not in errors and i not in duplicates:
+            errors[i] = "批处理结果中没有该文本块"
+    for i, source in duplicates.items():
+        if results[source]:
+            results[i] = {**results[source], 'chunk_index': i}
+        else:
+            errors[i] = errors.get(source, "重复块的代表块提炼失败")
+    return results, errors
+
+def wait(record, backend, interval=POLL_INTERVAL, timeout=None, on_status=None):
+    """轮询直到批任务结束，返回最后的状态"""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        status = backend.status(record['batch_id'])
+        if on_status:
+            on_status(status)
+        if status['status'] in FINAL_STATUSES:
+            return status
+        if deadline is not None and time.monotonic() >= deadline:
+            return status
+        time.sleep(interval)
@@ -0,0 +1,472 @@
+"""多用户负载测试：模拟多个浏览器会话并发操作 app_new.py，测量页面运行延迟和服务进程资源占用
+
+启动一个 Streamlit 服务进程（与 start_app.py 相同的启动参数）、本地模拟大模型接口和提供录制网页的
+本地HTTP服务。每个模拟用户建立一个websocket会话，按真实操作顺序发送控件状态：输入URL -> 提取文章
+-> 确认内容 -> 应用分割 -> 确认分割 -> 填写并确认API密钥 -> 内容提炼 -> 导出PPT，之后再做几次普通刷新。
+每次操作的延迟为发送控件状态到服务端报告页面运行完成（含 st.rerun 触发的后续运行）的时间；
+同时按固定间隔采样服务进程（含子进程）的RSS和CPU时间。
+
+AppTest 在测试进程中运行脚本并共用全局 Runtime，无法模拟并发会话，因此这里直接使用Streamlit的
+websocket协议（与浏览器相同），测量的是真实服务进程的表现。
+
+--users 可以给出多个并发数（例如 1,5,10,20），每个并发数使用一个新启动的服务进程，
+输出各并发数下的延迟分位数和每会话资源占用；交互操作（不含大模型提炼）的p95不超过 --slo 的最大并发数
+作为单个服务进程的会话容量。
+
+示例：
+    python benchmarks/load_bench.py --users 10
+    python benchmarks/load_bench.py --users 1,5,10,20 --slo 1.0 --output load.json
+    python benchmarks/load_bench.py --users 5,10 --baseline load.json --threshold 1.5
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import psutil
+
+from mock_llm_server import start_server
+from pipeline_bench import percentile
+from start_app import streamlit_command, wait_until_ready
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpora')
+DEFAULT_DOCUMENT = 'sample_article.html'
+STREAM_PATH = '/_stcore/stream'
+# 单次操作等待页面运行完成的最长时间（秒）
+ACTION_TIMEOUT = 300
+# 资源采样间隔（秒）
+SAMPLE_INTERVAL = 0.2
+# 计入会话容量的交互操作（大模型提炼的耗时主要取决于模拟接口的延迟，单独统计）
+LLM_ACTIONS = ('extract',)
+# 与基线比较时忽略的每会话RSS（MB）和CPU时间（秒）差异
+RSS_NOISE_MB = 5.0
+CPU_NOISE_SECONDS = 0.2
+
+class ActionFailed(Exception):
+    """模拟用户的操作无法继续（找不到控件、页面异常或超时）"""
+
+class Session:
+    """一个模拟浏览器会话：记录页面中的控件，按标签设置控件值并触发页面运行"""
+
+    def __init__(self, port):
+        self.port = port
+        self.ws = None
+        self.widgets = {}   # 标签 -> (控件类型, 控件编号, 控件proto)
+        self.states = {}    # 控件编号 -> WidgetState，每次运行都发送全部已设置的控件值
+        self.page_hash = ''
+        self.errors = []
+
+    async def connect(self):
+        from tornado.websocket import websocket_connect
+        self.ws = await websocket_connect(f"ws://127.0.0.1:{self.port}{STREAM_PATH}",
+                                          max_message_size=512 * 1024 * 1024)
+
+    def close(self):
+        if self.ws is not None:
+            self.ws.close()
+            self.ws = None
+
+    # 控件操作
+
+    def _widget(self, label, kind=None):
+        entry = self.widgets.get(label)
+        if entry is None or (kind and entry[0] != kind):
+            raise ActionFailed(f"页面中没有找到控件：{label}")
+        return entry
+
+    def set_text(self, label, value):
+        _, widget_id, _ = self._widget(label)
+        self._state(widget_id).string_value = value
+
+    def choose(self, label, option):
+        _, widget_id, proto = self._widget(label, 'radio')
+        self._state(widget_id).int_value = list(proto.options).index(option)
+
+    def click(self, label):
+        _, widget_id, _ = self._widget(label, 'button')
+        self._state(widget_id).trigger_value = True
+
+    def has(self, label):
+        return label in self.widgets
+
+    def _state(self, widget_id):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        state = WidgetState(id=widget_id)
+        self.states[widget_id] = state
+        return state
+
+    # 页面运行
+
+    async def run(self):
+        """发送当前控件状态触发一次页面运行，等待运行完成，返回耗时（秒）"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        msg = BackMsg()
+        msg.rerun_script.query_string = ''
+        msg.rerun_script.page_script_hash = self.page_hash
+        msg.rerun_script.widget_states.widgets.extend(self.states.values())
+        start = time.perf_counter()
+        await self.ws.write_message(msg.SerializeToString(), binary=True)
+        # 按钮的触发值只在一次运行中有效
+        self.states = {key: state for key, state in self.states.items()
+                       if state.WhichOneof('value') != 'trigger_value'}
+
+        while True:
+            remaining = ACTION_TIMEOUT - (time.perf_counter() - start)
+            if remaining <= 0:
+                raise ActionFailed("等待页面运行完成超时")
+            data = await asyncio.wait_for(self.ws.read_message(), remaining)
+            if data is None:
+                raise ActionFailed("服务端关闭了连接")
+            forward = ForwardMsg()
+            forward.ParseFromString(data)
+            kind = forward.WhichOneof('type')
+            if kind == 'new_session':
+                self.page_hash = forward.new_session.page_script_hash
+            elif kind == 'delta':
+                self._record(forward.delta)
+            elif kind == 'script_finished':
+                status = forward.script_finished
+                if status == ForwardMsg.FINISHED_SUCCESSFULLY:
+                    return time.perf_counter() - start
+                if status == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    raise ActionFailed("脚本编译失败")
+                # FINISHED_EARLY_FOR_RERUN：st.rerun 触发的后续运行计入同一次操作
+
+    def _record(self, delta):
+        if delta.WhichOneof('type') != 'new_element':
+            return
+        element = delta.new_element
+        kind = element.WhichOneof('type')
+        if kind == 'exception':
+            self.errors.append(f"{element.exception.type}: {element.exception.message}")
+            return
+        if kind == 'alert' and element.alert.format == element.alert.ERROR:
+            self.errors.append(element.alert.body)
+            return
+        proto = getattr(element, kind, None)
+        widget_id = getattr(proto, 'id', '')
+        label = getattr(proto, 'label', '')
+        if widget_id and label:
+            self.widgets[label] = (kind, widget_id, proto)
+
+class User:
+    """按步骤1–3的操作顺序驱动一个会话，记录每次操作的耗时"""
+
+    def __init__(self, index, port, document_url, llm_url, think, idle_reruns, seed):
+        self.index = index
+        self.session = Session(port)
+        self.document_url = document_url
+        self.llm_url = llm_url
+        self.think = think
+        self.idle_reruns = idle_reruns
+        self.rng = random.Random(seed)
+        self.timings = []   # [(操作, 秒)]
+        self.failure = None
+
+    async def act(self, name, *operations):
+        for operation, *args in operations:
+            getattr(self.session, operation)(*args)
+        seconds = await self.session.run()
+        self.timings.append((name, seconds))
+        if self.think:
+            # 用户思考时间，平均值为 think 秒
+            await asyncio.sleep(self.rng.uniform(0, 2 * self.think))
+
+    async def scenario(self):
+        session = self.session
+        try:
+            start = time.perf_counter()
+            await session.connect()
+            await session.run()
+            self.timings.append(('open', time.perf_counter() - start))
+
+            # 步骤1：从URL提取文章
+            await self.act('choose_url', ('choose', "选择输入方式", "输入URL"))
+            await self.act('enter_url', ('set_text', "输入文章URL", self.document_url))
+            await self.act('extract_article', ('click', "提取文章"))
+            await self.act('confirm_article', ('click', "确认内容并进入下一步"))
+
+            # 步骤2：按默认块数分割
+            await self.act('split', ('click', "应用分割"))
+            await self.act('confirm_split', ('click', "确认分割并进入下一步"))
+
+            # 步骤3：设置API、提炼并导出
+            await self.act('enter_api', ('set_text', "API基础URL", self.llm_url),
+                           ('set_text', "API密钥", 'mock-key'))
+            await self.act('confirm_api', ('click', "确认API密钥"))
+            start_label = "开始内容提炼" if session.has("开始内容提炼") else "用大模型提炼替换草稿"
+            await self.act('extract', ('click', start_label))
+            await self.act('export', ('click', "导出为PPT"))
+            if not session.has("下载PPT文件"):
+                raise ActionFailed("导出后没有出现下载按钮")
+            for _ in range(self.idle_reruns):
+                await self.act('rerun')
+        except (ActionFailed, asyncio.TimeoutError, OSError) as e:
+            self.failure = str(e) or type(e).__name__
+        finally:
+            session.close()
+
+class ResourceSampler:
+    """在后台线程中采样服务进程及其子进程的RSS和CPU时间"""
+
+    def __init__(self, pid):
+        self.process = psutil.Process(pid)
+        self.samples = []   # [(时间, RSS字节, CPU秒)]
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        rss = cpu = 0
+        for process in [self.process] + self.process.children(recursive=True):
+            try:
+                rss += process.memory_info().rss
+                times = process.cpu_times()
+                cpu += times.user + times.system
+            except psutil.Error:
+                pass
+        return time.perf_counter(), rss, cpu
+
+    def start(self):
+        def loop():
+            while not self._stop.is_set():
+                self.samples.append(self.sample())
+                self._stop.wait(SAMPLE_INTERVAL)
+        self._thread = threading.Thread(target=loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.samples.append(self.sample())
+
+def serve_corpus(directory):
+    """在本地端口上提供录制的网页，返回 (服务, 基础地址)"""
+    class Handler(SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=directory, **kwargs)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+def free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_app_server(state_dir):
+    """启动一个新的Streamlit服务进程，任务存储、调度状态等写入独立的临时目录，返回 (进程, 端口)"""
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        'PPT_PIPELINE_DB': os.path.join(state_dir, 'pipeline.db'),
+        'PPT_SCHED_DIR': os.path.join(state_dir, 'sched'),
+        'PPT_BATCH_DIR': os.path.join(state_dir, 'batch'),
+        'PPT_DOC_SPILL_DIR': os.path.join(state_dir, 'spill'),
+        'PPT_THUMBNAIL_CACHE': os.path.join(state_dir, 'thumbnails'),
+        'PPT_MEDIA_DIR': os.path.join(state_dir, 'media'),
+    })
+    command = streamlit_command(os.path.join(ROOT, 'app_new.py'), port) + [
+        '--browser.gatherUsageStats', 'false',
+        '--server.fileWatcherType', 'none',
+    ]
+    process = subprocess.Popen(command, cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if wait_until_ready(port, process) is None:
+        process.kill()
+        raise RuntimeError("Streamlit服务启动失败")
+    return process, port
+
+async def run_users(count, port, document_url, llm_url, think, idle_reruns, ramp):
+    """并发运行 count 个模拟用户，在 ramp 秒内均匀启动"""
+    users = [User(i, port, document_url, llm_url, think, idle_reruns, seed=i) for i in range(count)]
+
+    async def start(user):
+        await asyncio.sleep(ramp * user.index / max(count, 1))
+        await user.scenario()
+
+    await asyncio.gather(*(start(user) for user in users))
+    return users
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'p50': round(percentile(values, 50), 4),
+        'p95': round(percentile(values, 95), 4),
+        'p99': round(percentile(values, 99), 4),
+        'max': round(max(values), 4) if values else 0.0,
+    }
+
+def run_level(count, args, document_url, llm_url):
+    """用一个新的服务进程运行一轮负载测试，返回该并发数下的统计结果"""
+    with tempfile.TemporaryDirectory(prefix='ppt_load_') as state_dir:
+        process, port = start_app_server(state_dir)
+        try:
+            sampler = ResourceSampler(process.pid)
+            # 先用一个会话预热（首次导入依赖、后台预热线程），不计入统计
+            asyncio.run(run_users(1, port, document_url, llm_url, 0, 0, 0))
+            time.sleep(1)
+            _, baseline_rss, baseline_cpu = sampler.sample()
+
+            sampler.start()
+            start = time.perf_counter()
+            users = asyncio.run(run_users(count, port, document_url, llm_url,
+                                          args.think, args.idle_reruns, args.ramp))
+            elapsed = time.perf_counter() - start
+            sampler.stop()
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    by_action = {}
+    for user in users:
+        for name, seconds in user.timings:
+            by_action.setdefault(name, []).append(seconds)
+    interactive = [seconds for name, values in by_action.items() if name not in LLM_ACTIONS
+                   for seconds in values]
+    peak_rss = max(rss for _, rss, _ in sampler.samples)
+    cpu_seconds = sampler.samples[-1][2] - baseline_cpu
+    return {
+        'users': count,
+        'completed': sum(1 for user in users if user.failure is None),
+        'failures': [f"用户{user.index}：{user.failure}" for user in users if user.failure],
+        'page_errors': sorted({error for user in users for error in user.session.errors}),
+        'elapsed_seconds': round(elapsed, 2),
+        'interactive': summarize(interactive),
+        'actions': {name: summarize(values) for name, values in by_action.items()},
+        'baseline_rss_mb': round(baseline_rss / 1024 / 1024, 1),
+        'peak_rss_mb': round(peak_rss / 1024 / 1024, 1),
+        'rss_per_session_mb': round((peak_rss - baseline_rss) / 1024 / 1024 / count, 2),
+        'cpu_seconds': round(cpu_seconds, 2),
+        'cpu_seconds_per_session': round(cpu_seconds / count, 3),
+        'cpu_utilization': round(cpu_seconds / elapsed, 3) if elapsed else 0.0,
+    }
+
+def capacity(levels, slo):
+    """交互操作p95不超过SLO且没有失败的最大并发数，没有满足的并发数时为0"""
+    passing = [level['users'] for level in levels
+               if level['interactive']['p95'] <= slo and not level['failures']]
+    return max(passing, default=0)
+
+def compare(levels, baseline, threshold, min_delta):
+    """与基线中相同并发数的结果比较，返回超出阈值的指标"""
+    previous = {level['users']: level for level in baseline.get('levels', [])}
+    regressions = []
+    for level in levels:
+        before = previous.get(level['users'])
+        if not before:
+            continue
+        # 各指标单位不同，RSS和CPU的采样波动较大，分别设置忽略的最小差异
+        for metric, get, floor in (('交互p95(秒)', lambda l: l['interactive']['p95'], min_delta),
+                                   ('每会话RSS(MB)', lambda l: l['rss_per_session_mb'], RSS_NOISE_MB),
+                                   ('每会话CPU(秒)', lambda l: l['cpu_seconds_per_session'], CPU_NOISE_SECONDS)):
+            old, new = get(before), get(level)
+            ratio = new / old if old else float('inf')
+            if ratio > threshold and new - old > floor:
+                regressions.append((level['users'], metric, old, new, ratio))
+    return regressions
+
+def print_level(level):
+    print(f"\n并发用户 {level['users']}：完成 {level['completed']}，耗时 {level['elapsed_seconds']} 秒")
+    print(f"{'操作':20s} {'次数':>6s} {'p50':>9s} {'p95':>9s} {'p99':>9s} {'最大':>9s}")
+    rows = list(level['actions'].items()) + [('交互操作合计', level['interactive'])]
+    for name, stats in rows:
+        print(f"{name:20s} {stats['count']:6d} {stats['p50']:9.3f} {stats['p95']:9.3f} "
+              f"{stats['p99']:9.3f} {stats['max']:9.3f}")
+    print(f"服务进程RSS：基线 {level['baseline_rss_mb']} MB，峰值 {level['peak_rss_mb']} MB，"
+          f"每会话 {level['rss_per_session_mb']} MB")
+    print(f"CPU：共 {level['cpu_seconds']} 秒，每会话 {level['cpu_seconds_per_session']} 秒，"
+          f"平均占用 {level['cpu_utilization'] * 100:.0f}%")
+    for failure in level['failures']:
+        print(f"失败：{failure}")
+    for error in level['page_errors']:
+        print(f"页面错误：{error}")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="多用户负载测试")
+    parser.add_argument('--users', default='5', help="并发用户数，可用逗号分隔多个，例如 1,5,10")
+    parser.add_argument('--document', default=DEFAULT_DOCUMENT,
+                        help="benchmarks/corpora 中用作文章的录制网页")
+    parser.add_argument('--latency', default='lognormal:0.5:0.3', help="模拟大模型接口的延迟分布")
+    parser.add_argument('--rps', type=float, default=0.0, help="模拟接口每秒最多接受的请求数")
+    parser.add_argument('--think', type=float, default=0.5, help="两次操作之间的平均思考时间（秒）")
+    parser.add_argument('--ramp', type=float, default=2.0, help="在该秒数内逐个启动全部用户")
+    parser.add_argument('--idle-reruns', type=int, default=3, help="导出后每个用户再做的普通刷新次数")
+    parser.add_argument('--slo', type=float, default=1.0, help="交互操作p95延迟目标（秒），用于计算会话容量")
+    parser.add_argument('--output', help="将结果写入JSON文件")
+    parser.add_argument('--baseline', help="基线结果JSON文件")
+    parser.add_argument('--threshold', type=float, default=1.5, help="相对基线允许的最大倍数")
+    parser.add_argument('--min-delta', type=float, default=0.05, help="忽略小于该值的交互p95差异（秒）")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    counts = [int(value) for value in args.users.split(',') if value.strip()]
+
+    llm_server, llm_url, backend = start_server(latency=args.latency, rps=args.rps)
+    corpus_server, corpus_url = serve_corpus(CORPUS_DIR)
+    try:
+        levels = []
+        for count in counts:
+            level = run_level(count, args, corpus_url + args.document, llm_url)
+            print_level(level)
+            levels.append(level)
+    finally:
+        llm_server.shutdown()
+        corpus_server.shutdown()
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'slo': args.slo,
+        'capacity': capacity(levels, args.slo),
+        'levels': levels,
+        'llm_requests': backend.stats['requests'],
+    }
+    print(f"\n会话容量（交互操作p95 ≤ {args.slo} 秒）：{report['capacity']} 个并发用户")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    failures = [failure for level in levels for failure in level['failures']]
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(levels, baseline, args.threshold, args.min_delta)
+        print("\n与基线比较：")
+        if not regressions:
+            print("未发现性能退化")
+        for users, metric, before, after, ratio in regressions:
+            print(f"并发 {users:4d} {metric:16s} {before:10.3f} -> {after:10.3f} ({ratio:.2f}x)")
+            failures.append(f"并发 {users} 时{metric}为基线的 {ratio:.2f} 倍")
+
+    if failures:
+        print("\n负载测试未通过：")
+        for failure in failures:
+            print(f"- {failure}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,312 @@
+"""文本读取、分割和PPT渲染热点路径的微基准测试
+
+覆盖 extract_article_from_html（URL提取的解析部分）、extract_text_from_docx、
+detect_encoding、recursive_split_text、ppt_utils.create_slide 和 create_ppt。
+语料包括合成的中文、英文和中英混合文本（1千到100万字符）、录制的网页，
+以及10到1000页的演示文稿。每项记录耗时和峰值内存，结果保存为JSON，
+并可与基线比较；同时检查最大两个规模之间耗时的增长阶数，防止分割退化为平方复杂度。
+
+示例：
+    python benchmarks/micro_bench.py --output bench.json
+    python benchmarks/micro_bench.py --quick --baseline bench.json --threshold 1.5
+"""
+import io
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+CORPUS_DIR = os.path.join(BENCH_DIR, 'corpora')
+
+ZH_SENTENCES = [
+    "本季度公司营业收入同比增长百分之十二，主要来自海外市场的扩张。",
+    "研发投入持续增加，新产品线预计在明年第二季度正式上线。",
+    "供应链方面，核心零部件的交付周期缩短至三周以内！",
+    "客户满意度调查显示，售后服务的响应速度仍有提升空间？",
+    "团队将在下半年推进数字化转型，重点建设数据中台。",
+]
+EN_SENTENCES = [
+    "Revenue grew twelve percent year over year, driven by overseas expansion.",
+    "R&D spending keeps rising and the new product line ships next spring.",
+    "Lead times for core components dropped below three weeks!",
+    "Customer surveys show after-sales response times can still improve?",
+    "The team will push digital transformation in the second half.",
+]
+
+# 各项测试的输入规模
+TEXT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+DECK_SIZES = [10, 100, 1000]
+QUICK_TEXT_SIZES = [1_000, 10_000, 100_000]
+QUICK_DECK_SIZES = [10, 100]
+
+# 增长阶数上限：规模扩大k倍时耗时不应超过 k**exponent 倍。
+# 线性算法在大输入下受缓存和垃圾回收影响，实测约为1.1~1.5；平方复杂度约为2
+MAX_EXPONENT = {
+    'recursive_split_text': 1.6,
+    'detect_encoding': 1.6,
+    'extract_article_from_html': 1.6,
+    'extract_text_from_docx': 1.6,
+    'create_ppt': 1.6,
+}
+
+SLIDE_CONTENT = """1. 核心观点：
+  a. 背景说明：营业收入同比增长12%
+    - 关键数据：海外市场贡献过半
+  b. 主要结论：新产品线明年上线
+2. 实施建议：
+  a. 具体措施：分步骤推进数字化转型
+普通说明文字"""
+
+def synthetic_text(kind, size, seed=0):
+    """生成指定语言类型和长度的段落文本：zh、en 或 mixed"""
+    rng = random.Random(f"{kind}-{size}-{seed}")
+    pools = {
+        'zh': ZH_SENTENCES,
+        'en': EN_SENTENCES,
+        'mixed': ZH_SENTENCES + EN_SENTENCES,
+    }[kind]
+    separator = '' if kind == 'zh' else ' '
+    parts = []
+    length = 0
+    while length < size:
+        paragraph = separator.join(rng.choice(pools) for _ in range(rng.randint(2, 6)))
+        parts.append(paragraph)
+        length += len(paragraph) + 2
+    return '\n\n'.join(parts)[:size]
+
+def synthetic_html(size):
+    """把合成文本包装成带导航和文章容器的网页"""
+    paragraphs = synthetic_text('mixed', size).split('\n\n')
+    body = []
+    for i, paragraph in enumerate(paragraphs):
+        if i % 10 == 0:
+            body.append(f"<h2>第{i // 10 + 1}节</h2>")
+        if i % 7 == 0:
+            body.append(f"<ul><li>{paragraph[:40]}</li></ul>")
+        body.append(f"<p>{paragraph}</p>")
+    return (
+        "<html><head><script>var a=1;</script></head><body>"
+        "<nav><ul><li>首页</li><li>新闻</li></ul></nav>"
+        f"<div class='article-content'>{''.join(body)}</div>"
+        "<footer>版权所有</footer></body></html>"
+    )
+
+def synthetic_docx(size):
+    """生成包含指定字符数的docx文件字节"""
+    from docx import Document
+    doc = Document()
+    for paragraph in synthetic_text('mixed', size).split('\n\n'):
+        doc.add_paragraph(paragraph)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+def synthetic_deck(count):
+    """生成指定页数的提炼结果"""
+    return [{'title': f"第{i + 1}页：经营分析", 'content': SLIDE_CONTENT} for i in range(count)]
+
+def measure(fn, repeat):
+    """运行fn若干次，返回最短耗时和单独一次运行的峰值内存"""
+    # 预热一次，排除首次导入和缓存初始化的开销
+    fn()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'seconds': min(timings),
+        'median_seconds': sorted(timings)[len(timings) // 2],
+        'peak_bytes': peak,
+    }
+
+def build_cases(quick):
+    """返回所有测试用例：(名称, 函数族, 规模, 可调用对象)"""
+    import app_new
+    import document_readers
+    import ppt_utils
+    from pptx import Presentation
+
+    text_sizes = QUICK_TEXT_SIZES if quick else TEXT_SIZES
+    deck_sizes = QUICK_DECK_SIZES if quick else DECK_SIZES
+    cases = []
+
+    for kind in ('zh', 'en', 'mixed'):
+        for size in text_sizes:
+            text = synthetic_text(kind, size)
+            for num_chunks in (5, 20):
+                cases.append((
+                    f"recursive_split_text[{kind},{size},{num_chunks}]",
+                    'recursive_split_text', size,
+                    lambda text=text, n=num_chunks: app_new.recursive_split_text(text, n)
+                ))
+
+    for encoding in ('utf-8', 'gbk'):
+        for size in text_sizes:
+            data = synthetic_text('zh', size).encode(encoding)
+            cases.append((
+                f"detect_encoding[{encoding},{size}]", 'detect_encoding', size,
+                lambda data=data: document_readers.detect_encoding(data)
+            ))
+
+    for size in text_sizes:
+        html = synthetic_html(size)
+        cases.append((
+            f"extract_article_from_html[synthetic,{size}]", 'extract_article_from_html', size,
+            lambda html=html: app_new.extract_article_from_html(html)
+        ))
+    with open(os.path.join(CORPUS_DIR, 'sample_article.html'), encoding='utf-8') as f:
+        recorded_html = f.read()
+    cases.append((
+        "extract_article_from_html[recorded]", None, len(recorded_html),
+        lambda: app_new.extract_article_from_html(recorded_html)
+    ))
+
+    for size in text_sizes:
+        data = synthetic_docx(size)
+        cases.append((
+            f"extract_text_from_docx[{size}]", 'extract_text_from_docx', size,
+            lambda data=data: document_readers.extract_text_from_docx(io.BytesIO(data))
+        ))
+
+    def create_slides(count):
+        prs = Presentation()
+        for i in range(count):
+            ppt_utils.create_slide(prs, f"第{i + 1}页", SLIDE_CONTENT)
+
+    cases.append(("create_slide[10]", None, 10, lambda: create_slides(10)))
+
+    for count in deck_sizes:
+        deck = synthetic_deck(count)
+
+        def export(deck=deck):
+            os.unlink(app_new.create_ppt(deck))
+
+        cases.append((f"create_ppt[{count}]", 'create_ppt', count, export))
+
+    return cases
+
+def growth_exponents(results, cases):
+    """按函数族计算最大两个规模之间的对数增长阶数（小规模耗时受常数开销影响较大）"""
+    families = {}
+    for name, family, size, _ in cases:
+        if family is None or name not in results:
+            continue
+        # 同一函数族中参数不同的用例分别计算，例如不同语言和块数
+        variant = name.split('[', 1)[1].rsplit(']', 1)[0].split(',')
+        key = (family, tuple(v for v in variant if v != str(size)))
+        families.setdefault(key, []).append((size, results[name]['seconds']))
+
+    exponents = {}
+    for (family, variant), points in families.items():
+        points.sort()
+        if len(points) < 2:
+            continue
+        (small_size, small_time), (large_size, large_time) = points[-2], points[-1]
+        if large_size == small_size or small_time <= 0:
+            continue
+        exponent = math.log(large_time / small_time) / math.log(large_size / small_size)
+        label = f"{family}[{','.join(variant)}]" if variant else family
+        exponents[label] = {
+            'family': family,
+            'exponent': round(exponent, 3),
+            'limit': MAX_EXPONENT.get(family),
+        }
+    return exponents
+
+def compare(results, baseline, threshold, min_delta):
+    """与基线比较，返回耗时超出阈值的用例"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            continue
+        ratio = current['seconds'] / previous['seconds'] if previous['seconds'] else float('inf')
+        if ratio > threshold and current['seconds'] - previous['seconds'] > min_delta:
+            regressions.append((name, previous['seconds'], current['seconds'], ratio))
+    return regressions
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="热点路径微基准测试")
+    parser.add_argument('--quick', action='store_true', help="只运行较小规模的用例")
+    parser.add_argument('--repeat', type=int, default=3, help="每个用例重复次数，取最短耗时")
+    parser.add_argument('--filter', help="只运行名称包含该字符串的用例")
+    parser.add_argument('--output', help="将结果写入JSON文件")
+    parser.add_argument('--baseline', help="基线结果JSON文件")
+    parser.add_argument('--threshold', type=float, default=1.5, help="相对基线允许的最大耗时倍数")
+    parser.add_argument('--min-delta', type=float, default=0.002, help="忽略小于该秒数的耗时差异")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    import app_new
+    # 只测量渲染，总标题使用固定文本，避免调用大模型
+    app_new.generate_main_title = lambda extracted_contents, *a, **kw: "基准测试总标题"
+
+    cases = build_cases(args.quick)
+    if args.filter:
+        cases = [case for case in cases if args.filter in case[0]]
+
+    results = {}
+    for name, _, size, fn in cases:
+        results[name] = dict(measure(fn, args.repeat), size=size)
+        print(f"{name:50s} {results[name]['seconds'] * 1000:10.2f} ms "
+              f"{results[name]['peak_bytes'] / 1024 / 1024:8.2f} MB")
+
+    exponents = growth_exponents(results, cases)
+    failures = []
+    print("\n增长阶数：")
+    for label, info in sorted(exponents.items()):
+        flag = ''
+        if info['limit'] is not None and info['exponent'] > info['limit']:
+            flag = f"  超过上限 {info['limit']}"
+            failures.append(f"{label} 增长阶数 {info['exponent']} 超过上限 {info['limit']}")
+        print(f"{label:50s} {info['exponent']:6.2f}{flag}")
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'quick': args.quick,
+        'results': results,
+        'exponents': exponents,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_delta)
+        print("\n与基线比较：")
+        if not regressions:
+            print("未发现性能退化")
+        for name, before, after, ratio in regressions:
+            print(f"{name:50s} {before * 1000:10.2f} ms -> {after * 1000:10.2f} ms ({ratio:.2f}x)")
+            failures.append(f"{name} 耗时为基线的 {ratio:.2f} 倍")
+
+    if failures:
+        print("\n基准测试未通过：")
+        for failure in failures:
+            print(f"- {failure}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
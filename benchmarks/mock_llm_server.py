@@ -0,0 +1,308 @@
+"""本地模拟的OpenAI兼容接口，用于离线测量步骤3流水线
+
+支持 /v1/chat/completions（含流式输出），可配置延迟分布、吞吐上限、
+错误、429与格式偏差注入，JSON模式，以及固定或录制的"标题："/"内容："格式回复。
+
+示例：
+    python benchmarks/mock_llm_server.py --port 8900 --latency lognormal:0.8:0.4 --rps 5 --rate-429 0.05
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DEFAULT_EXTRACTION = """标题：{title}
+
+内容：
+1. 核心观点：
+  a. 背景说明：{snippet}
+    - 关键数据：相关数据与案例保持原文表述
+  b. 主要结论：对原文进行适度精简后的要点
+2. 实施建议：
+  a. 具体措施：分步骤推进并跟踪效果
+    - 注意事项：保留原文的重要专业术语
+"""
+
+DEFAULT_TITLE = "模拟生成的总标题"
+
+def parse_latency(spec):
+    """解析延迟分布，例如 fixed:0.5、uniform:0.2:1.0、lognormal:0.8:0.4、normal:1:0.2"""
+    parts = spec.split(':')
+    kind = parts[0]
+    args = [float(x) for x in parts[1:]]
+    if kind == 'fixed':
+        return lambda: args[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(args[0], args[1])
+    if kind == 'normal':
+        return lambda: max(0.0, random.gauss(args[0], args[1]))
+    if kind == 'lognormal':
+        # 参数为中位数和对数标准差
+        median, sigma = args
+        return lambda: random.lognormvariate(0, sigma) * median
+    raise ValueError(f"不支持的延迟分布：{spec}")
+
+def estimate_tokens(text):
+    """粗略估算token数：中文每字约1个token，其余每4个字符约1个token"""
+    cjk = sum(1 for ch in text if '一' <= ch <= '鿿')
+    return cjk + (len(text) - cjk) // 4 + 1
+
+class TokenBucket:
+    """令牌桶，限制每秒可接受的请求数"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """取一个令牌，失败时返回需要等待的秒数"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+class MockBackend:
+    """模拟后端的配置与状态"""
+
+    def __init__(self, latency='fixed:0.2', rps=0.0, rate_429=0.0, error_rate=0.0,
+                 retry_after=1.0, responses=None, stream_chunk=8, malformed_rate=0.0):
+        self.latency = parse_latency(latency)
+        self.bucket = TokenBucket(rps) if rps > 0 else None
+        self.rate_429 = rate_429
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.responses = responses or []
+        self.stream_chunk = stream_chunk
+        self.malformed_rate = malformed_rate
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'throttled': 0, 'errors': 0, 'ok': 0}
+        self._next = 0
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def reply_for(self, messages):
+        """根据请求内容选择回复：有录制回复时轮流返回，否则按请求类型生成"""
+        if self.responses:
+            with self.lock:
+                reply = self.responses[self._next % len(self.responses)]
+                self._next += 1
+            return reply
+
+        prompt = '\n'.join(str(m.get('content', '')) for m in messages)
+        if '总标题' in prompt:
+            return DEFAULT_TITLE
+        user_text = str(messages[-1].get('content', '')) if messages else ''
+        if '##输入' in user_text:
+            # 原文嵌在提示词中间时，只截取输入部分
+            user_text = user_text.split('##输入', 1)[1].split('##输出格式', 1)[0]
+        snippet = ' '.join(user_text.split())[:60]
+        title = (snippet[:12] or '模拟标题').strip()
+        return DEFAULT_EXTRACTION.format(title=title, snippet=snippet)
+
+def malform(reply):
+    """注入常见的格式偏差：加粗关键词、英文冒号，或完全丢失格式"""
+    kind = random.choice(('bold', 'ascii_colon', 'missing'))
+    if kind == 'bold':
+        return reply.replace('标题：', '**标题：**').replace('内容：', '**内容：**')
+    if kind == 'ascii_colon':
+        return reply.replace('标题：', '标题: ').replace('内容：', '内容:')
+    return '\n'.join(line for line in reply.splitlines()
+                     if not line.startswith(('标题', '内容')))
+
+def as_json_reply(reply):
+    """把"标题："/"内容："格式的回复转换为JSON对象文本"""
+    title, content = '', []
+    for i, line in enumerate(reply.splitlines()):
+        if line.startswith('标题：'):
+            title = line[len('标题：'):].strip()
+        elif line.startswith('内容：'):
+            content = reply.splitlines()[i + 1:]
+            break
+    return json.dumps({'title': title, 'content': '\n'.join(content).strip()}, ensure_ascii=False)
+
+def load_responses(path):
+    """读取录制回复：JSONL（每行含content或choices字段）或以空行分隔的纯文本"""
+    with open(path, encoding='utf-8') as f:
+        raw = f.read()
+    if path.endswith('.jsonl'):
+        responses = []
+        for line in raw.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'choices' in record:
+                responses.append(record['choices'][0]['message']['content'])
+            else:
+                responses.append(record['content'])
+        return responses
+    return [block.strip() for block in raw.split('\n\n\n') if block.strip()]
+
+def make_handler(backend):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip('/').endswith('/models'):
+                self._send_json(200, {'object': 'list', 'data': [{'id': 'mock', 'object': 'model'}]})
+            elif self.path == '/stats':
+                self._send_json(200, backend.stats)
+            else:
+                self._send_json(404, {'error': {'message': 'not found'}})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                self._send_json(404, {'error': {'message': 'not found'}})
+                return
+
+            backend.count('requests')
+
+            # 吞吐上限：超过速率直接返回429，并给出Retry-After
+            if backend.bucket is not None:
+                wait = backend.bucket.take()
+                if wait > 0:
+                    backend.count('throttled')
+                    self._send_json(429, {'error': {'message': 'rate limited', 'type': 'rate_limit'}},
+                                    {'Retry-After': f"{wait:.2f}"})
+                    return
+
+            if random.random() < backend.rate_429:
+                backend.count('throttled')
+                self._send_json(429, {'error': {'message': 'injected 429', 'type': 'rate_limit'}},
+                                {'Retry-After': str(backend.retry_after)})
+                return
+
+            time.sleep(backend.latency())
+
+            if random.random() < backend.error_rate:
+                backend.count('errors')
+                self._send_json(500, {'error': {'message': 'injected server error'}})
+                return
+
+            messages = request.get('messages', [])
+            reply = backend.reply_for(messages)
+            is_reask = '格式不符合要求' in str(messages[0].get('content', '')) if messages else False
+            if (request.get('response_format') or {}).get('type') == 'json_object':
+                reply = as_json_reply(reply)
+            elif not is_reask and random.random() < backend.malformed_rate:
+                reply = malform(reply)
+            prompt_tokens = sum(estimate_tokens(str(m.get('content', ''))) for m in messages)
+            usage = {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': estimate_tokens(reply),
+                'total_tokens': prompt_tokens + estimate_tokens(reply),
+            }
+            backend.count('ok')
+
+            model = request.get('model', 'mock')
+            created = int(time.time())
+            if request.get('stream'):
+                self._stream(reply, model, created, usage)
+                return
+
+            self._send_json(200, {
+                'id': f"chatcmpl-mock-{created}",
+                'object': 'chat.completion',
+                'created': created,
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': reply},
+                    'finish_reason': 'stop',
+                }],
+                'usage': usage,
+            })
+
+        def _stream(self, reply, model, created, usage):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+
+            def send(payload):
+                self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+
+            base = {'id': f"chatcmpl-mock-{created}", 'object': 'chat.completion.chunk',
+                    'created': created, 'model': model}
+            send({**base, 'choices': [{'index': 0, 'delta': {'role': 'assistant'}, 'finish_reason': None}]})
+            step = backend.stream_chunk
+            for i in range(0, len(reply), step):
+                send({**base, 'choices': [{'index': 0, 'delta': {'content': reply[i:i + step]},
+                                           'finish_reason': None}]})
+            send({**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}], 'usage': usage})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+    return Handler
+
+def start_server(port=0, host='127.0.0.1', **backend_options):
+    """在后台线程启动模拟服务，返回 (server, base_url, backend)"""
+    backend = MockBackend(**backend_options)
+    server = ThreadingHTTPServer((host, port), make_handler(backend))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://{host}:{server.server_address[1]}/v1/"
+    return server, base_url, backend
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="本地模拟的OpenAI兼容接口")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', default='fixed:0.2',
+                        help="延迟分布：fixed:S、uniform:A:B、normal:MU:SIGMA、lognormal:MEDIAN:SIGMA")
+    parser.add_argument('--rps', type=float, default=0.0, help="每秒最多接受的请求数，0表示不限")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="随机返回429的概率")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="随机返回500的概率")
+    parser.add_argument('--retry-after', type=float, default=1.0, help="注入429时的Retry-After秒数")
+    parser.add_argument('--responses', help="录制回复文件（.jsonl 或以两个空行分隔的文本）")
+    parser.add_argument('--stream-chunk', type=int, default=8, help="流式输出时每个分片的字符数")
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help="随机注入格式偏差的概率")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    responses = load_responses(args.responses) if args.responses else None
+    server, base_url, _ = start_server(
+        port=args.port, host=args.host, latency=args.latency, rps=args.rps,
+        rate_429=args.rate_429, error_rate=args.error_rate, retry_after=args.retry_after,
+        responses=responses, stream_chunk=args.stream_chunk, malformed_rate=args.malformed_rate
+    )
+    print(f"模拟接口已启动：{base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    sys.exit(main())
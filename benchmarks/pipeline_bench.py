@@ -0,0 +1,184 @@
+"""步骤3流水线端到端基准测试（使用本地模拟接口，无需API密钥和网络）
+
+依次驱动 extract_content（经 run_extraction 并发调用）、generate_main_title 和
+create_ppt，输出单块延迟的 p50/p95、每秒处理块数以及导出耗时。
+
+示例：
+    python benchmarks/pipeline_bench.py --chunks 20 --latency lognormal:0.8:0.4 --rps 8
+    python benchmarks/pipeline_bench.py --base-url http://127.0.0.1:8900/v1/ --json result.json
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_llm_server import start_server
+
+def percentile(values, q):
+    """按最近秩法计算百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def synthetic_chunks(count, size, seed=0):
+    """生成指定数量和长度的中文测试文本块"""
+    rng = random.Random(seed)
+    sentences = [
+        "本季度公司营业收入同比增长百分之十二，主要来自海外市场的扩张。",
+        "研发投入持续增加，新产品线预计在明年第二季度正式上线。",
+        "供应链方面，核心零部件的交付周期缩短至三周以内。",
+        "客户满意度调查显示，售后服务的响应速度仍有提升空间。",
+        "团队将在下半年推进数字化转型，重点建设数据中台。",
+    ]
+    chunks = []
+    for _ in range(count):
+        text = ""
+        while len(text) < size:
+            text += rng.choice(sentences)
+        chunks.append(text[:size])
+    return chunks
+
+def run_benchmark(base_url, chunks, api_key='mock-key', prompt_variant='full', json_mode=False):
+    """运行一次完整流水线并返回统计结果"""
+    import app_new
+    import metrics
+
+    latencies = []
+    lock = threading.Lock()
+    original_extract = app_new.extract_content
+
+    def timed_extract(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original_extract(*args, **kwargs)
+        finally:
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    app_new.extract_content = timed_extract
+    try:
+        start = time.perf_counter()
+        results, errors = app_new.run_extraction(chunks, api_key, base_url,
+                                                 prompt_variant=prompt_variant,
+                                                 json_mode=json_mode,
+                                                 # 测试文本块由少量句子拼成，关闭去重以测量每块一次的调用
+                                                 deduplicate=False)
+        extraction_time = time.perf_counter() - start
+    finally:
+        app_new.extract_content = original_extract
+
+    extracted_contents = [item for item in results if item]
+    stages = metrics.snapshot()
+    usage = stages.get('llm_extract', {})
+
+    start = time.perf_counter()
+    main_title = app_new.generate_main_title(extracted_contents, api_key, base_url)
+    title_time = time.perf_counter() - start
+
+    original_title = app_new.generate_main_title
+
+    def generate_title(contents):
+        return original_title(contents, api_key, base_url)
+
+    # 完整导出（含一次总标题生成）
+    start = time.perf_counter()
+    app_new.generate_main_title = generate_title
+    try:
+        ppt_path = app_new.create_ppt(extracted_contents)
+        export_time = time.perf_counter() - start
+        os.unlink(ppt_path)
+
+        # 增量导出：首次填充缓存，修改一页后再次导出
+        from incremental_export import IncrementalExporter
+        exporter = IncrementalExporter()
+        exporter.export(extracted_contents, generate_title)
+        if extracted_contents:
+            extracted_contents[0] = dict(extracted_contents[0], content=extracted_contents[0]['content'] + "\n补充说明")
+        start = time.perf_counter()
+        exporter.export(extracted_contents, generate_title)
+        incremental_time = time.perf_counter() - start
+    finally:
+        app_new.generate_main_title = original_title
+
+    return {
+        'chunks': len(chunks),
+        'succeeded': len(extracted_contents),
+        'failed': len(errors),
+        'extraction_seconds': round(extraction_time, 4),
+        'chunks_per_second': round(len(chunks) / extraction_time, 3) if extraction_time else 0.0,
+        'chunk_latency_p50': round(percentile(latencies, 50), 4),
+        'chunk_latency_p95': round(percentile(latencies, 95), 4),
+        'prompt_tokens_per_chunk': round(usage.get('prompt_tokens', 0) / max(len(chunks), 1), 1),
+        'completion_tokens_per_chunk': round(usage.get('completion_tokens', 0) / max(len(chunks), 1), 1),
+        'format_reasks': stages.get('llm_reask', {}).get('count', 0),
+        # 各模型档位的请求数和平均延迟（含总标题生成）
+        'routing': {
+            stage[len('route_'):]: {
+                'count': stats['count'],
+                'mean_seconds': round(stats['seconds'] / max(stats['count'], 1), 4),
+            }
+            for stage, stats in metrics.snapshot().items() if stage.startswith('route_')
+        },
+        'title_seconds': round(title_time, 4),
+        'main_title': main_title,
+        'export_seconds': round(export_time, 4),
+        'incremental_export_seconds': round(incremental_time, 4),
+    }
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="步骤3流水线端到端基准测试")
+    parser.add_argument('--base-url', help="已运行的OpenAI兼容接口地址；不指定时自动启动本地模拟接口")
+    parser.add_argument('--chunks', type=int, default=20, help="文本块数量")
+    parser.add_argument('--chunk-size', type=int, default=800, help="每个文本块的字符数")
+    parser.add_argument('--latency', default='lognormal:0.5:0.3', help="模拟接口的延迟分布")
+    parser.add_argument('--rps', type=float, default=0.0, help="模拟接口每秒最多接受的请求数")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="模拟接口随机返回429的概率")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="模拟接口随机返回500的概率")
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help="模拟接口随机注入格式偏差的概率")
+    parser.add_argument('--json-mode', action='store_true', help="使用JSON模式请求结构化输出")
+    parser.add_argument('--responses', help="模拟接口使用的录制回复文件")
+    parser.add_argument('--prompt-variant', choices=['full', 'compact'], default='full',
+                        help="内容提炼使用的提示词版本")
+    parser.add_argument('--json', help="将结果写入JSON文件")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    server = backend = None
+    base_url = args.base_url
+    if not base_url:
+        from mock_llm_server import load_responses
+        responses = load_responses(args.responses) if args.responses else None
+        server, base_url, backend = start_server(
+            latency=args.latency, rps=args.rps, rate_429=args.rate_429,
+            error_rate=args.error_rate, responses=responses, malformed_rate=args.malformed_rate
+        )
+
+    try:
+        result = run_benchmark(base_url, synthetic_chunks(args.chunks, args.chunk_size),
+                               prompt_variant=args.prompt_variant, json_mode=args.json_mode)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    if backend is not None:
+        result['server'] = dict(backend.stats)
+
+    for key, value in result.items():
+        print(f"{key:28s} {value}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main()
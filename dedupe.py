@@ -0,0 +1,107 @@
+import os
+import re
+import zlib
+import hashlib
+import functools
+from collections import defaultdict
+
+# 字符级shingle长度（中文不分词，按连续字符切片）
+SHINGLE_SIZE = 5
+# MinHash签名长度，分为 BANDS 段做局部敏感哈希
+NUM_PERM = 64
+BANDS = 16
+# 估计的Jaccard相似度不低于该值时视为重复，可通过环境变量 PPT_DEDUPE_THRESHOLD 调整
+THRESHOLD = float(os.environ.get('PPT_DEDUPE_THRESHOLD', 0.8))
+# 规范化后短于该长度的文本块只做完全相同的判断
+MIN_CHARS = 30
+
+@functools.lru_cache(maxsize=None)
+def _hash_params():
+    """MinHash的哈希参数；numpy在首次计算签名时才导入，不影响应用启动"""
+    import numpy as np
+    # 固定种子，使签名在各进程间一致
+    rng = np.random.RandomState(20240601)
+    a = rng.randint(1, 2 ** 32 - 1, size=NUM_PERM, dtype=np.uint64)
+    b = rng.randint(0, 2 ** 32 - 1, size=NUM_PERM, dtype=np.uint64)
+    return a, b, np.uint64(4294967311), np.uint64(0xFFFFFFFF)
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+def normalize(text):
+    """去掉空白和标点并转为小写，排版差异不影响判断"""
+    return _NON_WORD.sub('', text).lower()
+
+def shingles(text):
+    """规范化文本的字符shingle哈希集合"""
+    if len(text) <= SHINGLE_SIZE:
+        return {zlib.crc32(text.encode('utf-8'))}
+    return {zlib.crc32(text[i:i + SHINGLE_SIZE].encode('utf-8'))
+            for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+def minhash(text):
+    """计算规范化文本的MinHash签名"""
+    import numpy as np
+    a, b, prime, max_hash = _hash_params()
+    hashes = np.fromiter(shingles(text), dtype=np.uint64)
+    values = ((np.outer(a, hashes) + b[:, None]) % prime) & max_hash
+    return values.min(axis=1)
+
+def similarity(sig_a, sig_b):
+    """由签名估计Jaccard相似度"""
+    import numpy as np
+    return float(np.count_nonzero(sig_a == sig_b)) / NUM_PERM
+
+class DuplicateIndex:
+    """按顺序加入文本块，返回每个块与之前哪个块重复"""
+
+    def __init__(self, threshold=THRESHOLD):
+        self.threshold = threshold
+        self._exact = {}
+        self._signatures = {}
+        self._buckets = defaultdict(list)
+        self._count = 0
+
+    def add(self, chunk):
+        """加入文本块，重复时返回 (代表块序号, 相似度)，否则返回None
+
+        代表块为最早出现且本身不重复的块，重复关系不会链式传递。
+        """
+        index = self._count
+        self._count += 1
+        text = normalize(chunk)
+        digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        if digest in self._exact:
+            return self._exact[digest], 1.0
+        if len(text) < MIN_CHARS:
+            self._exact[digest] = index
+            return None
+
+        signature = minhash(text)
+        rows = NUM_PERM // BANDS
+        bands = [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(BANDS)]
+        candidates = sorted({i for band in bands for i in self._buckets.get(band, ())})
+        for candidate in candidates:
+            score = similarity(signature, self._signatures[candidate])
+            if score >= self.threshold:
+                return candidate, score
+
+        self._exact[digest] = index
+        self._signatures[index] = signature
+        for band in bands:
+            self._buckets[band].append(index)
+        return None
+
+def find_duplicates(chunks, threshold=THRESHOLD):
+    """返回 {重复块序号: (代表块序号, 相似度)}"""
+    index = DuplicateIndex(threshold)
+    duplicates = {}
+    for i, chunk in enumerate(chunks):
+        match = index.add(chunk)
+        if match is not None:
+            duplicates[i] = match
+    return duplicates
+
+def unique_chunks(chunks, threshold=THRESHOLD):
+    """去掉重复块后需要实际提炼的文本块"""
+    duplicates = find_duplicates(chunks, threshold)
+    return [chunk for i, chunk in enumerate(chunks) if i not in duplicates]
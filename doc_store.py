@@ -0,0 +1,285 @@
+import os
+import sys
+import json
+import zlib
+import time
+import uuid
+import logging
+import tempfile
+import threading
+import weakref
+from collections.abc import MutableSequence
+
+logger = logging.getLogger(__name__)
+
+# 单个会话文档的最大字符数，超出时拒绝载入
+MAX_DOCUMENT_CHARS = int(os.environ.get('PPT_DOC_MAX_CHARS', 5_000_000))
+# 会话空闲超过该秒数后，文档转存到磁盘
+IDLE_SECONDS = float(os.environ.get('PPT_DOC_IDLE_SECONDS', 600))
+# 全部会话常驻内存的文档总字节上限，超出时按最近最少使用转存
+MEMORY_BUDGET = int(os.environ.get('PPT_DOC_MEMORY_BUDGET', 256 * 1024 * 1024))
+# 转存目录
+SPILL_DIR = os.environ.get(
+    'PPT_DOC_SPILL_DIR',
+    os.path.join(tempfile.gettempdir(), 'ppt_doc_store')
+)
+# 定位文本块片段时用于搜索的前缀长度
+ANCHOR_LENGTH = 32
+
+_lock = threading.Lock()
+_stores = weakref.WeakSet()
+
+class DocumentTooLarge(ValueError):
+    pass
+
+def _locate(chunk, text, cursor):
+    """把文本块表示为原文中的若干 (起点, 终点) 片段，无法对应原文时返回None
+
+    分割器会去掉块之间的空白，合并相邻块时也不保留分隔符，
+    因此一个块通常对应原文中一段或几段连续文本。
+    """
+    segments = []
+    remaining = 0
+    while remaining < len(chunk):
+        start = text.find(chunk[remaining:remaining + ANCHOR_LENGTH], cursor)
+        if start < 0:
+            return None
+        length = 0
+        limit = min(len(chunk) - remaining, len(text) - start)
+        while length < limit and text[start + length] == chunk[remaining + length]:
+            length += 1
+        segments.append((start, start + length))
+        remaining += length
+        cursor = start + length
+    return tuple(segments)
+
+def _remove_file(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+class ChunkList(MutableSequence):
+    """文本块列表视图：未修改的块只保存原文片段，修改过的块保存替换文本"""
+
+    def __init__(self, store):
+        self._store = store
+
+    def _entries(self):
+        return self._store._load()['edited_chunks']
+
+    def _mutate(self, fn):
+        with self._store._lock:
+            fn(self._entries())
+        self._store._touch()
+
+    def __len__(self):
+        return len(self._entries())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._store._resolve(entry) for entry in self._entries()[index]]
+        return self._store._resolve(self._entries()[index])
+
+    def __setitem__(self, index, value):
+        def update(entries):
+            entry = entries[index]
+            # 内容与原文片段相同时保留片段，避免为控件返回的等值字符串再保存一份
+            if isinstance(entry, str) or self._store._resolve(entry) != value:
+                entries[index] = self._store._compact(value)
+        self._mutate(update)
+
+    def __delitem__(self, index):
+        def delete(entries):
+            del entries[index]
+        self._mutate(delete)
+
+    def insert(self, index, value):
+        self._mutate(lambda entries: entries.insert(index, value))
+
+    def copy(self):
+        return list(self)
+
+class DocumentStore:
+    """会话文档存储：原文只保存一份，文本块以原文片段或替换文本表示，空闲时转存磁盘"""
+
+    def __init__(self):
+        self._data = self._empty()
+        self._spill_path = None
+        self._finalizer = None
+        # 其他会话触发转存时，与本会话的读写互斥
+        self._lock = threading.RLock()
+        self.last_access = time.time()
+        self.edited_chunks = ChunkList(self)
+        with _lock:
+            _stores.add(self)
+
+    @staticmethod
+    def _empty():
+        # edited 为 None 表示与原文相同；chunks/edited_chunks 中的元组为基于 edited 文本的片段
+        return {'canonical': None, 'edited': None, 'chunks': None, 'edited_chunks': []}
+
+    def _touch(self):
+        self.last_access = time.time()
+
+    def _load(self):
+        """返回文档数据，已转存时从磁盘读回"""
+        self._touch()
+        with self._lock:
+            if self._data is None:
+                with open(self._spill_path, 'rb') as f:
+                    data = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+                for key in ('chunks', 'edited_chunks'):
+                    if data[key] is not None:
+                        data[key] = [entry if isinstance(entry, str) else tuple(map(tuple, entry))
+                                     for entry in data[key]]
+                self._data = data
+                logger.info("会话文档已从磁盘读回：%s", self._spill_path)
+            return self._data
+
+    def _base(self):
+        data = self._load()
+        return data['canonical'] if data['edited'] is None else data['edited']
+
+    def _resolve(self, entry):
+        if isinstance(entry, str):
+            return entry
+        base = self._base()
+        return ''.join(base[start:end] for start, end in entry)
+
+    def _compact(self, chunk, cursor=0):
+        base = self._base()
+        return (base and _locate(chunk, base, cursor)) or chunk
+
+    @property
+    def extracted_text(self):
+        return self._load()['canonical']
+
+    @property
+    def edited_text(self):
+        return self._base()
+
+    @edited_text.setter
+    def edited_text(self, text):
+        with self._lock:
+            data = self._load()
+            if text != self.edited_text:
+                # 文本块基于编辑后的文本定位，文本变化后需重新分割
+                data['chunks'] = None
+                data['edited_chunks'] = []
+            data['edited'] = None if text == data['canonical'] else text
+
+    def load(self, text):
+        """载入新提取的文章，清空之前的编辑和分割结果"""
+        if text is not None and len(text) > MAX_DOCUMENT_CHARS:
+            raise DocumentTooLarge(f"文档超过 {MAX_DOCUMENT_CHARS} 个字符")
+        with self._lock:
+            self._discard_spill()
+            self._data = self._empty()
+            self._data['canonical'] = text
+        self._touch()
+
+    def revert(self):
+        """放弃对全文的编辑"""
+        self.edited_text = self.extracted_text
+
+    def set_chunks(self, chunks):
+        """保存分割结果：能在原文中定位的块只记录片段"""
+        entries = []
+        cursor = 0
+        for chunk in chunks:
+            entry = self._compact(chunk, cursor)
+            if not isinstance(entry, str):
+                cursor = entry[-1][1] if entry else cursor
+            entries.append(entry)
+        with self._lock:
+            data = self._load()
+            data['chunks'] = entries
+            data['edited_chunks'] = list(entries)
+
+    def clear_chunks(self):
+        with self._lock:
+            data = self._load()
+            data['chunks'] = None
+            data['edited_chunks'] = []
+
+    @property
+    def has_chunks(self):
+        return self._load()['chunks'] is not None
+
+    def chunk(self, index):
+        """返回第 index 个文本块（编辑后），不存在时返回空字符串"""
+        entries = self._load()['edited_chunks']
+        return self._resolve(entries[index]) if 0 <= index < len(entries) else ''
+
+    def reset(self):
+        self.load(None)
+
+    def memory_bytes(self):
+        """估算常驻内存的字节数，已转存时为0"""
+        data = self._data
+        if data is None:
+            return 0
+        total = sum(sys.getsizeof(data[key]) for key in ('canonical', 'edited') if data[key] is not None)
+        for key in ('chunks', 'edited_chunks'):
+            for entry in data[key] or []:
+                total += sys.getsizeof(entry) + (0 if isinstance(entry, str) else 56 * len(entry))
+        return total
+
+    def stats(self):
+        """返回内存使用情况，用于界面展示"""
+        data = self._data
+        return {
+            'resident_bytes': self.memory_bytes(),
+            'spilled': data is None,
+            'chunks': None if data is None else len(data['edited_chunks']),
+            'overrides': None if data is None else sum(isinstance(e, str) for e in data['edited_chunks']),
+        }
+
+    def spill(self):
+        """把文档写入磁盘并释放内存"""
+        with self._lock:
+            if self._data is None or self._data['canonical'] is None:
+                return False
+            os.makedirs(SPILL_DIR, exist_ok=True)
+            if self._spill_path is None:
+                self._spill_path = os.path.join(SPILL_DIR, f"{uuid.uuid4().hex}.json.z")
+                # 会话结束、存储被回收时删除转存文件
+                self._finalizer = weakref.finalize(self, _remove_file, self._spill_path)
+            payload = zlib.compress(json.dumps(self._data, ensure_ascii=False).encode('utf-8'), 1)
+            tmp_path = f"{self._spill_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, self._spill_path)
+            self._data = None
+        logger.info("会话文档已转存磁盘：%s（%d 字节）", self._spill_path, len(payload))
+        return True
+
+    def _discard_spill(self):
+        if self._spill_path is not None:
+            self._finalizer()
+            self._finalizer = None
+            self._spill_path = None
+
+def total_memory_bytes():
+    """返回本进程全部会话文档常驻内存的字节数"""
+    with _lock:
+        stores = list(_stores)
+    return sum(store.memory_bytes() for store in stores)
+
+def enforce_limits(current=None):
+    """转存空闲会话的文档；总内存超出预算时，再按最近最少使用转存（当前会话除外）"""
+    with _lock:
+        stores = [store for store in _stores if store is not current]
+    now = time.time()
+    for store in stores:
+        if now - store.last_access > IDLE_SECONDS:
+            store.spill()
+
+    total = total_memory_bytes()
+    for store in sorted(stores, key=lambda s: s.last_access):
+        if total <= MEMORY_BUDGET:
+            break
+        size = store.memory_bytes()
+        if store.spill():
+            total -= size
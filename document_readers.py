@@ -0,0 +1,219 @@
+"""上传文件的解析：TXT/DOCX读取、多文件并行解析和合并"""
+import io
+import os
+import re
+import codecs
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# 本模块不导入Streamlit，进程池的工作进程可以直接导入
+from metrics import span, traced, text_bytes
+import media_utils
+from profiling import profiled
+from streaming_pipeline import read_docx_stream, _stream_encoding
+
+# 解析进程数，可通过环境变量 PPT_PARSE_WORKERS 调整
+MAX_WORKERS = int(os.environ.get('PPT_PARSE_WORKERS', 0) or min(8, os.cpu_count() or 1))
+# 总大小低于该字节数时在当前进程中依次解析，进程间传输的开销比解析本身更大
+PARALLEL_MIN_BYTES = 1024 * 1024
+# 编码检测只使用开头的这些字节（chardet检测全文很慢）
+DETECT_SAMPLE_BYTES = 64 * 1024
+
+SECTION_HEADING = "【文档：{name}】"
+_SECTION_PATTERN = re.compile(r'^【文档：[^\n】]+】[ \t]*$', re.M)
+_BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def detect_encoding(file_content):
+    """检测文件编码"""
+    import chardet
+    result = chardet.detect(file_content)
+    return result['encoding']
+
+@traced('read_txt', bytes_in=lambda file: file.tell(), bytes_out=text_bytes)
+def extract_text_from_txt(file):
+    """从txt文件中提取文本"""
+    try:
+        content = file.read()
+        return decode_text(content)
+    except Exception as e:
+        return f"错误：无法读取TXT文件。原因：{str(e)}"
+
+@profiled('read_docx')
+@traced('read_docx', bytes_in=lambda file: file.tell(), bytes_out=text_bytes)
+def extract_text_from_docx(file):
+    """从docx文件中提取文本"""
+    try:
+        # 检查文件大小
+        file.seek(0, 2)
+        file_size = file.tell()
+        file.seek(0)
+        
+        if file_size == 0:
+            return "错误：文件为空。请确保上传了有效的Word文档。"
+            
+        file_content = file.read()
+        file_in_memory = io.BytesIO(file_content)
+        
+        try:
+            from docx import Document
+            doc = Document(file_in_memory)
+        except Exception as doc_error:
+            if "There is no item named 'NULL' in the archive" in str(doc_error):
+                return "错误：文件格式不正确。请确保：\n1. 文件是真正的.docx格式（不是重命名的.doc文件）\n2. 文件未被损坏\n3. 文件不是空白文档"
+            else:
+                return f"错误：无法读取DOCX文件。原因：{str(doc_error)}"
+        
+        full_text = []
+        for para in doc.paragraphs:
+            if para.text.strip():
+                full_text.append(para.text)
+        
+        text = '\n\n'.join(full_text)
+        
+        if not text:
+            return "错误：文档内容为空。请确保文档包含文本内容。"
+            
+        return text
+        
+    except Exception as e:
+        error_msg = str(e)
+        if "Permission denied" in error_msg:
+            return "错误：无法访问文件。请确保文件未被其他程序占用。"
+        elif "not a zip file" in error_msg.lower():
+            return "错误：文件格式不正确。请确保上传的是正确的.docx格式文件。"
+        else:
+            return f"错误：无法读取DOCX文件。原因：{error_msg}"
+
+def decode_text(content):
+    """解码文本：有BOM或是合法UTF-8时直接解码，否则用开头部分检测编码，检测结果解码失败时再检测全文"""
+    for bom, encoding in _BOMS:
+        if content.startswith(bom):
+            return content.decode(encoding)
+    try:
+        return content.decode('utf-8')
+    except UnicodeDecodeError:
+        pass
+    try:
+        return content.decode(_stream_encoding(detect_encoding(content[:DETECT_SAMPLE_BYTES])))
+    except (UnicodeDecodeError, LookupError):
+        return content.decode(detect_encoding(content))
+
+def read_docx_text(data):
+    """直接解析docx中的正文XML，比python-docx构建完整文档对象快；嵌入的图片替换为图片标记"""
+    images = []
+
+    def on_image(blob):
+        images.append(blob)
+        return media_utils.placeholder(len(images) - 1)
+    text = "".join(read_docx_stream(io.BytesIO(data), on_image)).rstrip()
+    return media_utils.embed_images(text, images)
+
+def read_document(name, data):
+    """解析一个上传文件，返回文本（失败时为"错误："开头的说明）"""
+    lower = name.lower()
+    if lower.endswith('.txt'):
+        return extract_text_from_txt(io.BytesIO(data))
+    if lower.endswith('.docx'):
+        try:
+            text = read_docx_text(data)
+            if text:
+                return text
+        except Exception:
+            pass
+        # 快速解析失败时由python-docx解析，并给出具体的错误说明
+        return extract_text_from_docx(io.BytesIO(data))
+    return "错误：不支持的文件格式"
+
+def get_pool():
+    """返回进程内共享的解析进程池（首次使用时创建）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            import multiprocessing
+            # 使用spawn启动工作进程：Streamlit进程中有多个线程，fork可能复制到被其他线程持有的锁
+            _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+def parse_files(files):
+    """解析多个上传文件 [(文件名, 字节), ...]，按原顺序返回各文件的文本"""
+    total = sum(len(data) for _, data in files)
+    with span('parse_files', bytes_in=total, files=len(files)) as data:
+        if len(files) == 1 or total < PARALLEL_MIN_BYTES or MAX_WORKERS < 2:
+            texts = [read_document(name, content) for name, content in files]
+        else:
+            try:
+                pool = get_pool()
+                # 大文件先提交，总耗时接近最大的那个文件的解析时间
+                order = sorted(range(len(files)), key=lambda i: -len(files[i][1]))
+                futures = {i: pool.submit(read_document, *files[i]) for i in order}
+                texts = [futures[i].result() for i in range(len(files))]
+            except BrokenProcessPool:
+                _reset_pool()
+                texts = [read_document(name, content) for name, content in files]
+        data['bytes_out'] = sum(text_bytes(text) for text in texts)
+    return texts
+
+def combine_documents(documents):
+    """把多个文档 [(文件名, 文本), ...] 按顺序合并，每个文档前加章节标题行"""
+    return "\n\n".join(
+        f"{SECTION_HEADING.format(name=name)}\n\n{text.strip()}" for name, text in documents
+    )
+
+def split_sections(text):
+    """按章节标题行切分合并后的文档，没有章节标题时返回整篇文本"""
+    starts = [match.start() for match in _SECTION_PATTERN.finditer(text)]
+    if not starts:
+        return [text]
+    sections = []
+    if text[:starts[0]].strip():
+        sections.append(text[:starts[0]])
+    for start, end in zip(starts, starts[1:] + [len(text)]):
+        sections.append(text[start:end])
+    return sections
+
+def merge_sections(sections, total):
+    """章节数多于块数时，反复把最短的章节与相邻较短的章节合并，使章节数不超过块数"""
+    sections = list(sections)
+    while len(sections) > max(total, 1):
+        i = min(range(len(sections)), key=lambda k: len(sections[k]))
+        if i == 0:
+            j = 1
+        elif i == len(sections) - 1:
+            j = i - 1
+        else:
+            j = i - 1 if len(sections[i - 1]) <= len(sections[i + 1]) else i + 1
+        a, b = min(i, j), max(i, j)
+        # 章节是原文的连续片段，相邻章节直接拼接即还原原文
+        sections[a:b + 1] = [sections[a] + sections[b]]
+    return sections
+
+def allocate_chunks(lengths, total):
+    """按各章节长度分配文本块数，每个章节至少一块（章节数不超过 total 时总块数等于 total）"""
+    counts = [1] * len(lengths)
+    remaining = total - len(lengths)
+    if remaining <= 0:
+        return counts
+    size = sum(lengths) or 1
+    shares = [remaining * length / size for length in lengths]
+    for i, share in enumerate(shares):
+        counts[i] += int(share)
+    # 余下的块按小数部分从大到小分配
+    leftover = total - sum(counts)
+    for i in sorted(range(len(shares)), key=lambda i: -(shares[i] - int(shares[i])))[:leftover]:
+        counts[i] += 1
+    return counts
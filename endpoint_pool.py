@@ -0,0 +1,353 @@
+"""多个OpenAI兼容端点组成的调用池：健康检查、最少进行中请求分配和对冲请求
+
+- 每次请求选择健康端点中进行中请求最少的一个（相同时选近期延迟较低的）
+- 端点连续失败达到阈值，或其调用闸门的熔断器打开时，暂时不再分配请求；冷却后重新参与分配
+- 请求失败（重试耗尽或熔断）时换到其他健康端点重试
+- 开启对冲时，请求耗时超过同类请求近期的p95后，向另一个端点发送相同请求，
+  采用先返回的结果，并关闭另一个请求的连接（服务端可据此停止生成）；
+  对冲请求数不超过总请求数的 HEDGE_BUDGET
+
+环境变量：
+    PPT_LLM_ENDPOINTS   所有会话共用的备用端点（密钥不在界面中显示），每行（或用分号分隔）一个"基础URL 密钥 [模型名]"
+    PPT_HEDGE=1         默认开启对冲请求
+"""
+import os
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextvars import copy_context
+
+import metrics
+from llm_client import get_gate, is_retryable, LLMCallError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENDPOINTS = os.environ.get('PPT_LLM_ENDPOINTS', '')
+HEDGE_DEFAULT = os.environ.get('PPT_HEDGE', '') not in ('', '0')
+# 对冲阈值取同类请求近期延迟的该分位数；样本不足时不对冲
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+# 对冲请求占总请求数的上限，避免端点整体变慢时请求量翻倍
+HEDGE_BUDGET = 0.1
+LATENCY_WINDOW = 200
+# 连续失败达到该次数后端点暂停分配的秒数
+FAILURE_THRESHOLD = 3
+COOLDOWN_SECONDS = 30.0
+# 池中还有其他健康端点时，单个端点上的重试次数（其余失败直接换端点）
+POOLED_ATTEMPTS = 2
+# 延迟滑动平均的权重
+EWMA_WEIGHT = 0.2
+
+class HedgeCancelled(Exception):
+    """对冲中落败的请求被取消"""
+
+# 端点实例在共用它的全部池之间共享，端点状态（进行中请求数、延迟、失败次数）统一由这把锁保护
+_endpoint_lock = threading.Lock()
+
+class Endpoint:
+    """单个API端点及其健康状态，同一进程中相同配置的端点共用一个实例"""
+
+    def __init__(self, base_url, api_key, model=None):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model or None
+        self.outstanding = 0
+        self.latency = None
+        self.requests = 0
+        self.errors = 0
+        self.failures = 0
+        self.down_until = 0.0
+
+    @property
+    def label(self):
+        return f"{self.base_url}（{self.model}）" if self.model else self.base_url
+
+    def healthy(self, now=None):
+        now = time.monotonic() if now is None else now
+        return now >= self.down_until and get_gate(self.base_url, self.api_key).breaker.state != 'open'
+
+_ssl_context = None
+_async_client = None
+_client_lock = threading.Lock()
+
+def _shared_ssl_context():
+    """加载证书较慢，对冲请求的独立连接共用一个SSL上下文"""
+    global _ssl_context
+    with _client_lock:
+        if _ssl_context is None:
+            import httpx
+            _ssl_context = httpx.create_ssl_context()
+        return _ssl_context
+
+def shared_async_client():
+    """按端点创建的模型客户端只用同步调用，共用一个异步http客户端以免每次创建"""
+    global _async_client
+    with _client_lock:
+        if _async_client is None:
+            import httpx
+            _async_client = httpx.AsyncClient(timeout=600)
+        return _async_client
+
+class _Attempt:
+    """一次在某个端点上的请求，可从其他线程取消"""
+
+    def __init__(self, endpoint, dedicated_client):
+        self.endpoint = endpoint
+        self.cancelled = threading.Event()
+        self.client = None
+        self.future = None
+        if dedicated_client:
+            # 对冲时每次请求使用独立的连接，取消时关闭连接即可中断进行中的请求
+            try:
+                from openai import DefaultHttpxClient
+                self.client = DefaultHttpxClient(verify=_shared_ssl_context())
+            except ImportError:
+                import httpx
+                self.client = httpx.Client(timeout=600, verify=_shared_ssl_context())
+
+    def cancel(self):
+        """取消请求，返回请求是否尚未开始执行"""
+        self.cancelled.set()
+        not_started = self.future is not None and self.future.cancel()
+        if self.client is not None:
+            self.client.close()
+        return not_started
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix='llm-hedge')
+        return _executor
+
+class EndpointPool:
+    """端点池：第一个端点为主端点（界面中设置的API），其余为备用端点"""
+
+    def __init__(self, endpoints, hedge=False):
+        self.endpoints = list(endpoints)
+        self.hedge = hedge and len(self.endpoints) > 1
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._requests = 0
+        self._hedges = 0
+        self._hedge_wins = 0
+
+    @property
+    def primary(self):
+        return self.endpoints[0]
+
+    def max_concurrency(self):
+        """池中各端点并发上限之和，用作提炼线程数"""
+        return sum(get_gate(endpoint.base_url, endpoint.api_key).limiter.max_limit for endpoint in self.endpoints)
+
+    # 分配与健康状态
+
+    def pick(self, exclude=()):
+        """选择进行中请求最少的健康端点；全部不健康时选最早恢复的一个，没有可选端点时返回None"""
+        now = time.monotonic()
+        with _endpoint_lock:
+            candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+            if not candidates:
+                return None
+            healthy = [endpoint for endpoint in candidates if endpoint.healthy(now)]
+            if healthy:
+                endpoint = min(healthy, key=lambda e: (e.outstanding, e.latency if e.latency is not None else 0.0))
+            else:
+                endpoint = min(candidates, key=lambda e: e.down_until)
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def _finish(self, endpoint, stage, latency=None, error=None):
+        if error is None:
+            with self._lock:
+                self._latencies.setdefault(stage, deque(maxlen=LATENCY_WINDOW)).append(latency)
+        with _endpoint_lock:
+            endpoint.outstanding -= 1
+            if error is None:
+                endpoint.failures = 0
+                endpoint.latency = latency if endpoint.latency is None else (
+                    endpoint.latency + EWMA_WEIGHT * (latency - endpoint.latency))
+            elif not isinstance(error, HedgeCancelled):
+                endpoint.errors += 1
+                endpoint.failures += 1
+                if endpoint.failures >= FAILURE_THRESHOLD:
+                    endpoint.down_until = time.monotonic() + COOLDOWN_SECONDS
+                    logger.warning("端点 %s 连续失败 %d 次，暂停分配 %.0f 秒",
+                                   endpoint.label, endpoint.failures, COOLDOWN_SECONDS)
+
+    def hedge_delay(self, stage):
+        """同类请求近期延迟的p95，样本不足时返回None"""
+        with self._lock:
+            samples = sorted(self._latencies.get(stage, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * HEDGE_PERCENTILE))]
+
+    def _hedge_allowed(self):
+        with self._lock:
+            if self._hedges + 1 > HEDGE_BUDGET * self._requests:
+                return False
+            self._hedges += 1
+            return True
+
+    # 调用
+
+    def _run(self, attempt, fn, stage, tokens, attempts):
+        """在指定端点上执行一次请求（经过该端点的调用闸门），结束时更新端点状态"""
+        def call():
+            if attempt.cancelled.is_set():
+                raise HedgeCancelled()
+            try:
+                return fn(attempt.endpoint, attempt.client)
+            except Exception:
+                if attempt.cancelled.is_set():
+                    raise HedgeCancelled()
+                raise
+
+        start = time.monotonic()
+        try:
+            result = get_gate(attempt.endpoint.base_url, attempt.endpoint.api_key).call(call, tokens=tokens, attempts=attempts)
+        except BaseException as e:
+            self._finish(attempt.endpoint, stage, error=e)
+            raise
+        finally:
+            if attempt.client is not None and not attempt.cancelled.is_set():
+                attempt.client.close()
+        self._finish(attempt.endpoint, stage, latency=time.monotonic() - start)
+        return result
+
+    def call(self, fn, stage, tokens=0):
+        """在池中执行请求：fn(端点, http客户端或None) 返回结果；失败时换端点，慢请求可对冲"""
+        with self._lock:
+            self._requests += 1
+        tried = set()
+        last_error = None
+        while True:
+            endpoint = self.pick(exclude=tried)
+            if endpoint is None:
+                raise last_error or LLMCallError("没有可用的API端点")
+            tried.add(endpoint)
+            attempts = POOLED_ATTEMPTS if len(tried) < len(self.endpoints) else None
+            try:
+                if self.hedge:
+                    return self._call_hedged(endpoint, fn, stage, tokens, attempts, tried)
+                return self._run(_Attempt(endpoint, False), fn, stage, tokens, attempts)
+            except Exception as e:
+                if not (isinstance(e, LLMCallError) or is_retryable(e)):
+                    raise
+                last_error = e
+                logger.warning("端点 %s 请求失败，改用其他端点：%s", endpoint.label, e)
+
+    def _call_hedged(self, endpoint, fn, stage, tokens, attempts, tried):
+        primary = _Attempt(endpoint, True)
+        primary.future = _get_executor().submit(copy_context().run, self._run, primary, fn, stage, tokens, attempts)
+        delay = self.hedge_delay(stage)
+        done, _ = wait([primary.future], timeout=delay)
+        if done or delay is None:
+            return primary.future.result()
+
+        if not self._hedge_allowed():
+            return primary.future.result()
+        second = self.pick(exclude=tried)
+        if second is None:
+            return primary.future.result()
+        tried.add(second)
+        hedge = _Attempt(second, True)
+        hedge.future = _get_executor().submit(copy_context().run, self._run, hedge, fn, stage, tokens, attempts)
+        logger.info("请求超过p95（%.2f 秒），向 %s 发送对冲请求", delay, second.label)
+
+        started = time.monotonic()
+        attempts_by_future = {primary.future: primary, hedge.future: hedge}
+        pending = set(attempts_by_future)
+        error = None
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                if future.exception() is None:
+                    winner = attempts_by_future[future]
+                    for other in attempts_by_future.values():
+                        if other is not winner and other.cancel():
+                            # 尚未开始的请求不会经过 _run，在这里归还端点的进行中计数
+                            self._finish(other.endpoint, stage, error=HedgeCancelled())
+                    with self._lock:
+                        self._hedge_wins += int(winner is hedge)
+                    metrics.record('llm_hedge', time.monotonic() - started,
+                                   won=winner is hedge, endpoint=winner.endpoint.base_url)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stats(self):
+        """各端点的状态和对冲统计，用于界面展示"""
+        now = time.monotonic()
+        with _endpoint_lock:
+            endpoints = [{
+                    'endpoint': endpoint.label,
+                    'healthy': endpoint.healthy(now),
+                    'outstanding': endpoint.outstanding,
+                    'latency': endpoint.latency,
+                    'requests': endpoint.requests,
+                    'errors': endpoint.errors,
+            } for endpoint in self.endpoints]
+        with self._lock:
+            return {
+                'endpoints': endpoints,
+                'requests': self._requests,
+                'hedges': self._hedges,
+                'hedge_wins': self._hedge_wins,
+            }
+
+def parse_endpoints(text, default_key=None):
+    """解析备用端点配置：每行（或用分号分隔）一个"基础URL 密钥 [模型名]"，密钥省略时使用默认密钥"""
+    endpoints = []
+    for line in text.replace(';', '\n').splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = line.split()
+        if not parts[0].startswith(('http://', 'https://')):
+            raise ValueError(f"端点地址应以 http:// 或 https:// 开头：{parts[0]}")
+        api_key = parts[1] if len(parts) > 1 and parts[1] != '-' else default_key
+        if not api_key:
+            raise ValueError(f"端点 {parts[0]} 没有设置密钥")
+        endpoints.append((parts[0], api_key, parts[2] if len(parts) > 2 else None))
+    return endpoints
+
+_endpoints = {}
+_pools = {}
+_registry_lock = threading.Lock()
+_current_pool = contextvars.ContextVar('endpoint_pool', default=None)
+
+def get_pool(base_url, api_key, extra=(), hedge=False):
+    """返回主端点加备用端点组成的池（相同配置共用一个池，端点健康状态在全部池之间共享）"""
+    config = ((base_url, api_key, None),) + tuple(extra)
+    with _registry_lock:
+        key = (config, bool(hedge))
+        pool = _pools.get(key)
+        if pool is None:
+            endpoints = []
+            for endpoint_config in config:
+                endpoint = _endpoints.get(endpoint_config)
+                if endpoint is None:
+                    endpoint = _endpoints[endpoint_config] = Endpoint(*endpoint_config)
+                endpoints.append(endpoint)
+            pool = _pools[key] = EndpointPool(endpoints, hedge)
+        return pool
+
+def bind_pool(pool):
+    """设置当前上下文使用的端点池（None 表示只用单个端点），工作线程复制上下文后沿用"""
+    _current_pool.set(pool)
+
+def current_pool(base_url):
+    """返回以 base_url 为主端点的当前端点池，没有时返回None"""
+    pool = _current_pool.get()
+    if pool is not None and pool.primary.base_url == base_url:
+        return pool
+    return None
@@ -0,0 +1,178 @@
+"""本地抽取式摘要：不调用大模型，毫秒级生成草稿幻灯片
+
+句子切分后用TF-IDF向量的余弦相似度构图，以TextRank（PageRank）为句子打分，
+取得分最高的句子按原文顺序组织成与 create_ppt 相同的"1. / a. / -"层级格式，
+标题取权重最高的关键词。中文不分词，使用2-4字的字符片段作为词项。
+"""
+import re
+
+import numpy as np
+
+from media_utils import strip_images
+
+# TextRank参数
+DAMPING = 0.85
+MAX_ITERATIONS = 50
+TOLERANCE = 1e-4
+# 每页最多保留的句子数和关键词数
+MAX_SENTENCES = 6
+MAX_KEYWORDS = 3
+TITLE_MAX_CHARS = 20
+
+_SENTENCE_END = re.compile(r'(?<=[。！？!?；;])|(?<=\.)\s+|\n+')
+_CJK_RUN = re.compile(r'[一-鿿]+')
+_LATIN_WORD = re.compile(r'[A-Za-z][A-Za-z\-]{2,}')
+_NUMBER = re.compile(r'\d+(?:[.,]\d+)*(?:%|％|万|亿|元|个|年|月|日)?')
+_CLAUSE = re.compile(r'[，,：:]')
+
+# 常见虚词开头或结尾的字符片段不作为关键词
+_CJK_STOP_CHARS = set('的了和是在与及或等也而就都将对把被从为以其这那有个之中上下')
+_LATIN_STOPWORDS = {
+    'the', 'and', 'for', 'with', 'that', 'this', 'from', 'are', 'was', 'were', 'will',
+    'has', 'have', 'had', 'but', 'not', 'can', 'its', 'into', 'than', 'also', 'which',
+    'new', 'over', 'still', 'more', 'most', 'such', 'our', 'their', 'they', 'there',
+}
+
+def split_sentences(text):
+    """按中英文句末标点和换行切分句子"""
+    sentences = []
+    for part in _SENTENCE_END.split(text):
+        part = (part or '').strip()
+        if len(part) >= 4:
+            sentences.append(part)
+    return sentences
+
+def analyze(text):
+    """词项：英文单词（小写）和中文2-4字片段"""
+    terms = [word.lower() for word in _LATIN_WORD.findall(text) if word.lower() not in _LATIN_STOPWORDS]
+    for run in _CJK_RUN.findall(text):
+        for size in (2, 3, 4):
+            for i in range(len(run) - size + 1):
+                term = run[i:i + size]
+                if term[0] not in _CJK_STOP_CHARS and term[-1] not in _CJK_STOP_CHARS:
+                    terms.append(term)
+    return terms
+
+def textrank(matrix):
+    """在句子相似度矩阵上迭代PageRank，返回各句子得分"""
+    n = matrix.shape[0]
+    np.fill_diagonal(matrix, 0.0)
+    totals = matrix.sum(axis=1, keepdims=True)
+    # 与其他句子都不相似的句子均匀地把得分分给所有句子
+    transition = np.where(totals > 0, matrix / np.where(totals > 0, totals, 1), 1.0 / n)
+    scores = np.full(n, 1.0 / n)
+    for _ in range(MAX_ITERATIONS):
+        updated = (1 - DAMPING) / n + DAMPING * transition.T.dot(scores)
+        if np.abs(updated - scores).sum() < TOLERANCE:
+            return updated
+        scores = updated
+    return scores
+
+def _join_overlap(left, right):
+    """两个中文片段首尾重叠时拼接为一个词（例如"数字化"+"化转型"），否则返回None"""
+    for size in range(min(len(left), len(right)) - 1, 0, -1):
+        if left[-size:] == right[:size]:
+            return left + right[size:]
+    return None
+
+def _pick_keywords(terms, weights, count, max_length=8):
+    """按权重选关键词：与已选关键词互相包含时跳过，首尾重叠时合并为更长的词"""
+    keywords = []
+    for index in np.argsort(-weights):
+        if weights[index] <= 0 or len(keywords) >= count:
+            break
+        term = terms[index]
+        if any(term in chosen or chosen in term for chosen in keywords):
+            continue
+        for i, chosen in enumerate(keywords):
+            merged = _CJK_RUN.fullmatch(term) and (_join_overlap(chosen, term) or _join_overlap(term, chosen))
+            if merged and len(merged) <= max_length:
+                keywords[i] = merged
+                break
+        else:
+            keywords.append(term)
+    return keywords
+
+def _join_within(separator, words, limit):
+    """按顺序拼接完整的词，总长度不超过 limit"""
+    text = ''
+    for word in words:
+        candidate = f"{text}{separator}{word}" if text else word
+        if len(candidate) > limit:
+            break
+        text = candidate
+    return text
+
+def _outline_line(sentence):
+    """句子转为"a."要点：有分句时首个分句作为要点短语，其余作为说明"""
+    sentence = sentence.rstrip('。！？!?；;.')
+    parts = _CLAUSE.split(sentence, maxsplit=1)
+    if len(parts) == 2 and 2 <= len(parts[0].strip()) <= 16 and parts[1].strip():
+        return f"{parts[0].strip()}：{parts[1].strip()}"
+    return sentence
+
+def summarize(text, max_sentences=MAX_SENTENCES, max_keywords=MAX_KEYWORDS):
+    """返回草稿 (标题, 内容)，内容为"1. / a. / -"层级格式"""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    # 重复的句子只保留第一次出现
+    sentences = list(dict.fromkeys(split_sentences(text)))
+    if not sentences:
+        return (text.strip()[:TITLE_MAX_CHARS] or "草稿"), text.strip()
+
+    try:
+        vectorizer = TfidfVectorizer(analyzer=analyze, sublinear_tf=True)
+        matrix = vectorizer.fit_transform(sentences)
+    except ValueError:
+        # 没有可用的词项（例如全是数字和符号）
+        return sentences[0][:TITLE_MAX_CHARS], "\n".join(f"{i + 1}. {s}" for i, s in enumerate(sentences[:max_sentences]))
+
+    scores = textrank((matrix @ matrix.T).toarray()) if len(sentences) > 1 else np.ones(1)
+    chosen = sorted(np.argsort(-scores)[:max_sentences])
+
+    # 关键词权重：按句子得分加权的TF-IDF
+    terms = vectorizer.get_feature_names_out()
+    weights = np.asarray(matrix.T.dot(scores)).ravel()
+    keywords = _pick_keywords(terms, weights, max_keywords)
+    title = _join_within("、", keywords, TITLE_MAX_CHARS) or sentences[chosen[0]][:TITLE_MAX_CHARS]
+
+    # 选中的句子按包含的关键词分组，不含关键词的归入"其他要点"
+    groups = {keyword: [] for keyword in keywords}
+    others = []
+    for index in chosen:
+        sentence = sentences[index]
+        owner = next((keyword for keyword in keywords if keyword in sentence.lower()), None)
+        (groups[owner] if owner else others).append(sentence)
+    sections = [(keyword, items) for keyword, items in groups.items() if items]
+    if others:
+        sections.append(("其他要点", others))
+
+    lines = []
+    for i, (heading, items) in enumerate(sections):
+        lines.append(f"{i + 1}. {heading}：")
+        for j, sentence in enumerate(items[:26]):
+            lines.append(f"  {chr(ord('a') + j)}. {_outline_line(sentence)}")
+            numbers = [n for n in _NUMBER.findall(sentence) if len(n) > 1]
+            if numbers:
+                lines.append(f"    - 关键数据：{'、'.join(numbers[:4])}")
+    return title, "\n".join(lines)
+
+def draft_items(chunks):
+    """为每个文本块生成草稿页，格式与提炼结果相同"""
+    items = []
+    for i, chunk in enumerate(chunks):
+        # 图片标记不参与选句
+        title, content = summarize(strip_images(chunk))
+        items.append({'title': title, 'content': content, 'chunk_index': i, 'draft': True})
+    return items
+
+def draft_main_title(items):
+    """无API密钥时的总标题：取各页标题中最常见的关键词"""
+    counts = {}
+    for item in items:
+        for keyword in re.split(r'[、，,\s]+', item['title']):
+            if keyword:
+                counts[keyword] = counts.get(keyword, 0) + 1
+    ranked = sorted(counts, key=lambda keyword: (-counts[keyword], len(keyword)))
+    title = _join_within("、", ranked[:2], TITLE_MAX_CHARS - 4)
+    return f"{title}要点概览" if title else "内容提炼报告"
@@ -0,0 +1,133 @@
+"""层级汇总：长文档先切成大量小文本块并行提炼，再逐层把相邻结果归纳为章节
+
+提炼结果（叶子）按顺序每 fan_out 个归为一组，每组由大模型归纳为一个上层节点，
+同一层的各组并行归纳；节点数不超过 fan_out 或达到最大深度时停止，顶层节点即章节。
+总耗时约为"一轮提炼 + 深度 × 一轮归纳"，与文本块数量基本无关。
+"""
+import os
+import math
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+from metrics import span
+
+# 每组归纳的结果数，可通过环境变量 PPT_HIER_FAN_OUT 调整
+FAN_OUT = int(os.environ.get('PPT_HIER_FAN_OUT', 8))
+# 最大归纳层数，可通过环境变量 PPT_HIER_MAX_DEPTH 调整
+MAX_DEPTH = int(os.environ.get('PPT_HIER_MAX_DEPTH', 2))
+# 层级模式下每个文本块的默认字数及文本块数上限
+LEAF_CHUNK_SIZE = 1500
+MAX_CHUNKS = 400
+
+AGENDA_TITLE = "目录"
+
+def leaf_count(text_length, chunk_size=LEAF_CHUNK_SIZE):
+    """按每块字数估算层级模式下的分割块数"""
+    return max(2, min(MAX_CHUNKS, math.ceil(text_length / chunk_size)))
+
+def plan_depth(count, fan_out=FAN_OUT, max_depth=MAX_DEPTH):
+    """返回需要归纳的层数：至少一层，直到节点数不超过 fan_out"""
+    depth = 0
+    while count > 1 and depth < max_depth and (depth == 0 or count > fan_out):
+        count = len(group(list(range(count)), fan_out))
+        depth += 1
+    return depth
+
+def group(nodes, fan_out):
+    """把相邻节点按 fan_out 分组，最后一组过小时并入前一组"""
+    groups = [nodes[i:i + fan_out] for i in range(0, len(nodes), fan_out)]
+    if len(groups) > 1 and len(groups[-1]) < max(2, fan_out // 4):
+        groups[-2].extend(groups.pop())
+    return groups
+
+def format_children(children):
+    """把一组节点拼成归纳请求的输入"""
+    return "\n\n".join(
+        f"第{i + 1}部分\n标题：{child['title']}\n内容：\n{child['content']}"
+        for i, child in enumerate(children)
+    )
+
+def _fallback(children):
+    """归纳失败时用各部分标题拼成 (标题, 内容)，保证整棵树仍可导出"""
+    return children[0]['title'], "\n".join(f"{i + 1}. {child['title']}" for i, child in enumerate(children))
+
+def reduce_level(nodes, reduce_fn, fan_out, max_workers, level):
+    """把一层节点分组并行归纳为上一层，返回 (上层节点, 失败组数)"""
+    groups = group(nodes, fan_out)
+    failed = 0
+    with span('hier_reduce_level', level=level, groups=len(groups)):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # 复制当前上下文，使工作线程中的计时记录归属到本会话
+            futures = [executor.submit(copy_context().run, reduce_fn, children) for children in groups]
+            parents = []
+            for children, future in zip(groups, futures):
+                try:
+                    content, title = future.result()
+                    if not (content and title):
+                        raise ValueError("模型输出中没有找到标题或内容")
+                except Exception:
+                    failed += 1
+                    title, content = _fallback(children)
+                parents.append({
+                    'title': title,
+                    'content': content,
+                    'chunk_index': children[0]['chunk_index'],
+                    'chunk_range': (children[0]['chunk_range'][0], children[-1]['chunk_range'][1]),
+                    'children': children,
+                })
+    return parents, failed
+
+def build_tree(leaves, reduce_fn, fan_out=FAN_OUT, max_depth=MAX_DEPTH, max_workers=4, on_level=None):
+    """逐层归纳提炼结果，返回 (顶层章节节点, 归纳失败的组数)
+
+    leaves 为按原顺序排列的提炼结果；reduce_fn(children) 返回 (内容, 标题)。
+    """
+    nodes = [
+        {**leaf, 'chunk_range': (leaf['chunk_index'], leaf['chunk_index']), 'children': []}
+        for leaf in leaves
+    ]
+    depth = plan_depth(len(nodes), fan_out, max_depth)
+    failed = 0
+    for level in range(1, depth + 1):
+        nodes, level_failed = reduce_level(nodes, reduce_fn, fan_out, max_workers, level)
+        failed += level_failed
+        if on_level:
+            on_level(level, depth)
+    return nodes, failed
+
+def _leaves(node):
+    if not node['children']:
+        return [node]
+    return [leaf for child in node['children'] for leaf in _leaves(child)]
+
+def agenda_item(sections):
+    """目录页：列出各章节，多层时附上下一级标题"""
+    lines = []
+    for i, section in enumerate(sections):
+        lines.append(f"{i + 1}. {section['title']}")
+        subsections = [child for child in section['children'] if child['children']]
+        for j, child in enumerate(subsections[:26]):
+            lines.append(f"  {chr(ord('a') + j)}. {child['title']}")
+    return {'title': AGENDA_TITLE, 'content': "\n".join(lines), 'chunk_index': 0, 'level': 'agenda'}
+
+def deck_items(sections, include_details=False):
+    """把章节树展开为幻灯片列表：目录页、各章节页，可选附上各文本块的详细页"""
+    items = [agenda_item(sections)]
+    for section in sections:
+        first, last = section['chunk_range']
+        items.append({
+            'title': section['title'],
+            'content': section['content'],
+            'chunk_index': first,
+            'chunk_range': [first, last],
+            'level': 'section',
+        })
+        if include_details and section['children']:
+            for leaf in _leaves(section):
+                items.append({
+                    'title': leaf['title'],
+                    'content': leaf['content'],
+                    'chunk_index': leaf['chunk_index'],
+                    'level': 'detail',
+                })
+    return items
@@ -0,0 +1,175 @@
+import io
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from lxml import etree
+from pptx import Presentation
+from pptx.oxml import parse_xml
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.parts.slide import SlidePart
+from pptx.util import Inches
+
+from metrics import span
+from ppt_utils import SLIDE_WIDTH, SLIDE_HEIGHT, fill_cover_slide, fill_content_slide
+
+# 形状树缓存的最大条目数，超出后按最近最少使用淘汰
+MAX_CACHED_SLIDES = 2000
+
+def content_hash(title, content, images=None):
+    """根据标题、内容和图片计算单页幻灯片的哈希"""
+    payload = json.dumps([title, content] + ([list(images)] if images else []), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def titles_hash(extracted_contents):
+    """根据全部幻灯片标题的集合计算哈希，用于判断是否需要重新生成总标题"""
+    titles = sorted({item['title'] for item in extracted_contents})
+    payload = json.dumps(titles, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class _CachedSlidePart(SlidePart):
+    """缓存序列化结果的幻灯片部件，未修改的幻灯片保存时直接复用XML字节"""
+
+    _cached_blob = None
+
+    @property
+    def blob(self):
+        if self._cached_blob is None:
+            self._cached_blob = super().blob
+        return self._cached_blob
+
+    def invalidate(self):
+        self._cached_blob = None
+
+class IncrementalExporter:
+    """增量导出器：保留上一次导出的演示文稿，只重建内容发生变化的幻灯片"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._prs = None
+        self._slide_hashes = []  # 每个内容页（不含封面）当前对应的哈希
+        self._shape_trees = OrderedDict()  # 哈希 -> 序列化的形状树XML
+        self._titles_key = None
+        self._main_title = None
+        self.last_stats = {}
+
+    def _new_presentation(self):
+        prs = Presentation()
+        prs.slide_width = Inches(SLIDE_WIDTH)
+        prs.slide_height = Inches(SLIDE_HEIGHT)
+        prs.slides.add_slide(prs.slide_layouts[0])
+        return prs
+
+    def _remember_shape_tree(self, digest, slide):
+        self._shape_trees[digest] = etree.tostring(slide.shapes._spTree)
+        self._shape_trees.move_to_end(digest)
+        while len(self._shape_trees) > MAX_CACHED_SLIDES:
+            self._shape_trees.popitem(last=False)
+
+    def _rebuild_slide(self, slide, item, digest):
+        """用缓存的形状树或重新排版的内容替换一页幻灯片"""
+        sp_tree = slide.shapes._spTree
+        # 保留组属性节点（nvGrpSpPr、grpSpPr），删除其余形状
+        for shape_element in list(sp_tree)[2:]:
+            sp_tree.remove(shape_element)
+        # 删除原有图片的关系，不再被引用的图片不会写入文件
+        for r_id, rel in list(slide.part.rels.items()):
+            if rel.reltype == RT.IMAGE:
+                slide.part.drop_rel(r_id)
+
+        if item.get('images'):
+            # 图片形状通过本页的关系编号引用媒体部件，不使用跨页面的形状树缓存
+            fill_content_slide(slide, item['title'], item['content'], item['images'])
+            slide.part.invalidate()
+            return False
+
+        cached = self._shape_trees.get(digest)
+        if cached is not None:
+            for shape_element in list(parse_xml(cached))[2:]:
+                sp_tree.append(shape_element)
+            self._shape_trees.move_to_end(digest)
+            reused = True
+        else:
+            fill_content_slide(slide, item['title'], item['content'])
+            self._remember_shape_tree(digest, slide)
+            reused = False
+        slide.part.invalidate()
+        return reused
+
+    def _resize(self, count):
+        """调整内容页数量，使其与提炼结果一致"""
+        prs = self._prs
+        while len(self._slide_hashes) < count:
+            slide = prs.slides.add_slide(prs.slide_layouts[6])
+            slide.part.__class__ = _CachedSlidePart
+            self._slide_hashes.append(None)
+        sld_id_lst = prs.slides._sldIdLst
+        while len(self._slide_hashes) > count:
+            sld_id = sld_id_lst[-1]
+            prs.part.drop_rel(sld_id.rId)
+            sld_id_lst.remove(sld_id)
+            self._slide_hashes.pop()
+
+    def append(self, item):
+        """在末尾追加一页内容幻灯片并立即排版；之后以相同内容导出时这一页不再重建"""
+        with self._lock:
+            if self._prs is None:
+                self._prs = self._new_presentation()
+                self._slide_hashes = []
+            count = len(self._slide_hashes) + 1
+            self._resize(count)
+            digest = content_hash(item['title'], item['content'], item.get('images'))
+            self._rebuild_slide(self._prs.slides[count], item, digest)
+            self._slide_hashes[-1] = digest
+
+    def export(self, extracted_contents, generate_title):
+        """增量生成演示文稿，返回PPT文件的字节内容"""
+        with self._lock, span('render_incremental') as export_span:
+            if self._prs is None:
+                self._prs = self._new_presentation()
+                self._slide_hashes = []
+
+            # 仅当标题集合变化时重新生成总标题
+            key = titles_hash(extracted_contents)
+            if key == self._titles_key:
+                export_span['cache_hits'] = 1
+            else:
+                self._main_title = generate_title(extracted_contents)
+                self._titles_key = key
+                fill_cover_slide(self._prs.slides[0], self._main_title)
+
+            self._resize(len(extracted_contents))
+
+            rebuilt = reused = 0
+            for i, item in enumerate(extracted_contents):
+                digest = content_hash(item['title'], item['content'], item.get('images'))
+                if self._slide_hashes[i] == digest:
+                    continue
+                if self._rebuild_slide(self._prs.slides[i + 1], item, digest):
+                    reused += 1
+                else:
+                    rebuilt += 1
+                self._slide_hashes[i] = digest
+
+            # 未变化和复用形状树的幻灯片都计为缓存命中
+            export_span['cache_hits'] = export_span.get('cache_hits', 0) + len(extracted_contents) - rebuilt
+
+            buffer = io.BytesIO()
+            self._prs.save(buffer)
+            export_span['bytes_out'] = buffer.tell()
+            self.last_stats = {
+                'slides': len(extracted_contents),
+                'rebuilt': rebuilt,
+                'reused': reused,
+            }
+            return buffer.getvalue()
+
+    def reset(self):
+        """清空缓存，下次导出时完整重建"""
+        with self._lock:
+            self._prs = None
+            self._slide_hashes = []
+            self._shape_trees.clear()
+            self._titles_key = None
+            self._main_title = None
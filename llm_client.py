@@ -0,0 +1,306 @@
+import time
+import random
+import hashlib
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+
+from scheduler import get_scheduler, current_user
+
+logger = logging.getLogger(__name__)
+
+# 可重试的HTTP状态码：请求超时、冲突、限流以及服务端错误
+RETRYABLE_STATUS = {408, 409, 429}
+# 可重试的网络异常类名（openai、httpx、requests）
+RETRYABLE_ERRORS = {
+    'APIConnectionError', 'APITimeoutError', 'Timeout', 'TimeoutException',
+    'ConnectError', 'ReadTimeout', 'ConnectTimeout', 'ConnectionError',
+    'RemoteProtocolError',
+}
+
+class LLMCallError(Exception):
+    """大模型调用在重试耗尽或熔断后仍然失败"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+def error_status(exc):
+    """从异常中取出HTTP状态码，取不到时返回None"""
+    status = getattr(exc, 'status_code', None)
+    if status is None:
+        response = getattr(exc, 'response', None)
+        status = getattr(response, 'status_code', None)
+    return status
+
+def retry_after_seconds(exc):
+    """解析响应头中的Retry-After（秒数或HTTP日期），没有时返回None"""
+    response = getattr(exc, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return max(float(value) / 1000, 0)
+        except ValueError:
+            pass
+
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+        except (TypeError, ValueError):
+            return None
+
+def is_throttled(exc):
+    """判断异常是否为限流（429）"""
+    return error_status(exc) == 429 or type(exc).__name__ == 'RateLimitError'
+
+def is_retryable(exc):
+    """判断异常是否值得重试"""
+    status = error_status(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    return type(exc).__name__ in RETRYABLE_ERRORS or is_throttled(exc)
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后暂停请求，冷却后放行一个探测请求"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._probe_owner = None
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half_open'
+            return 'open'
+
+    def wait_time(self):
+        """返回距离允许下一次请求还需等待的秒数，0表示可以立即请求"""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+            if remaining > 0:
+                return remaining
+            # 半开状态只放行一个探测请求
+            if self._probing:
+                return min(1.0, self.reset_timeout)
+            self._probing = True
+            self._probe_owner = threading.get_ident()
+            return 0.0
+
+    def holds_probe(self):
+        """当前线程是否持有半开状态的探测名额"""
+        with self._lock:
+            return self._probing and self._probe_owner == threading.get_ident()
+
+    def release_probe(self):
+        """归还当前线程持有的探测名额（探测以限流、不可重试错误或取消结束时），熔断保持半开"""
+        with self._lock:
+            if self._probing and self._probe_owner == threading.get_ident():
+                self._probing = False
+                self._probe_owner = None
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+            self._probe_owner = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            self._probe_owner = None
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning("LLM熔断器打开：连续失败 %d 次", self._failures)
+                self._opened_at = time.monotonic()
+
+class AdaptiveLimiter:
+    """AIMD自适应并发控制：限流时乘性减小并发，延迟正常时加性增大并发"""
+
+    def __init__(self, initial=4, min_limit=1, max_limit=16, latency_factor=2.0, cooldown=2.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_factor = latency_factor
+        self.cooldown = cooldown
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._baseline = None
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def acquire(self):
+        with self._cond:
+            while self._in_flight >= max(int(self._limit), self.min_limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self, latency):
+        """请求成功：延迟健康时每个往返加性增加 1/limit"""
+        with self._cond:
+            if self._baseline is None:
+                self._baseline = latency
+            else:
+                # 基线取较快请求的滑动平均，慢请求只缓慢抬高基线
+                weight = 0.2 if latency < self._baseline else 0.02
+                self._baseline += weight * (latency - self._baseline)
+
+            if latency <= self._baseline * self.latency_factor:
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            else:
+                self._decrease(0.9)
+            self._cond.notify_all()
+
+    def on_throttle(self):
+        """被限流：并发减半"""
+        with self._cond:
+            self._decrease(0.5)
+
+    def _decrease(self, factor):
+        # 同一冷却窗口内只减小一次，避免并发中的多个429把并发压到最低
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self._limit = max(self.min_limit, self._limit * factor)
+        logger.info("LLM并发上限调整为 %.1f", self._limit)
+
+class LLMGate:
+    """单个API端点的调用闸门：组合自适应并发、熔断和重试退避"""
+
+    def __init__(self, max_attempts=6, base_delay=1.0, max_delay=60.0, max_wait=300.0):
+        self.limiter = AdaptiveLimiter()
+        self.breaker = CircuitBreaker()
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_wait = max_wait
+
+    def backoff(self, attempt):
+        """指数退避加全抖动"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, fn, *args, tokens=0, attempts=None, **kwargs):
+        """在并发、熔断和重试的控制下调用fn
+
+        tokens 为本次请求的估算token数，用于全局调度的每分钟token预算；
+        attempts 覆盖最大尝试次数（例如端点池中还有其他端点可换时少重试几次）。
+        """
+        deadline = time.monotonic() + self.max_wait
+        last_exc = None
+        max_attempts = attempts or self.max_attempts
+
+        for attempt in range(max_attempts):
+            # 熔断打开时等待冷却，而不是直接让本次运行失败
+            wait = self.breaker.wait_time()
+            while wait > 0:
+                if time.monotonic() + wait > deadline:
+                    raise LLMCallError("API持续不可用，已暂停请求", error_status(last_exc))
+                time.sleep(wait)
+                wait = self.breaker.wait_time()
+
+            # 无论本次尝试以何种方式结束，都要归还探测名额，否则端点会一直处于半开等待
+            try:
+                self.limiter.acquire()
+                try:
+                    # 本进程的并发名额之外，还要在本机全部进程共享的公平队列中排队
+                    ticket = self._schedule(tokens, deadline)
+                except BaseException:
+                    self.limiter.release()
+                    raise
+                start = time.monotonic()
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    last_exc = e
+                else:
+                    last_exc = None
+                finally:
+                    if ticket is not None:
+                        get_scheduler().release(ticket)
+                    self.limiter.release()
+
+                if last_exc is None:
+                    self.limiter.on_success(time.monotonic() - start)
+                    self.breaker.record_success()
+                    return result
+
+                if not is_retryable(last_exc):
+                    raise last_exc
+
+                if is_throttled(last_exc):
+                    self.limiter.on_throttle()
+                    # 半开探测被限流说明端点尚未恢复，按失败处理并重新打开熔断
+                    if self.breaker.holds_probe():
+                        self.breaker.record_failure()
+                else:
+                    self.breaker.record_failure()
+            finally:
+                self.breaker.release_probe()
+
+            # 退避期间不占用并发名额
+            delay = retry_after_seconds(last_exc)
+            if delay is None:
+                delay = self.backoff(attempt)
+            logger.warning("LLM调用失败（第 %d 次，状态 %s），%.1f 秒后重试：%s",
+                           attempt + 1, error_status(last_exc), delay, last_exc)
+            if time.monotonic() + delay > deadline:
+                break
+            time.sleep(delay)
+
+        raise LLMCallError(f"重试 {max_attempts} 次后仍然失败：{last_exc}", error_status(last_exc))
+
+    def _schedule(self, tokens, deadline):
+        """在全局调度器中排队，返回放行编号；未启用全局调度时返回None"""
+        scheduler = get_scheduler()
+        if scheduler is None:
+            return None
+        try:
+            return scheduler.acquire(current_user(), tokens, max(0.0, deadline - time.monotonic()))
+        except TimeoutError:
+            raise LLMCallError("等待全局调度超时，请稍后重试")
+
+_gates = {}
+_gates_lock = threading.Lock()
+
+def get_gate(base_url, api_key=None):
+    """获取进程内按API端点和密钥共享的调用闸门：使用同一密钥的会话共用一份配额控制，
+    不同密钥的配额相互独立，一个用户被限流不影响其他用户"""
+    key_hash = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16] if api_key else None
+    with _gates_lock:
+        gate = _gates.get((base_url, key_hash))
+        if gate is None:
+            gate = _gates[(base_url, key_hash)] = LLMGate()
+        return gate
@@ -0,0 +1,117 @@
+import re
+import json
+
+# 标题行：兼容 "**标题：**"、"## 标题:"、"Title:" 等变体
+TITLE_PATTERN = re.compile(
+    r'^[\s#>*_`-]*(?:标题|题目|title)[\s*_`]*[：:][\s*_`]*(.*?)[\s*_`]*$',
+    re.IGNORECASE
+)
+# 内容标记行：兼容 "**内容：**"、"## 内容:"、"Content:" 等变体，标记后可以直接跟正文；
+# "内容"/"正文"/"要点"也常作为大纲中的条目，只在行首（可加标题或加粗标记）时才视为内容标记，
+# 缩进或带项目符号的同名条目属于大纲本身
+CONTENT_PATTERN = re.compile(
+    r'^(?:#+\s*)?(?:\*\*|__)?(?:内容|content|正文|要点)'
+    r'[\s*_`]*[：:][\s*_`]*(.*)$',
+    re.IGNORECASE
+)
+TITLE_KEYS = ('title', '标题', 'heading')
+CONTENT_KEYS = ('content', '内容', 'body', 'points')
+
+def _clean_title(title):
+    """去掉标题两侧的引号、书名号和Markdown标记"""
+    title = title.strip().strip('*_`#').strip()
+    return title.strip('"“”\'「」[]【】').strip()
+
+def _render_content(value, level=0):
+    """把JSON中的内容（字符串、列表或嵌套对象）转换为分层文本"""
+    if isinstance(value, str):
+        return value.strip()
+    indent = '  ' * level
+    lines = []
+    if isinstance(value, list):
+        for item in value:
+            text = _render_content(item, level)
+            if text:
+                lines.append(text if isinstance(item, (dict, list)) else indent + text)
+    elif isinstance(value, dict):
+        for key, sub in value.items():
+            if isinstance(sub, (dict, list)):
+                lines.append(f"{indent}{key}：")
+                lines.append(_render_content(sub, level + 1))
+            else:
+                lines.append(f"{indent}{key}：{sub}")
+    return '\n'.join(line for line in lines if line)
+
+def _strip_code_fence(text):
+    match = re.search(r'```(?:json|JSON)?\s*(.*?)```', text, re.S)
+    return match.group(1) if match else text
+
+def _repair_json(candidate):
+    """修复常见的JSON偏差：中文引号、尾随逗号、单引号"""
+    candidate = candidate.replace('“', '"').replace('”', '"')
+    candidate = re.sub(r',\s*([}\]])', r'\1', candidate)
+    if '"' not in candidate:
+        candidate = candidate.replace("'", '"')
+    return candidate
+
+def parse_json_output(text):
+    """尝试从模型输出中解析JSON对象，返回 (标题, 内容)，失败时返回 (None, None)"""
+    body = _strip_code_fence(text)
+    start, end = body.find('{'), body.rfind('}')
+    if start < 0 or end <= start:
+        return None, None
+
+    candidate = body[start:end + 1]
+    for attempt in (candidate, _repair_json(candidate)):
+        try:
+            data = json.loads(attempt, strict=False)
+            break
+        except ValueError:
+            continue
+    else:
+        return None, None
+    if not isinstance(data, dict):
+        return None, None
+
+    lowered = {str(k).strip().lower(): v for k, v in data.items()}
+    title = next((lowered[k] for k in TITLE_KEYS if k in lowered), None)
+    content = next((lowered[k] for k in CONTENT_KEYS if k in lowered), None)
+    if not isinstance(title, str) or content is None:
+        return None, None
+    return _clean_title(title), _render_content(content)
+
+def parse_line_output(text):
+    """按"标题："/"内容："行解析模型输出，兼容加粗、英文冒号和英文关键词"""
+    lines = text.replace('\r\n', '\n').split('\n')
+    title = None
+    content_lines = None
+    title_index = None
+
+    for i, line in enumerate(lines):
+        if title is None:
+            match = TITLE_PATTERN.match(line)
+            if match and match.group(1).strip():
+                title = _clean_title(match.group(1))
+                title_index = i
+                continue
+        match = CONTENT_PATTERN.match(line)
+        if match:
+            first = match.group(1).rstrip()
+            content_lines = ([first] if first.strip() else []) + lines[i + 1:]
+            break
+
+    # 没有"内容："标记时，把标题之后的文本当作内容
+    if content_lines is None and title_index is not None:
+        content_lines = lines[title_index + 1:]
+
+    content = '\n'.join(content_lines).strip() if content_lines else ''
+    return title or '', content
+
+def parse_extraction(text):
+    """解析内容提炼的输出：优先按JSON解析，再按行解析，返回 (标题, 内容)"""
+    if not text:
+        return '', ''
+    title, content = parse_json_output(text)
+    if title and content:
+        return title, content
+    return parse_line_output(text)
@@ -0,0 +1,272 @@
+"""文档图片的提取、缩放和去重：图片以"【图片：编号】"标记嵌入正文，按内容哈希保存"""
+import io
+import os
+import re
+import time
+import base64
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 本模块不导入Streamlit，解析进程池的工作进程可以直接导入
+from metrics import span
+
+MEDIA_DIR = os.environ.get('PPT_MEDIA_DIR', os.path.join(tempfile.gettempdir(), 'ppt_media'))
+# 缩放后长边的最大像素数：图片区域约5.5×6.5英寸，按200DPI计算
+MAX_IMAGE_PX = int(os.environ.get('PPT_IMAGE_MAX_PX', 1280))
+# 长或宽小于该像素数的图片（图标、分隔线、统计像素）不保留
+MIN_IMAGE_PX = 48
+JPEG_QUALITY = 80
+# 无透明通道的PNG比同尺寸JPEG大出该倍数时改存为JPEG（以PNG保存的照片）
+PNG_SIZE_RATIO = 2.0
+# 单个文档最多保留的图片数
+MAX_IMAGES = int(os.environ.get('PPT_MAX_IMAGES', 100))
+# 下载和缩放的线程数，可通过环境变量 PPT_IMAGE_WORKERS 调整；下载主要是网络等待，线程数多于CPU核数
+MAX_WORKERS = int(os.environ.get('PPT_IMAGE_WORKERS', 0) or min(8, (os.cpu_count() or 1) + 4))
+# 网页图片的下载超时（秒）、大小上限和最多跟随的重定向次数
+FETCH_TIMEOUT = 10
+MAX_FETCH_BYTES = 20 * 1024 * 1024
+MAX_REDIRECTS = 3
+# 超过保留天数未使用的图片在下次导入时删除，清理最多每小时进行一次
+RETENTION_DAYS = float(os.environ.get('PPT_MEDIA_RETENTION_DAYS', 7))
+CLEANUP_INTERVAL = 3600
+
+MARKER = "【图片：{id}】"
+_MARKER_PATTERN = re.compile(r'【图片：([0-9a-f]{16})】')
+# 解析过程中的临时占位符，图片处理完成后替换为标记或删除
+_PLACEHOLDER = "\x00图片{}\x00"
+_PLACEHOLDER_PATTERN = re.compile(r'\x00图片(\d+)\x00')
+_EXTENSIONS = ('.jpg', '.png')
+
+_executor = None
+_executor_lock = threading.Lock()
+_last_cleanup = 0.0
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='media')
+        return _executor
+
+def placeholder(index):
+    """解析文档时第 index 个图片的占位符"""
+    return _PLACEHOLDER.format(index)
+
+def find_images(text):
+    """返回文本中标记的图片编号（按出现顺序去重，只包含仍然存在的图片）"""
+    images = []
+    for image_id in _MARKER_PATTERN.findall(text or ''):
+        if image_id not in images and image_path(image_id):
+            images.append(image_id)
+    return images
+
+def strip_images(text):
+    """删除文本中的图片标记（发送给大模型前使用）"""
+    if '【图片：' not in text:
+        return text
+    return re.sub(r'\n{3,}', '\n\n', _MARKER_PATTERN.sub('', text)).strip()
+
+def image_path(image_id):
+    """返回图片文件的路径，不存在时返回None"""
+    for extension in _EXTENSIONS:
+        path = os.path.join(MEDIA_DIR, image_id + extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+def image_size(path):
+    """读取图片的像素尺寸（只解析文件头）"""
+    from PIL import Image
+    with Image.open(path) as image:
+        return image.size
+
+def downscale(data):
+    """把图片缩放到长边不超过 MAX_IMAGE_PX 并重新压缩，返回 (字节, 扩展名)；无法识别或过小的图片返回None"""
+    from PIL import Image, ImageOps
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        source_format = image.format
+        original_size = image.size
+        if min(original_size) < MIN_IMAGE_PX:
+            return None
+        # JPEG可在解码时直接按2的幂缩小，高分辨率照片的解码时间和内存都大幅减少
+        image.draft('RGB', (MAX_IMAGE_PX, MAX_IMAGE_PX))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((MAX_IMAGE_PX, MAX_IMAGE_PX), Image.LANCZOS)
+    except Exception:
+        return None
+
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+    if has_alpha:
+        blob, extension = _encode(image, 'PNG'), '.png'
+    elif source_format == 'JPEG':
+        blob, extension = _encode(image, 'JPEG'), '.jpg'
+    else:
+        # 示意图和截图通常以PNG保存，保留无损格式；以PNG保存的照片改存为JPEG
+        png, jpeg = _encode(image, 'PNG'), _encode(image, 'JPEG')
+        blob, extension = (png, '.png') if len(png) <= PNG_SIZE_RATIO * len(jpeg) else (jpeg, '.jpg')
+
+    # 原图已在尺寸范围内且更小时保留原图
+    if (source_format in ('JPEG', 'PNG') and max(original_size) <= MAX_IMAGE_PX
+            and len(data) <= len(blob)):
+        return data, '.jpg' if source_format == 'JPEG' else '.png'
+    return blob, extension
+
+def _encode(image, image_format):
+    buffer = io.BytesIO()
+    if image_format == 'JPEG':
+        image.convert('RGB').save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    else:
+        image.save(buffer, 'PNG', optimize=True)
+    return buffer.getvalue()
+
+def image_url(attrs, base_url):
+    """根据img标签的属性返回图片的完整地址（兼容延迟加载的data-src），尺寸明显过小时返回None"""
+    for name in ('width', 'height'):
+        value = str(attrs.get(name, '')).strip().rstrip('px')
+        if value.isdigit() and int(value) < MIN_IMAGE_PX:
+            return None
+    src = attrs.get('data-src') or attrs.get('data-original') or attrs.get('src')
+    if not src or not src.strip():
+        return None
+    src = src.strip()
+    if src.startswith('data:'):
+        return src
+    from urllib.parse import urljoin
+    url = urljoin(base_url, src)
+    return url if url.startswith(('http://', 'https://')) else None
+
+def _public_url(url):
+    """URL的主机解析出的地址全部为公网地址时返回True；本机、内网、链路本地（含云主机元数据）和保留地址一律拒绝"""
+    import socket
+    import ipaddress
+    from urllib.parse import urlsplit
+    try:
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            return False
+        infos = socket.getaddrinfo(parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80),
+                                   proto=socket.IPPROTO_TCP)
+    except (OSError, UnicodeError, ValueError):
+        return False
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split('%')[0])
+        if not address.is_global or address.is_multicast:
+            return False
+    return bool(infos)
+
+def _fetch(url):
+    """下载网页图片（支持data:URI），失败或指向非公网地址时返回None"""
+    if url.startswith('data:'):
+        header, _, payload = url.partition(',')
+        try:
+            return base64.b64decode(payload) if header.endswith(';base64') else None
+        except ValueError:
+            return None
+    import requests
+    from urllib.parse import urljoin
+    try:
+        # 不自动跟随重定向，每一跳都重新检查目标地址
+        for _ in range(MAX_REDIRECTS + 1):
+            if not _public_url(url):
+                return None
+            with requests.get(url, timeout=FETCH_TIMEOUT, stream=True, allow_redirects=False,
+                              headers={'User-Agent': 'Mozilla/5.0'}) as response:
+                if response.is_redirect:
+                    url = urljoin(url, response.headers['location'])
+                    continue
+                response.raise_for_status()
+                data = b''
+                for block in response.iter_content(64 * 1024):
+                    data += block
+                    if len(data) > MAX_FETCH_BYTES:
+                        return None
+                return data
+        return None
+    except requests.RequestException:
+        return None
+
+def _store(source):
+    """保存一张图片（字节或URL），返回 (编号, 输入字节数, 输出字节数, 是否已存在)；无效图片的编号为None"""
+    data = _fetch(source) if isinstance(source, str) else source
+    if not data:
+        return None, 0, 0, False
+    image_id = hashlib.sha256(data).hexdigest()[:16]
+    path = image_path(image_id)
+    if path:
+        try:
+            # 更新修改时间，仍在使用的图片不会被清理
+            os.utime(path)
+            return image_id, len(data), os.path.getsize(path), True
+        except OSError:
+            # 刚被清理删除，重新保存
+            pass
+
+    result = downscale(data)
+    if result is None:
+        return None, len(data), 0, False
+    blob, extension = result
+    os.makedirs(MEDIA_DIR, exist_ok=True)
+    path = os.path.join(MEDIA_DIR, image_id + extension)
+    # 先写入临时文件再替换，多个进程同时保存同一张图片时不会读到不完整的文件
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(blob)
+    os.replace(tmp_path, path)
+    return image_id, len(data), len(blob), False
+
+def process_images(sources):
+    """并行下载、缩放并保存多张图片（字节或URL），按原顺序返回编号，无效的图片为None
+
+    内容相同的字节或相同的URL只处理一次。
+    """
+    _cleanup()
+    keys = [source if isinstance(source, str) else hashlib.sha256(source).digest() for source in sources]
+    unique = dict(zip(keys, sources))
+    with span('images', files=len(unique)) as data:
+        executor = _get_executor()
+        futures = {key: executor.submit(_store, source) for key, source in unique.items()}
+        ids = {}
+        for key, future in futures.items():
+            image_id, bytes_in, bytes_out, existed = future.result()
+            ids[key] = image_id
+            data['bytes_in'] = data.get('bytes_in', 0) + bytes_in
+            data['bytes_out'] = data.get('bytes_out', 0) + bytes_out
+            data['cache_hits'] = data.get('cache_hits', 0) + int(existed)
+    return [ids[key] for key in keys]
+
+def embed_images(text, sources):
+    """处理占位符对应的图片，并把占位符替换为图片标记（无效的图片和超出数量上限的图片直接删除）"""
+    sources = list(sources)[:MAX_IMAGES]
+    if not sources:
+        return _PLACEHOLDER_PATTERN.sub('', text)
+    ids = process_images(sources)
+
+    def replace(match):
+        index = int(match.group(1))
+        image_id = ids[index] if index < len(ids) else None
+        return MARKER.format(id=image_id) if image_id else ''
+    text = _PLACEHOLDER_PATTERN.sub(replace, text)
+    return re.sub(r'\n{3,}', '\n\n', text).strip()
+
+def _cleanup():
+    """删除超过保留天数未使用的图片"""
+    global _last_cleanup
+    now = time.time()
+    if now - _last_cleanup < CLEANUP_INTERVAL:
+        return
+    _last_cleanup = now
+    try:
+        entries = list(os.scandir(MEDIA_DIR))
+    except OSError:
+        return
+    cutoff = now - RETENTION_DAYS * 86400
+    for entry in entries:
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+        except OSError:
+            pass
@@ -0,0 +1,234 @@
+import os
+import functools
+import json
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger(__name__)
+
+# 延迟直方图的桶边界（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 每个span累计的计数字段
+COUNTERS = ('prompt_tokens', 'completion_tokens', 'cache_hits', 'bytes_in', 'bytes_out')
+
+_lock = threading.Lock()
+_stages = {}
+_recent = deque(maxlen=500)
+_session_sink = contextvars.ContextVar('metrics_session_sink', default=None)
+_server = None
+# 指标日志文件在进程内只打开一次，写入时加锁
+_log_lock = threading.Lock()
+_log_file = None
+_log_path = None
+
+def bind_session(sink):
+    """将当前上下文中产生的span同时写入会话自己的列表（用于侧边栏展示）"""
+    _session_sink.set(sink)
+
+def _new_stage():
+    return {
+        'count': 0,
+        'errors': 0,
+        'seconds': 0.0,
+        'buckets': [0] * len(LATENCY_BUCKETS),
+        **{key: 0 for key in COUNTERS},
+    }
+
+def record(stage, seconds, error=False, **values):
+    """记录一次已完成的阶段耗时及其计数"""
+    entry = {'stage': stage, 'ts': time.time(), 'seconds': seconds, 'error': error}
+    for key in COUNTERS:
+        entry[key] = int(values.pop(key, 0) or 0)
+    entry.update(values)
+
+    with _lock:
+        stats = _stages.get(stage)
+        if stats is None:
+            stats = _stages[stage] = _new_stage()
+        stats['count'] += 1
+        stats['errors'] += int(error)
+        stats['seconds'] += seconds
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                stats['buckets'][i] += 1
+        for key in COUNTERS:
+            stats[key] += entry[key]
+        _recent.append(entry)
+
+    sink = _session_sink.get()
+    if sink is not None:
+        sink.append(entry)
+
+    log_path = os.environ.get('PPT_METRICS_LOG')
+    if log_path:
+        _write_log(log_path, json.dumps(entry, ensure_ascii=False) + '\n')
+    return entry
+
+def _write_log(log_path, line):
+    global _log_file, _log_path
+    with _log_lock:
+        try:
+            if _log_file is None or _log_path != log_path:
+                if _log_file is not None:
+                    _log_file.close()
+                # 行缓冲：每条记录整行写出，多个工作进程追加同一文件时不会交错
+                _log_file = open(log_path, 'a', encoding='utf-8', buffering=1)
+                _log_path = log_path
+            _log_file.write(line)
+        except OSError as e:
+            logger.warning("写入指标日志失败：%s", e)
+            _log_file = None
+
+@contextmanager
+def span(stage, **values):
+    """计时上下文：在代码块内可向返回的字典补充token数、缓存命中和字节数"""
+    data = dict(values)
+    start = time.perf_counter()
+    error = False
+    try:
+        yield data
+    except BaseException:
+        error = True
+        raise
+    finally:
+        record(stage, time.perf_counter() - start, error=error, **data)
+
+@contextmanager
+def llm_span(stage, **values):
+    """大模型调用的计时上下文，自动统计本次调用消耗的token"""
+    with span(stage, **values) as data:
+        try:
+            from langchain_community.callbacks import get_openai_callback
+        except ImportError:
+            yield data
+            return
+        with get_openai_callback() as cb:
+            try:
+                yield data
+            finally:
+                data['prompt_tokens'] = data.get('prompt_tokens', 0) + cb.prompt_tokens
+                data['completion_tokens'] = data.get('completion_tokens', 0) + cb.completion_tokens
+
+def snapshot():
+    """返回各阶段的累计统计"""
+    with _lock:
+        return {
+            stage: {**stats, 'buckets': list(stats['buckets'])}
+            for stage, stats in _stages.items()
+        }
+
+def recent(limit=100):
+    """返回最近完成的span"""
+    with _lock:
+        return list(_recent)[-limit:]
+
+def summarize(entries):
+    """按阶段汇总一组span，用于会话级展示"""
+    summary = {}
+    for entry in entries:
+        stats = summary.setdefault(entry['stage'], {'count': 0, 'seconds': 0.0, **{k: 0 for k in COUNTERS}})
+        stats['count'] += 1
+        stats['seconds'] += entry['seconds']
+        for key in COUNTERS:
+            stats[key] += entry.get(key, 0)
+    return summary
+
+def render_prometheus():
+    """以Prometheus文本格式输出累计指标"""
+    lines = [
+        '# HELP ppt_stage_seconds Time spent per pipeline stage.',
+        '# TYPE ppt_stage_seconds histogram',
+    ]
+    stages = snapshot()
+    for stage, stats in sorted(stages.items()):
+        label = f'stage="{stage}"'
+        for bound, count in zip(LATENCY_BUCKETS, stats['buckets']):
+            lines.append(f'ppt_stage_seconds_bucket{{{label},le="{bound}"}} {count}')
+        lines.append(f'ppt_stage_seconds_bucket{{{label},le="+Inf"}} {stats["count"]}')
+        lines.append(f'ppt_stage_seconds_sum{{{label}}} {stats["seconds"]:.6f}')
+        lines.append(f'ppt_stage_seconds_count{{{label}}} {stats["count"]}')
+
+    lines.append('# HELP ppt_stage_errors_total Failed spans per pipeline stage.')
+    lines.append('# TYPE ppt_stage_errors_total counter')
+    for stage, stats in sorted(stages.items()):
+        lines.append(f'ppt_stage_errors_total{{stage="{stage}"}} {stats["errors"]}')
+
+    for key in COUNTERS:
+        lines.append(f'# TYPE ppt_{key}_total counter')
+        for stage, stats in sorted(stages.items()):
+            lines.append(f'ppt_{key}_total{{stage="{stage}"}} {stats[key]}')
+    return '\n'.join(lines) + '\n'
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith('/metrics.json'):
+            body = json.dumps({'stages': snapshot(), 'recent': recent()}, ensure_ascii=False).encode('utf-8')
+            content_type = 'application/json'
+        elif self.path.startswith('/metrics'):
+            body = render_prometheus().encode('utf-8')
+            content_type = 'text/plain; version=0.0.4'
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_metrics_server(port=None, host='127.0.0.1'):
+    """启动指标HTTP服务（/metrics 和 /metrics.json），每个进程只启动一次"""
+    global _server
+    with _lock:
+        if _server is not None:
+            return _server
+        port = port or int(os.environ.get('PPT_METRICS_PORT', 0) or 0)
+        if not port:
+            return None
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            logger.warning("指标服务启动失败（端口 %s）：%s", port, e)
+            return None
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+        logger.info("指标服务已启动：http://%s:%s/metrics", host, port)
+        return _server
+
+def text_bytes(value):
+    """返回字符串的UTF-8字节数，非字符串返回0"""
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return 0
+
+def traced(stage, bytes_in=None, bytes_out=None):
+    """为函数添加计时span的装饰器
+
+    bytes_in 在调用结束后以原参数计算输入字节数，bytes_out 以返回值计算输出字节数。
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage) as data:
+                result = fn(*args, **kwargs)
+                try:
+                    if bytes_in is not None:
+                        data['bytes_in'] = bytes_in(*args, **kwargs)
+                    if bytes_out is not None:
+                        data['bytes_out'] = bytes_out(result)
+                except Exception:
+                    pass
+                return result
+        return wrapper
+    return decorator
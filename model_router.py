@@ -0,0 +1,91 @@
+import os
+import re
+import json
+import logging
+from collections import namedtuple
+
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+# 默认各档位都使用原来的模型；可通过界面或环境变量 PPT_MODEL_TIERS（JSON）配置
+DEFAULT_TIERS = {
+    'light': 'gpt-3.5-turbo',
+    'standard': 'gpt-3.5-turbo',
+    'heavy': 'gpt-3.5-turbo',
+}
+TIER_LABELS = {
+    'light': '轻量模型（标题、短文本）',
+    'standard': '标准模型',
+    'heavy': '强力模型（长文本、结构密集）',
+}
+TEMPERATURE = 0.7
+
+# 只涉及格式或概括的任务固定使用轻量档位
+LIGHT_TASKS = ('title', 'reask')
+
+# 路由阈值：估算token数和结构密度
+LIGHT_MAX_TOKENS = 300
+LIGHT_MAX_DENSITY = 0.08
+HEAVY_MIN_TOKENS = 1500
+HEAVY_MIN_DENSITY = 0.25
+
+RouteDecision = namedtuple('RouteDecision', ['tier', 'model', 'temperature', 'tokens', 'density'])
+
+_CJK = re.compile(r'[一-鿿]')
+_WORD = re.compile(r'[A-Za-z]+')
+_NUMBER = re.compile(r'\d+(?:[.,]\d+)?%?')
+_STRUCTURE_LINE = re.compile(r'^\s*(?:\d+[.、)]|[a-zA-Z][.)]|[-•*]|[（(][一二三四五六七八九十\d]+[)）]|\|)')
+_SYMBOL = re.compile(r'[=<>≤≥±×÷∑√%$€¥/\\{}\[\]_^~]')
+
+def load_tiers():
+    """读取模型档位配置，环境变量中的配置覆盖默认值"""
+    tiers = dict(DEFAULT_TIERS)
+    raw = os.environ.get('PPT_MODEL_TIERS')
+    if raw:
+        try:
+            tiers.update({k: v for k, v in json.loads(raw).items() if k in tiers and v})
+        except (ValueError, AttributeError) as e:
+            logger.warning("PPT_MODEL_TIERS 配置无效：%s", e)
+    return tiers
+
+def estimate_tokens(text):
+    """本地估算token数：中文每字约1个，英文每词约1.3个，数字每段约1个"""
+    cjk = len(_CJK.findall(text))
+    words = len(_WORD.findall(text))
+    numbers = len(_NUMBER.findall(text))
+    return int(cjk + words * 1.3 + numbers)
+
+def structure_density(text):
+    """结构密度：列表/编号/表格行占比、数字和公式符号密度的加权和"""
+    lines = [line for line in text.split('\n') if line.strip()]
+    if not lines:
+        return 0.0
+    structured_lines = sum(1 for line in lines if _STRUCTURE_LINE.match(line)) / len(lines)
+    chars = max(len(text), 1)
+    numbers = len(_NUMBER.findall(text)) / chars * 10
+    symbols = len(_SYMBOL.findall(text)) / chars * 10
+    return round(0.5 * structured_lines + 0.3 * min(numbers, 1.0) + 0.2 * min(symbols, 1.0), 3)
+
+def choose_tier(tokens, density):
+    """根据估算token数和结构密度选择档位"""
+    if tokens >= HEAVY_MIN_TOKENS or density >= HEAVY_MIN_DENSITY:
+        return 'heavy'
+    if tokens <= LIGHT_MAX_TOKENS and density <= LIGHT_MAX_DENSITY:
+        return 'light'
+    return 'standard'
+
+def route(text, task='extract', tiers=None):
+    """为一次请求选择模型，标题生成和格式重问固定使用轻量档位"""
+    tiers = {**load_tiers(), **(tiers or {})}
+    tokens = estimate_tokens(text)
+    density = structure_density(text) if task == 'extract' else 0.0
+    tier = 'light' if task in LIGHT_TASKS else choose_tier(tokens, density)
+    decision = RouteDecision(tier, tiers[tier], TEMPERATURE, tokens, density)
+    logger.info("模型路由：任务=%s 档位=%s 模型=%s 估算token=%d 结构密度=%.3f",
+                task, tier, decision.model, tokens, density)
+    return decision
+
+def tier_span(decision):
+    """按档位计时的上下文，阶段名为 route_<档位>，便于比较各档位的延迟"""
+    return span(f"route_{decision.tier}", model=decision.model, estimated_tokens=decision.tokens)
@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import hashlib
+import uuid
+import queue
+import sqlite3
+import logging
+import tempfile
+import threading
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+# 任务数据库路径：保存用户上传的原文，默认放在只有当前用户可访问的独立目录中
+DEFAULT_DIR = os.path.join(tempfile.gettempdir(), 'ppt_pipeline')
+DB_PATH = os.environ.get('PPT_PIPELINE_DB', os.path.join(DEFAULT_DIR, 'pipeline.sqlite3'))
+# 后台写入的合并间隔（秒）：间隔内对同一数据的多次写入只保留最后一次
+FLUSH_INTERVAL = 0.5
+# 超过该天数未更新的任务在启动时和运行中清理，运行中最多每小时清理一次
+RETENTION_DAYS = float(os.environ.get('PPT_PIPELINE_RETENTION_DAYS', 7))
+CLEANUP_INTERVAL = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    step INTEGER NOT NULL DEFAULT 1,
+    source_text TEXT,
+    edited_text TEXT,
+    titles_key TEXT,
+    main_title TEXT
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE TABLE IF NOT EXISTS results (
+    job_id TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    content TEXT NOT NULL,
+    meta TEXT,
+    PRIMARY KEY (job_id, position)
+);
+"""
+# 随提炼结果保存的其他字段（层级汇总的页面类型和对应的文本块范围、是否为本地草稿）
+RESULT_META_KEYS = ('level', 'chunk_range', 'draft')
+
+def new_job_id():
+    """生成新的任务编号"""
+    return uuid.uuid4().hex[:16]
+
+def _prepare(path):
+    """创建数据库目录和文件，只允许当前用户读写"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if os.path.abspath(directory) == os.path.abspath(DEFAULT_DIR):
+            os.chmod(directory, 0o700)
+    # WAL和共享内存文件沿用数据库文件的权限
+    os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+    os.chmod(path, 0o600)
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+class PipelineStore:
+    """任务状态的SQLite存储：写入进入队列由后台线程批量提交，读取前先落盘"""
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        _prepare(path)
+        with closing(_connect(path)) as conn, conn:
+            conn.executescript(SCHEMA)
+            # 旧版本创建的数据库没有 meta 列
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(results)')}
+            if 'meta' not in columns:
+                conn.execute('ALTER TABLE results ADD COLUMN meta TEXT')
+            self._purge(conn)
+        self._last_purge = time.time()
+        self._queue = queue.Queue()
+        self._pending = {}
+        # 每个任务最近一次提交的原文摘要，页面每次重新运行时内容未变化的原文不再重复写入
+        self._document_digests = {}
+        self._pending_lock = threading.Lock()
+        self._flushed = threading.Condition(self._pending_lock)
+        self._thread = threading.Thread(target=self._writer, name='pipeline-store', daemon=True)
+        self._thread.start()
+
+    def _purge(self, conn):
+        cutoff = time.time() - RETENTION_DAYS * 86400
+        expired = [row[0] for row in conn.execute('SELECT job_id FROM jobs WHERE updated < ?', (cutoff,))]
+        for job_id in expired:
+            for table in ('chunks', 'results', 'jobs'):
+                conn.execute(f'DELETE FROM {table} WHERE job_id = ?', (job_id,))
+        if expired:
+            logger.info("清理过期任务 %d 个", len(expired))
+        return expired
+
+    # 写入：按 (任务, 类别) 合并，只保留最新的一次
+
+    def _enqueue(self, job_id, kind, payload):
+        with self._pending_lock:
+            self._pending[(job_id, kind)] = payload
+        self._queue.put(None)
+
+    def save_document(self, job_id, source_text, edited_text):
+        digest = hashlib.sha256(
+            json.dumps([source_text, edited_text], ensure_ascii=False).encode('utf-8')).hexdigest()
+        with self._pending_lock:
+            if self._document_digests.get(job_id) == digest:
+                return
+            self._document_digests[job_id] = digest
+        self._enqueue(job_id, 'document', (source_text, edited_text))
+
+    def save_step(self, job_id, step):
+        self._enqueue(job_id, 'step', step)
+
+    def save_chunks(self, job_id, chunks):
+        self._enqueue(job_id, 'chunks', list(chunks))
+
+    def save_results(self, job_id, extracted_contents):
+        results = []
+        for i, item in enumerate(extracted_contents):
+            meta = {key: item[key] for key in RESULT_META_KEYS if item.get(key) is not None}
+            results.append((item.get('chunk_index', i), item['title'], item['content'],
+                            json.dumps(meta, ensure_ascii=False) if meta else None))
+        self._enqueue(job_id, 'results', results)
+
+    def save_title(self, job_id, titles_key, main_title):
+        self._enqueue(job_id, 'title', (titles_key, main_title))
+
+    def _writer(self):
+        conn = _connect(self.path)
+        while True:
+            self._queue.get()
+            # 稍等片刻，合并短时间内的连续写入
+            time.sleep(FLUSH_INTERVAL)
+            self._drain(conn)
+            if time.time() - self._last_purge >= CLEANUP_INTERVAL:
+                self._last_purge = time.time()
+                try:
+                    with conn:
+                        expired = self._purge(conn)
+                except sqlite3.Error as e:
+                    logger.warning("清理过期任务失败：%s", e)
+                    continue
+                with self._pending_lock:
+                    for job_id in expired:
+                        self._document_digests.pop(job_id, None)
+
+    def _drain(self, conn):
+        with self._pending_lock:
+            batch = dict(self._pending)
+        if batch:
+            try:
+                with conn:
+                    for (job_id, kind), payload in batch.items():
+                        self._apply(conn, job_id, kind, payload)
+            except sqlite3.Error as e:
+                # 未写入的数据留在队列中，下次写入或 flush 时重试
+                logger.warning("任务状态写入失败：%s", e)
+                return
+        with self._pending_lock:
+            # 提交成功后才移出队列；提交期间又有新写入的数据保留，等待下一批
+            for key, payload in batch.items():
+                if self._pending.get(key) is payload:
+                    del self._pending[key]
+            self._flushed.notify_all()
+
+    def _apply(self, conn, job_id, kind, payload):
+        now = time.time()
+        conn.execute(
+            'INSERT INTO jobs (job_id, created, updated) VALUES (?, ?, ?) '
+            'ON CONFLICT(job_id) DO UPDATE SET updated = excluded.updated',
+            (job_id, now, now)
+        )
+        if kind == 'document':
+            conn.execute('UPDATE jobs SET source_text = ?, edited_text = ? WHERE job_id = ?',
+                         (*payload, job_id))
+        elif kind == 'step':
+            conn.execute('UPDATE jobs SET step = ? WHERE job_id = ?', (payload, job_id))
+        elif kind == 'title':
+            conn.execute('UPDATE jobs SET titles_key = ?, main_title = ? WHERE job_id = ?',
+                         (*payload, job_id))
+        elif kind == 'chunks':
+            conn.execute('DELETE FROM chunks WHERE job_id = ?', (job_id,))
+            conn.executemany('INSERT INTO chunks (job_id, idx, text) VALUES (?, ?, ?)',
+                             [(job_id, i, text) for i, text in enumerate(payload)])
+        elif kind == 'results':
+            conn.execute('DELETE FROM results WHERE job_id = ?', (job_id,))
+            conn.executemany(
+                'INSERT INTO results (job_id, chunk_index, position, title, content, meta) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(job_id, chunk_index, i, title, content, meta)
+                 for i, (chunk_index, title, content, meta) in enumerate(payload)]
+            )
+
+    def flush(self, timeout=5):
+        """等待已提交的写入全部落盘"""
+        with self._pending_lock:
+            if not self._pending:
+                return True
+            self._queue.put(None)
+            return self._flushed.wait_for(lambda: not self._pending, timeout)
+
+    # 读取
+
+    def load_job(self, job_id):
+        """读取任务状态，不存在时返回None"""
+        self.flush()
+        with closing(_connect(self.path)) as conn:
+            row = conn.execute(
+                'SELECT step, source_text, edited_text, titles_key, main_title FROM jobs WHERE job_id = ?',
+                (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            chunks = [text for (text,) in conn.execute(
+                'SELECT text FROM chunks WHERE job_id = ? ORDER BY idx', (job_id,))]
+            results = [
+                {'title': title, 'content': content, 'chunk_index': chunk_index,
+                 **(json.loads(meta) if meta else {})}
+                for chunk_index, title, content, meta in conn.execute(
+                    'SELECT chunk_index, title, content, meta FROM results WHERE job_id = ? ORDER BY position',
+                    (job_id,))
+            ]
+        step, source_text, edited_text, titles_key, main_title = row
+        return {
+            'job_id': job_id,
+            'step': step,
+            'source_text': source_text,
+            'edited_text': edited_text,
+            'chunks': chunks,
+            'extracted_contents': results,
+            'titles_key': titles_key,
+            'main_title': main_title,
+        }
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """返回进程内共享的任务存储（首次使用时创建）"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PipelineStore()
+        return _store
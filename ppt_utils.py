@@ -26,6 +26,108 @@ def format_line(line):
         return line, True, 2
     return line, False, 0
 
+# 导出版式参数（单位：英寸），create_ppt 与缩略图渲染共用同一份数据
+SLIDE_WIDTH = 16
+SLIDE_HEIGHT = 9
+TITLE_BOX = (1, 0.5, 14, 1)
+CONTENT_BOX = (1, 1.5, 14, 6.5)
+TITLE_FONT_SIZE = 40
+CONTENT_FONT_SIZE = 18
+CONTENT_LINE_SPACING = 1.5
+THEME_COLOR = (31, 118, 210)
+# 有图片的页面：内容区收窄到左侧，图片在右侧区域内自上而下排列
+CONTENT_BOX_WITH_PICTURES = (1, 1.5, 8.2, 6.5)
+PICTURE_BOX = (9.5, 1.5, 5.5, 6.5)
+PICTURE_GAP = 0.2
+MAX_SLIDE_PICTURES = 4
+
+def layout_content_lines(content):
+    """按导出规则解析内容，返回每个段落的文本、字号、加粗和层级"""
+    paragraphs = []
+    for line in content.split('\n'):
+        text = line.strip()
+        if not text:
+            continue
+        if text.startswith(('1.', '2.', '3.', '4.', '5.')):  # 一级标题
+            paragraphs.append({'text': text, 'size': 28, 'bold': True, 'level': 0})
+        elif text.startswith(('a.', 'b.', 'c.', 'd.')):  # 二级要点
+            paragraphs.append({'text': text, 'size': CONTENT_FONT_SIZE, 'bold': True, 'level': 1})
+        elif text.startswith(('-', '•')):  # 三级要点
+            paragraphs.append({'text': text, 'size': CONTENT_FONT_SIZE, 'bold': True, 'level': 2})
+        else:  # 普通内容
+            paragraphs.append({'text': text, 'size': CONTENT_FONT_SIZE, 'bold': False, 'level': 3})
+    return paragraphs
+
+def layout_pictures(sizes):
+    """按图片的像素尺寸计算各图片在图片区域内的位置 (左, 上, 宽, 高)，保持宽高比并居中"""
+    left, top, width, height = PICTURE_BOX
+    cell_height = (height - PICTURE_GAP * (len(sizes) - 1)) / max(len(sizes), 1)
+    boxes = []
+    for i, (pixel_width, pixel_height) in enumerate(sizes):
+        scale = min(width / pixel_width, cell_height / pixel_height)
+        box_width, box_height = pixel_width * scale, pixel_height * scale
+        boxes.append((
+            left + (width - box_width) / 2,
+            top + i * (cell_height + PICTURE_GAP) + (cell_height - box_height) / 2,
+            box_width,
+            box_height,
+        ))
+    return boxes
+
+def slide_pictures(images):
+    """返回一页中要放置的图片路径和位置 [(路径, (左, 上, 宽, 高)), ...]，缺失的图片跳过"""
+    from media_utils import image_path, image_size
+    paths = [path for path in map(image_path, images or ()) if path][:MAX_SLIDE_PICTURES]
+    return list(zip(paths, layout_pictures([image_size(path) for path in paths])))
+
+def fill_cover_slide(slide, main_title, subtitle_text="内容提炼报告"):
+    """填充封面幻灯片的主标题和副标题"""
+    title = slide.shapes.title
+    title.text = main_title
+    title.text_frame.paragraphs[0].font.size = Pt(60)
+    title.text_frame.paragraphs[0].font.color.rgb = RGBColor(*THEME_COLOR)
+    title.text_frame.paragraphs[0].alignment = PP_ALIGN.CENTER
+
+    subtitle = slide.placeholders[1]
+    subtitle.text = subtitle_text
+    subtitle.text_frame.paragraphs[0].font.size = Pt(40)
+    subtitle.text_frame.paragraphs[0].font.color.rgb = RGBColor(*THEME_COLOR)
+    subtitle.text_frame.paragraphs[0].alignment = PP_ALIGN.CENTER
+
+def fill_content_slide(slide, title, content, images=None):
+    """在空白幻灯片上按导出版式添加标题和分层内容，传入图片编号时在右侧放置图片"""
+    pictures = slide_pictures(images)
+    # 添加标题
+    title_box = slide.shapes.add_textbox(*(Inches(v) for v in TITLE_BOX))
+    title_frame = title_box.text_frame
+    title_frame.text = title
+    title_para = title_frame.paragraphs[0]
+    title_para.font.size = Pt(TITLE_FONT_SIZE)
+    title_para.font.color.rgb = RGBColor(*THEME_COLOR)
+    title_para.font.bold = True
+
+    # 添加内容
+    box = CONTENT_BOX_WITH_PICTURES if pictures else CONTENT_BOX
+    content_box = slide.shapes.add_textbox(*(Inches(v) for v in box))
+    content_frame = content_box.text_frame
+    if pictures:
+        # 内容区收窄后自动换行，避免文字压在图片上
+        content_frame.word_wrap = True
+    for item in layout_content_lines(content):
+        p = content_frame.add_paragraph()
+        p.text = item['text']
+        p.font.size = Pt(item['size'])
+        p.line_spacing = CONTENT_LINE_SPACING
+        if item['bold']:
+            p.font.bold = True
+        if item['level']:
+            p.level = item['level']
+
+    # 相同的图片在演示文稿中只保存一份，各页引用同一个媒体部件
+    for path, (left, top, width, height) in pictures:
+        slide.shapes.add_picture(path, Inches(left), Inches(top), Inches(width), Inches(height))
+    return slide
+
 def create_slide(prs, title, content):
     """创建一个新的PPT幻灯片，支持层级缩进"""
     # 使用标题和内容布局
@@ -84,10 +186,29 @@ def create_slide(prs, title, content):
     
     return slide
 
-def preview_ppt_in_streamlit(extracted_contents):
-    """在Streamlit中预览PPT内容"""
+def preview_ppt_in_streamlit(extracted_contents, columns=3):
+    """在Streamlit中以缩略图形式预览PPT内容"""
+    from slide_preview import render_thumbnails
+
     st.write("### PPT预览")
-    
+
+    try:
+        paths = render_thumbnails(extracted_contents)
+    except Exception as e:
+        st.warning(f"缩略图渲染失败，改用文本预览：{str(e)}")
+        preview_ppt_as_html(extracted_contents)
+        return
+
+    for row_start in range(0, len(paths), columns):
+        cols = st.columns(columns)
+        for offset, path in enumerate(paths[row_start:row_start + columns]):
+            i = row_start + offset
+            with cols[offset]:
+                st.image(path, caption=f"第 {i+1} 页：{extracted_contents[i]['title']}",
+                         use_column_width=True)
+
+def preview_ppt_as_html(extracted_contents):
+    """在Streamlit中以HTML近似方式预览PPT内容"""
     # 添加自定义CSS样式
     st.markdown("""
         <style>
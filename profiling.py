@@ -0,0 +1,258 @@
+"""按需性能剖析：对单次页面运行做 cProfile 函数剖析和 tracemalloc 内存分配统计"""
+import io
+import os
+import time
+import uuid
+import shutil
+import pstats
+import cProfile
+import zipfile
+import tempfile
+import threading
+import functools
+import tracemalloc
+import contextvars
+from contextlib import contextmanager
+
+ENABLED = os.environ.get('PPT_PROFILE', '') not in ('', '0')
+ADMIN = os.environ.get('PPT_PROFILE_ADMIN', '') not in ('', '0')
+AVAILABLE = ENABLED or ADMIN
+OUTPUT_DIR = os.environ.get('PPT_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'ppt_profiles'))
+# 保留的剖析结果数，超出时删除最早的
+MAX_PROFILES = 20
+# 分配统计的调用栈深度和输出条数
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 30
+TOP_FUNCTIONS = 40
+# 折叠调用栈的最大深度
+MAX_STACK_DEPTH = 100
+
+_active = contextvars.ContextVar('profiling_active', default=None)
+_session_sink = contextvars.ContextVar('profiling_session_sink', default=None)
+# cProfile 在进程内同一时间只能有一个（Python 3.12+ 第二个 enable() 会报错），所有会话共用这把锁
+_profiler_lock = threading.Lock()
+# tracemalloc 的使用计数；已由外部（例如 PYTHONTRACEMALLOC）开启时不负责停止
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+def bind_session(sink):
+    """剖析结果同时追加到会话自己的列表（用于侧边栏下载）"""
+    _session_sink.set(sink)
+
+def _start_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            _tracemalloc_users = 1
+        elif _tracemalloc_users:
+            _tracemalloc_users += 1
+
+def _stop_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users:
+            _tracemalloc_users -= 1
+            if _tracemalloc_users == 0:
+                tracemalloc.stop()
+
+def _memory():
+    return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+def _frame_name(func):
+    filename, line, name = func
+    if filename == '~':
+        # 内置函数，例如 <built-in method builtins.len>
+        return name.replace(';', ',')
+    return f"{name} ({os.path.basename(filename)}:{line})".replace(';', ',')
+
+def collapsed_stacks(stats):
+    """把 pstats 的调用关系展开为折叠调用栈，返回 {调用栈: 自身耗时(秒)}
+
+    cProfile 只记录调用者-被调用者的边，同一函数的耗时按各条边的累计耗时比例分摊到不同的调用路径。
+    """
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    roots = [func for func, entry in stats.items() if not any(caller in stats for caller in entry[4])]
+
+    stacks = {}
+    def walk(func, path, seconds):
+        total = stats[func][3]
+        if seconds <= 0 or total <= 0:
+            return
+        path = path + (func,)
+        ratio = seconds / total
+        own = stats[func][2] * ratio
+        for callee, edge_seconds in callees.get(func, ()):
+            if callee in path or len(path) >= MAX_STACK_DEPTH:
+                # 递归调用和过深的调用栈计入当前函数自身
+                own += edge_seconds * ratio
+                continue
+            walk(callee, path, edge_seconds * ratio)
+        if own > 0:
+            key = ";".join(_frame_name(f) for f in path)
+            stacks[key] = stacks.get(key, 0.0) + own
+
+    for root in roots:
+        walk(root, (), stats[root][3])
+    return stacks
+
+def _write_collapsed(stats, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, seconds in sorted(collapsed_stacks(stats).items()):
+            micros = int(round(seconds * 1e6))
+            if micros:
+                f.write(f"{stack} {micros}\n")
+
+def _write_allocations(snapshot, path):
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("按代码行统计（剖析结束时仍未释放的内存）\n")
+        for i, stat in enumerate(snapshot.statistics('lineno')[:TOP_ALLOCATIONS]):
+            frame = stat.traceback[0]
+            f.write(f"{i + 1}. {frame.filename}:{frame.lineno}  {stat.size / 1024:.1f} KB，{stat.count} 个对象\n")
+        f.write("\n按调用栈统计（前10条）\n")
+        for stat in snapshot.statistics('traceback')[:10]:
+            f.write(f"\n{stat.size / 1024:.1f} KB，{stat.count} 个对象\n")
+            for line in stat.traceback.format():
+                f.write(f"{line}\n")
+
+def _write_summary(run, stats, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"剖析：{run['label']}\n")
+        f.write(f"总耗时：{run['seconds']:.3f} 秒，内存峰值：{run['peak_bytes'] / 1024 / 1024:.1f} MB\n\n")
+        if run['sections']:
+            f.write("剖析区段\n")
+            for section in run['sections']:
+                f.write(f"  {section['name']}：{section['seconds']:.3f} 秒，"
+                        f"净分配 {section['allocated_bytes'] / 1024:.1f} KB\n")
+            f.write("\n")
+        buffer = io.StringIO()
+        pstats.Stats(stats, stream=buffer).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        f.write(buffer.getvalue())
+
+def _cleanup(output_dir):
+    try:
+        entries = sorted(
+            (entry for entry in os.scandir(output_dir) if entry.is_dir()),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+    except OSError:
+        return
+    for entry in entries[:-MAX_PROFILES]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+@contextmanager
+def profile_run(label, output_dir=None):
+    """剖析代码块，结束时写出结果文件；已在剖析中时直接执行（不嵌套剖析）
+
+    返回的字典在代码块结束后包含 path（结果目录）和 files（结果文件名）。
+    其他剖析正在进行时不剖析，返回 None。
+    """
+    if _active.get() is not None:
+        yield _active.get()
+        return
+    if not _profiler_lock.acquire(blocking=False):
+        yield None
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # 调试器、覆盖率等其他剖析工具已在运行
+        _profiler_lock.release()
+        yield None
+        return
+
+    output_dir = output_dir or OUTPUT_DIR
+    run = {'label': label, 'sections': [], 'created': time.time(), 'path': None, 'files': []}
+    run['_lock'] = threading.Lock()
+    token = _active.set(run)
+    _start_tracemalloc()
+    start = time.perf_counter()
+    try:
+        yield run
+    finally:
+        profiler.disable()
+        _profiler_lock.release()
+        run['seconds'] = time.perf_counter() - start
+        _active.reset(token)
+        snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        run['peak_bytes'] = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+        _stop_tracemalloc()
+        _save(run, profiler, snapshot, output_dir)
+
+def _save(run, profiler, snapshot, output_dir):
+    del run['_lock']
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{run['label']}-{uuid.uuid4().hex[:6]}"
+    path = os.path.join(output_dir, name)
+    os.makedirs(path, exist_ok=True)
+
+    profiler.create_stats()
+    stats = profiler.stats
+    profiler.dump_stats(os.path.join(path, 'profile.prof'))
+    _write_collapsed(stats, os.path.join(path, 'profile.collapsed'))
+    files = ['profile.prof', 'profile.collapsed']
+    if snapshot is not None:
+        _write_allocations(snapshot, os.path.join(path, 'allocations.txt'))
+        files.append('allocations.txt')
+    _write_summary(run, profiler, os.path.join(path, 'summary.txt'))
+    files.append('summary.txt')
+
+    run['path'] = path
+    run['files'] = files
+    _cleanup(output_dir)
+    sink = _session_sink.get()
+    if sink is not None:
+        sink.append(run)
+
+def profiled(name):
+    """标记剖析区段的装饰器：剖析进行中时记录该函数的耗时和净分配
+
+    未开启剖析功能时返回原函数本身。
+    """
+    def decorator(fn):
+        if not AVAILABLE:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            run = _active.get()
+            if run is None:
+                return fn(*args, **kwargs)
+            memory = _memory()
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                section = {
+                    'name': name,
+                    'seconds': time.perf_counter() - start,
+                    'allocated_bytes': _memory() - memory,
+                }
+                lock = run.get('_lock')
+                if lock is not None:
+                    with lock:
+                        run['sections'].append(section)
+        return wrapper
+    return decorator
+
+def archive(run):
+    """把一次剖析的全部结果文件打包为zip字节；结果只打包一次，缓存在 run 中供之后的页面运行复用"""
+    if not os.path.isdir(run['path']):
+        run.pop('archive', None)
+        raise FileNotFoundError(run['path'])
+    if run.get('archive') is None:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for filename in run['files']:
+                zf.write(os.path.join(run['path'], filename), filename)
+        run['archive'] = buffer.getvalue()
+    return run['archive']
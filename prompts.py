@@ -0,0 +1,159 @@
+# 提示词按"固定系统前缀 + 可变用户后缀"组织：固定规则放在系统消息中，
+# 每次请求的前缀完全相同，支持前缀缓存的后端可以直接复用；文本块放在用户消息末尾。
+
+EXTRACT_SYSTEM_PROMPT = """##目标
+提取并总结输入内容的关键信息，形成层次分明的要点说明，同时生成一个简短的标题（不超过20个字）。
+
+##要求：
+（1）内容完整性：
+- 保持原文的主要内容和关键信息，在原文基础上适度精简
+- 保留重要的数据、案例和专业术语
+- 确保每个要点都有充分的解释和必要的上下文
+
+（2）层级结构：
+- 识别并保持原文的层级关系
+- 使用缩进表示不同层级（每个子层级缩进2个空格）
+- 保持原文的逻辑组织结构
+- 对并列关系、递进关系、因果关系等进行清晰的层级划分
+
+（3）格式规范：
+- 使用数字编号标识主要层级（1. 2. 3.）
+- 使用字母编号标识次级层级（a. b. c.）
+- 使用符号标识更深层级（- 或 •）
+- 每个层级的标题使用3-8个字的短语
+- 在标题后详细展开该层级的具体内容
+- 使用分号分隔复杂内容中的多个方面
+
+（4）表达方式：
+- 保持专业性和准确性
+- 使用清晰、简洁的语言
+- 避免过度概括和模糊表达
+- 保留原文的重要表述方式和专业用语
+
+##特别说明：
+即使原文已经包含分点内容，也必须重新组织和提炼，确保内容更加精炼和结构化。
+
+##输出格式
+标题：[简短的标题]
+
+内容：
+1. [一级标题]：
+  a. [二级要点]：[详细说明]
+    - [三级要点]：[具体内容]
+  b. [二级要点]：[详细说明]
+2. [一级标题]：
+  a. [二级要点]：[详细说明]
+    - [三级要点]：[具体内容]
+……
+
+注意：
+1. 严格遵守缩进规则，确保层级关系清晰
+2. 保持原文的重要细节和专业表述
+3. 适度精简但不过度概括
+4. 确保每个层级都有充分的说明和解释
+
+用户消息即需要提炼的输入内容。"""
+
+# 精简版：保留格式约束和核心要求，删去重复的说明（cl100k编码下约141个token，完整版约544个）
+EXTRACT_SYSTEM_PROMPT_COMPACT = """提炼用户输入的要点并生成不超过20字的标题。
+要求：保留关键数据、案例和术语；保持原文层级与逻辑；适度精简，不过度概括；即使原文已分点也要重新组织。
+格式：一级用"1."，二级用"a."并缩进2空格，三级用"-"并缩进4空格；每级先写3-8字短语，冒号后展开说明。
+输出：
+标题：[标题]
+
+内容：
+1. [一级标题]：
+  a. [二级要点]：[说明]
+    - [三级要点]：[内容]"""
+
+EXTRACT_USER_PROMPT = "{text_block}"
+
+TITLE_SYSTEM_PROMPT = """请基于用户提供的文章内容，生成一个简短的总标题（不超过20个字）。标题应该：
+1. 准确概括文章的核心主题
+2. 使用简洁有力的语言
+3. 避免过于笼统的表述
+4. 突出文章的独特性和价值
+
+请直接输出标题，不要添加任何其他内容。"""
+
+TITLE_USER_PROMPT = "文章内容：\n{text}"
+
+# JSON模式下追加在系统前缀末尾的输出要求（仍属于固定前缀，花括号按模板语法转义）
+JSON_OUTPUT_INSTRUCTION = """
+
+##JSON输出
+只输出一个JSON对象，不要输出其他文字：
+{{"title": "简短的标题", "content": "按上述层级格式组织的内容，换行使用\\n"}}"""
+
+# 解析失败时的定向重问：只要求模型整理上一次的输出格式，不重新发送原文
+REASK_SYSTEM_PROMPT = """下面是一段内容提炼结果，但格式不符合要求。请只调整格式、不要改变内容，严格按以下格式输出：
+标题：[简短的标题]
+
+内容：
+1. [一级标题]：
+  a. [二级要点]：[详细说明]
+    - [三级要点]：[具体内容]"""
+
+REASK_USER_PROMPT = "{previous_output}"
+
+# 层级汇总：把同一文档中连续若干部分的提炼结果归纳为一个章节
+REDUCE_SYSTEM_PROMPT = """用户消息是同一文档中连续若干部分的提炼结果（每部分包含标题和内容）。请把它们归纳为一个章节：
+1. 生成一个概括本章节的简短标题（不超过20个字）
+2. 按原有顺序列出本章节的主要内容，合并重复的要点，保留关键数据和结论
+3. 只根据给出的内容归纳，不要补充原文没有的信息
+
+输出格式：
+标题：[章节标题]
+
+内容：
+1. [一级标题]：
+  a. [二级要点]：[详细说明]
+2. [一级标题]：
+  a. [二级要点]：[详细说明]"""
+
+REDUCE_USER_PROMPT = "{sections}"
+
+PROMPT_VARIANTS = {
+    'full': EXTRACT_SYSTEM_PROMPT,
+    'compact': EXTRACT_SYSTEM_PROMPT_COMPACT,
+}
+
+def build_messages(system_prompt, user_template):
+    """构造"系统前缀 + 用户后缀"的聊天提示模板"""
+    from langchain_core.prompts import ChatPromptTemplate
+    return ChatPromptTemplate.from_messages([
+        ("system", system_prompt),
+        ("human", user_template),
+    ])
+
+def extract_prompt(variant='full', json_mode=False):
+    """返回内容提炼使用的聊天提示模板"""
+    system_prompt = PROMPT_VARIANTS.get(variant, EXTRACT_SYSTEM_PROMPT)
+    if json_mode:
+        system_prompt += JSON_OUTPUT_INSTRUCTION
+    return build_messages(system_prompt, EXTRACT_USER_PROMPT)
+
+def reask_prompt():
+    """返回格式修复重问使用的聊天提示模板"""
+    return build_messages(REASK_SYSTEM_PROMPT, REASK_USER_PROMPT)
+
+def reduce_prompt():
+    """返回层级汇总归纳章节使用的聊天提示模板"""
+    return build_messages(REDUCE_SYSTEM_PROMPT, REDUCE_USER_PROMPT)
+
+def title_prompt():
+    """返回总标题生成使用的聊天提示模板"""
+    return build_messages(TITLE_SYSTEM_PROMPT, TITLE_USER_PROMPT)
+
+def count_tokens(text):
+    """统计文本的token数，没有tiktoken时按字符粗略估算"""
+    try:
+        import tiktoken
+        return len(tiktoken.get_encoding('cl100k_base').encode(text))
+    except Exception:
+        cjk = sum(1 for ch in text if '一' <= ch <= '鿿')
+        return cjk + (len(text) - cjk) // 4 + 1
+
+def prompt_token_savings():
+    """返回完整版和精简版系统提示词的token数"""
+    return {variant: count_tokens(prompt) for variant, prompt in PROMPT_VARIANTS.items()}
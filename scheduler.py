@@ -0,0 +1,243 @@
+"""本机所有Streamlit进程共享的大模型调用调度：全局并发上限、RPM/TPM令牌桶和按会话公平排队"""
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import tempfile
+import threading
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get('PPT_SCHEDULER', '') not in ('', '0')
+MAX_CONCURRENT = int(os.environ.get('PPT_SCHED_CONCURRENCY', 16))
+RPM = float(os.environ.get('PPT_SCHED_RPM', 0))
+TPM = float(os.environ.get('PPT_SCHED_TPM', 0))
+STATE_DIR = os.environ.get(
+    'PPT_SCHED_DIR',
+    os.path.join(tempfile.gettempdir(), 'ppt_scheduler')
+)
+# 等待中的请求超过该秒数未刷新视为已放弃；已放行的请求超过该秒数未释放视为已结束
+WAIT_STALE_SECONDS = 10.0
+GRANT_TTL_SECONDS = 300.0
+# 排队时轮询状态文件的间隔（秒）
+POLL_MIN = 0.02
+POLL_MAX = 0.25
+
+_current_user = contextvars.ContextVar('scheduler_user', default='anonymous')
+
+def bind_user(user):
+    """设置当前上下文的用户标识，工作线程复制上下文后沿用"""
+    _current_user.set(user)
+
+def current_user():
+    return _current_user.get()
+
+if sys.platform == 'win32':
+    import msvcrt
+
+    @contextmanager
+    def _file_lock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    @contextmanager
+    def _file_lock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def _pid_alive(pid):
+    try:
+        import psutil
+        return psutil.pid_exists(pid)
+    except ImportError:
+        return True
+
+class GlobalScheduler:
+    """基于文件锁的跨进程公平调度器"""
+
+    def __init__(self, state_dir=STATE_DIR, max_concurrent=MAX_CONCURRENT, rpm=RPM, tpm=TPM):
+        os.makedirs(state_dir, exist_ok=True)
+        self.state_path = os.path.join(state_dir, 'state.json')
+        self.lock_path = os.path.join(state_dir, 'state.lock')
+        self.max_concurrent = max_concurrent
+        self.rpm = rpm
+        self.tpm = tpm
+        # 同一进程内的线程先在进程锁上排队，再竞争文件锁
+        self._local = threading.Lock()
+        # 本进程释放名额时立即唤醒本进程的排队线程，其他进程的释放靠轮询发现
+        self._released = threading.Condition()
+
+    # 状态读写
+
+    @contextmanager
+    def _state(self):
+        with self._local, open(self.lock_path, 'a+b') as lock_file, _file_lock(lock_file):
+            try:
+                with open(self.state_path, encoding='utf-8') as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = {}
+            state.setdefault('waiting', {})
+            state.setdefault('running', {})
+            state.setdefault('tags', {})
+            state.setdefault('vclock', 0.0)
+            state.setdefault('buckets', {'rpm': self.rpm, 'tpm': self.tpm, 'refilled': time.time()})
+            self._cleanup(state)
+            self._refill(state)
+            yield state
+            tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_path)
+
+    def _cleanup(self, state):
+        """清理已放弃的排队请求和未释放的放行记录（进程退出或超时）"""
+        now = time.time()
+        for ticket, entry in list(state['waiting'].items()):
+            if now - entry['seen'] > WAIT_STALE_SECONDS or not _pid_alive(entry['pid']):
+                del state['waiting'][ticket]
+        for ticket, entry in list(state['running'].items()):
+            if now - entry['granted'] > GRANT_TTL_SECONDS or not _pid_alive(entry['pid']):
+                del state['running'][ticket]
+        # 没有排队请求的用户，标签落后于虚拟时钟时不再需要保存
+        waiting_users = {entry['user'] for entry in state['waiting'].values()}
+        for user, tag in list(state['tags'].items()):
+            if user not in waiting_users and tag <= state['vclock']:
+                del state['tags'][user]
+
+    def _refill(self, state):
+        buckets = state['buckets']
+        now = time.time()
+        elapsed = max(0.0, now - buckets['refilled'])
+        buckets['refilled'] = now
+        if self.rpm:
+            buckets['rpm'] = min(self.rpm, buckets['rpm'] + elapsed * self.rpm / 60)
+        if self.tpm:
+            buckets['tpm'] = min(self.tpm, buckets['tpm'] + elapsed * self.tpm / 60)
+
+    # 公平排队
+
+    @staticmethod
+    def _order(state):
+        """按公平顺序排列全部排队请求：标签小的用户优先，同一用户按先后顺序"""
+        queues = {}
+        for ticket, entry in sorted(state['waiting'].items(), key=lambda item: item[1]['enqueued']):
+            queues.setdefault(entry['user'], []).append(ticket)
+        tags = {user: max(state['tags'].get(user, 0.0), state['vclock']) for user in queues}
+        order = []
+        while queues:
+            user = min(queues, key=lambda u: (tags[u], state['waiting'][queues[u][0]]['enqueued']))
+            order.append(queues[user].pop(0))
+            tags[user] += 1
+            if not queues[user]:
+                del queues[user]
+        return order
+
+    def _budget_ok(self, state, tokens):
+        buckets = state['buckets']
+        if self.rpm and buckets['rpm'] < 1:
+            return False
+        # 单个请求超过TPM上限时，令牌桶满即可放行，避免永远等待
+        if self.tpm and buckets['tpm'] < min(tokens, self.tpm):
+            return False
+        return len(state['running']) < self.max_concurrent
+
+    def acquire(self, user, tokens=0, timeout=None):
+        """排队直到轮到本请求且预算允许，返回放行编号（需调用 release）"""
+        ticket = uuid.uuid4().hex
+        deadline = None if timeout is None else time.monotonic() + timeout
+        poll = POLL_MIN
+        enqueued = time.time()
+        with self._state() as state:
+            state['waiting'][ticket] = {'user': user, 'tokens': tokens, 'pid': os.getpid(),
+                                        'enqueued': enqueued, 'seen': enqueued}
+        try:
+            while True:
+                with self._state() as state:
+                    entry = state['waiting'].get(ticket)
+                    if entry is None:
+                        # 长时间未刷新被清理（例如进程被挂起）时按原来的排队时间重新加入，不丢失位置
+                        entry = state['waiting'][ticket] = {
+                            'user': user, 'tokens': tokens, 'pid': os.getpid(),
+                            'enqueued': enqueued, 'seen': time.time()}
+                    entry['seen'] = time.time()
+                    order = self._order(state)
+                    if order and order[0] == ticket and self._budget_ok(state, tokens):
+                        del state['waiting'][ticket]
+                        state['running'][ticket] = {'user': user, 'pid': os.getpid(), 'granted': time.time()}
+                        tag = max(state['tags'].get(user, 0.0), state['vclock'])
+                        state['vclock'] = tag
+                        state['tags'][user] = tag + 1
+                        if self.rpm:
+                            state['buckets']['rpm'] -= 1
+                        if self.tpm:
+                            state['buckets']['tpm'] -= min(tokens, self.tpm)
+                        return ticket
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise TimeoutError("等待全局调度超时")
+                with self._released:
+                    notified = self._released.wait(poll)
+                poll = POLL_MIN if notified else min(POLL_MAX, poll * 1.5)
+        except BaseException:
+            with self._state() as state:
+                state['waiting'].pop(ticket, None)
+            raise
+
+    def release(self, ticket):
+        """请求结束，释放并发名额"""
+        with self._state() as state:
+            state['running'].pop(ticket, None)
+        with self._released:
+            self._released.notify_all()
+
+    @contextmanager
+    def slot(self, user, tokens=0, timeout=None):
+        ticket = self.acquire(user, tokens, timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def status(self, user):
+        """返回用户的排队情况：最靠前请求的位置（前面的请求数）、排队数和进行中的请求数"""
+        with self._state() as state:
+            order = self._order(state)
+            positions = [i for i, ticket in enumerate(order) if state['waiting'][ticket]['user'] == user]
+            return {
+                'position': positions[0] if positions else None,
+                'waiting': len(positions),
+                'running': sum(1 for entry in state['running'].values() if entry['user'] == user),
+                'queued_total': len(order),
+                'running_total': len(state['running']),
+            }
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """返回进程内共享的调度器，关闭全局调度或状态目录不可用时返回None"""
+    global _scheduler
+    if not ENABLED:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            try:
+                _scheduler = GlobalScheduler()
+            except OSError as e:
+                logger.warning("全局调度不可用：%s", e)
+                return None
+        return _scheduler
@@ -0,0 +1,156 @@
+import os
+import json
+import hashlib
+import time
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from ppt_utils import (
+    SLIDE_WIDTH, SLIDE_HEIGHT, TITLE_BOX, CONTENT_BOX, TITLE_FONT_SIZE,
+    CONTENT_LINE_SPACING, THEME_COLOR, layout_content_lines, slide_pictures
+)
+
+# 缩略图分辨率：16x9英寸 * 40dpi = 640x360像素
+THUMBNAIL_DPI = 40
+# 版式变化时递增，使旧的缩略图缓存失效
+LAYOUT_VERSION = 1
+# 每级缩进的宽度（英寸）
+LEVEL_INDENT = 0.5
+# 缩略图缓存目录
+CACHE_DIR = os.environ.get(
+    'PPT_THUMBNAIL_CACHE',
+    os.path.join(tempfile.gettempdir(), 'ppt_thumbnails')
+)
+# 超过保留天数未使用的缩略图在下次渲染时删除，清理最多每小时进行一次
+RETENTION_DAYS = float(os.environ.get('PPT_THUMBNAIL_RETENTION_DAYS', 7))
+CLEANUP_INTERVAL = 3600
+# 中文字体候选列表，按顺序回退
+CJK_FONTS = [
+    'Microsoft YaHei', 'SimHei', 'PingFang SC', 'Noto Sans CJK SC',
+    'Source Han Sans SC', 'WenQuanYi Micro Hei', 'DejaVu Sans'
+]
+
+_executor = None
+_executor_lock = threading.Lock()
+_last_cleanup = 0.0
+
+def slide_hash(title, content, images=None):
+    """根据标题、内容、图片和版式版本计算幻灯片内容哈希"""
+    payload = json.dumps([LAYOUT_VERSION, THUMBNAIL_DPI, title, content] + ([list(images)] if images else []),
+                         ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def thumbnail_path(digest):
+    """返回缩略图在磁盘缓存中的路径"""
+    return os.path.join(CACHE_DIR, f"{digest}.png")
+
+def render_slide_png(title, content, path, pictures=()):
+    """使用matplotlib按导出版式将一页幻灯片渲染为PNG，pictures 为 [(图片路径, (左, 上, 宽, 高)), ...]"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from PIL import Image
+
+    plt.rcParams['font.sans-serif'] = CJK_FONTS
+    plt.rcParams['axes.unicode_minus'] = False
+
+    fig = plt.figure(figsize=(SLIDE_WIDTH, SLIDE_HEIGHT), dpi=THUMBNAIL_DPI)
+    fig.patch.set_facecolor('white')
+    color = tuple(c / 255 for c in THEME_COLOR)
+
+    def to_fig(x, y):
+        # 幻灯片坐标以左上角为原点，matplotlib以左下角为原点
+        return x / SLIDE_WIDTH, 1 - y / SLIDE_HEIGHT
+
+    # 标题：与导出时的文本框位置一致，文本不换行
+    left, top, _, _ = TITLE_BOX
+    fig.text(*to_fig(left + 0.1, top + 0.05), title, fontsize=TITLE_FONT_SIZE,
+             fontweight='bold', color=color, va='top', ha='left', clip_on=True)
+
+    # 内容：导出时文本框首行为空段落，这里同样从一个空行之后开始排版
+    left, top, _, _ = CONTENT_BOX
+    y = top + 0.05 + 18 * CONTENT_LINE_SPACING / 72
+    for item in layout_content_lines(content):
+        if y > SLIDE_HEIGHT:
+            break
+        x = left + 0.1 + LEVEL_INDENT * item['level']
+        fig.text(*to_fig(x, y), item['text'], fontsize=item['size'],
+                 fontweight='bold' if item['bold'] else 'normal',
+                 color='black', va='top', ha='left', clip_on=True)
+        y += item['size'] * CONTENT_LINE_SPACING / 72
+
+    # 图片：按缩略图分辨率缩小后绘制在导出时的位置
+    for picture_path, (left, top, width, height) in pictures:
+        with Image.open(picture_path) as image:
+            image.thumbnail((int(width * THUMBNAIL_DPI) + 1, int(height * THUMBNAIL_DPI) + 1))
+            axes = fig.add_axes([left / SLIDE_WIDTH, 1 - (top + height) / SLIDE_HEIGHT,
+                                 width / SLIDE_WIDTH, height / SLIDE_HEIGHT])
+            axes.imshow(image.convert('RGBA'))
+            axes.axis('off')
+
+    # 先写入临时文件再替换，避免并发读到不完整的图片
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fig.savefig(tmp_path, format='png', dpi=THUMBNAIL_DPI)
+    plt.close(fig)
+    os.replace(tmp_path, path)
+    return path
+
+def get_executor():
+    """获取进程内共享的渲染进程池"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = min(4, os.cpu_count() or 1)
+            # 使用spawn启动工作进程：Streamlit进程中有多个线程，fork可能复制到被其他线程持有的锁
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+def _cleanup():
+    """删除超过保留天数未使用的缩略图"""
+    global _last_cleanup
+    now = time.time()
+    if now - _last_cleanup < CLEANUP_INTERVAL:
+        return
+    _last_cleanup = now
+    try:
+        entries = list(os.scandir(CACHE_DIR))
+    except OSError:
+        return
+    cutoff = now - RETENTION_DAYS * 86400
+    for entry in entries:
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+        except OSError:
+            pass
+
+def render_thumbnails(extracted_contents):
+    """为每页内容返回缩略图路径，只渲染缓存中不存在的页面"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    _cleanup()
+
+    paths = []
+    pending = {}
+    for item in extracted_contents:
+        path = thumbnail_path(slide_hash(item['title'], item['content'], item.get('images')))
+        paths.append(path)
+        if path in pending:
+            continue
+        try:
+            # 更新修改时间，仍在使用的缩略图不会被清理
+            os.utime(path)
+        except OSError:
+            pending[path] = (item['title'], item['content'], slide_pictures(item.get('images')))
+
+    if pending:
+        executor = get_executor()
+        futures = [
+            executor.submit(render_slide_png, title, content, path, pictures)
+            for path, (title, content, pictures) in pending.items()
+        ]
+        for future in futures:
+            future.result()
+
+    return paths
@@ -0,0 +1,105 @@
+import json
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+from model_router import load_tiers
+
+logger = logging.getLogger(__name__)
+
+# 后台预提炼的线程数，请求并发仍由端点的调用闸门控制
+MAX_WORKERS = 4
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """返回进程内共享的预提炼线程池（首次使用时创建）"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='speculative')
+        return _executor
+
+def config_key(api_key, base_url, prompt_variant='full', json_mode=False, model_tiers=None):
+    """提炼配置的哈希：配置变化后旧的预提炼结果不再使用"""
+    model_tiers = {**load_tiers(), **(model_tiers or {})}
+    payload = json.dumps(
+        [hashlib.sha256((api_key or '').encode('utf-8')).hexdigest(), base_url,
+         prompt_variant, bool(json_mode), sorted(model_tiers.items())],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def chunk_key(chunk, config):
+    """文本块内容与提炼配置共同决定的结果键"""
+    return hashlib.sha256(f"{config}\n{chunk}".encode('utf-8')).hexdigest()
+
+class SpeculativeExtractor:
+    """会话级的后台预提炼：分割完成后立即提炼，步骤3直接复用已完成的结果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._futures = {}
+        self._cancelled = threading.Event()
+
+    def start(self, chunks, extract_fn, api_key, base_url, prompt_variant='full',
+              json_mode=False, model_tiers=None):
+        """为尚未提炼的文本块提交后台任务，并丢弃已不在当前文本块中的结果"""
+        config = config_key(api_key, base_url, prompt_variant, json_mode, model_tiers)
+        keys = {chunk_key(chunk, config): chunk for chunk in chunks}
+        self._cancelled.clear()
+        self.discard_except(keys)
+
+        submitted = 0
+        with self._lock:
+            for key, chunk in keys.items():
+                if key in self._futures:
+                    continue
+                # 复制当前上下文，使后台任务的计时记录归属到本会话
+                self._futures[key] = get_executor().submit(
+                    copy_context().run, self._run, extract_fn, chunk, api_key, base_url,
+                    prompt_variant, json_mode, model_tiers
+                )
+                submitted += 1
+        if submitted:
+            logger.info("后台预提炼：提交 %d 个文本块", submitted)
+        return submitted
+
+    def _run(self, extract_fn, chunk, api_key, base_url, prompt_variant, json_mode, model_tiers):
+        # 取消后尚未开始的任务直接跳过；已发出的请求无法中断，结果会被丢弃
+        if self._cancelled.is_set():
+            return None
+        return extract_fn(chunk, api_key, base_url, True, prompt_variant, json_mode, model_tiers)
+
+    def discard_except(self, keys):
+        """取消并丢弃不在 keys 中的任务（对应的文本块已被修改或删除）"""
+        with self._lock:
+            for key in [key for key in self._futures if key not in keys]:
+                self._futures.pop(key).cancel()
+
+    def cancel(self):
+        """取消全部后台任务并清空结果"""
+        self._cancelled.set()
+        with self._lock:
+            for future in self._futures.values():
+                future.cancel()
+            self._futures.clear()
+
+    def future_for(self, chunk, config):
+        """返回可复用的任务：进行中或已成功完成的任务，失败或已取消的返回None"""
+        with self._lock:
+            future = self._futures.get(chunk_key(chunk, config))
+        if future is None or future.cancelled():
+            return None
+        if future.done() and (future.exception() is not None or future.result() is None):
+            return None
+        return future
+
+    def progress(self, chunks, config):
+        """返回 (已完成数, 已提交数)，用于界面展示"""
+        futures = [self.future_for(chunk, config) for chunk in chunks]
+        futures = [future for future in futures if future is not None]
+        return sum(1 for future in futures if future.done()), len(futures)
@@ -1,12 +1,26 @@
 import os
 import sys
+import re
 import time
+import asyncio
+import signal
+import argparse
 import psutil
 import subprocess
 import webbrowser
 import socket
+import urllib.request
 from pathlib import Path
 
+# 应用入口
+APP_FILE = "app_new.py"
+# 就绪探测：Streamlit的健康检查接口返回 "ok"
+HEALTH_PATH = "/_stcore/health"
+READY_TIMEOUT = 60
+PROBE_INTERVAL = 0.2
+# 多进程模式下的健康检查间隔（秒）
+HEALTH_CHECK_INTERVAL = 10
+
 def is_port_in_use(port):
     """检查端口是否被占用"""
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
@@ -16,26 +30,48 @@ def is_port_in_use(port):
         except socket.error:
             return True
 
+def port_owners(ports):
+    """一次扫描系统连接表，返回 {端口: 监听该端口的进程PID集合}"""
+    ports = set(ports)
+    owners = {}
+    try:
+        for conn in psutil.net_connections(kind='inet'):
+            if conn.status == psutil.CONN_LISTEN and conn.laddr.port in ports and conn.pid:
+                owners.setdefault(conn.laddr.port, set()).add(conn.pid)
+    except psutil.AccessDenied:
+        # 部分系统（如macOS）需要权限才能读取全部连接，退回逐个进程检查
+        for proc in psutil.process_iter(['pid']):
+            try:
+                # psutil 6.0 起 connections() 更名为 net_connections()
+                connections = getattr(proc, 'net_connections', None) or proc.connections
+                for conn in connections(kind='inet'):
+                    if conn.status == psutil.CONN_LISTEN and conn.laddr.port in ports:
+                        owners.setdefault(conn.laddr.port, set()).add(proc.pid)
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                pass
+    return owners
+
+def kill_processes_on_ports(ports):
+    """终止占用指定端口的进程，返回已释放的端口集合"""
+    freed = set()
+    procs = []
+    for port, pids in port_owners(ports).items():
+        for pid in pids:
+            try:
+                proc = psutil.Process(pid)
+                print(f"正在终止占用端口 {port} 的进程 (PID: {pid}, 名称: {proc.name()})")
+                proc.terminate()
+                procs.append(proc)
+                freed.add(port)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+    # 等待进程退出，而不是固定等待
+    psutil.wait_procs(procs, timeout=5)
+    return freed
+
 def kill_process_on_port(port):
     """终止占用指定端口的进程"""
-    killed = False
-    for proc in psutil.process_iter(['pid', 'name', 'connections']):
-        try:
-            for conn in proc.connections():
-                if conn.laddr.port == port:
-                    print(f"正在终止占用端口 {port} 的进程 (PID: {proc.pid}, 名称: {proc.name()})")
-                    try:
-                        psutil.Process(proc.pid).terminate()
-                        killed = True
-                    except psutil.NoSuchProcess:
-                        pass
-        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-            pass
-    
-    if killed:
-        time.sleep(2)  # 等待进程完全终止
-        return True
-    return False
+    return port in kill_processes_on_ports([port])
 
 def find_available_port(start_port=8501, max_attempts=10):
     """查找可用端口"""
@@ -69,6 +105,47 @@ def check_network():
     except OSError:
         return False
 
+def streamlit_command(app_path, port, address="127.0.0.1"):
+    """构建启动Streamlit的命令"""
+    return [
+        sys.executable,  # Python解释器路径
+        "-m", "streamlit", "run",
+        str(app_path),
+        "--server.port", str(port),
+        "--server.address", address,  # 使用IP地址而不是localhost
+        "--browser.serverAddress", "127.0.0.1",
+        "--server.headless", "true",
+        "--server.enableCORS", "false",
+        "--server.enableXsrfProtection", "false",
+        "--server.maxUploadSize", "10",
+        "--server.maxMessageSize", "200"
+    ]
+
+def popen_options():
+    """Windows下在新窗口中运行，其他系统使用默认方式"""
+    if sys.platform == "win32":
+        return {"creationflags": subprocess.CREATE_NEW_CONSOLE}
+    return {}
+
+def probe_health(port, timeout=2):
+    """请求Streamlit健康检查接口，返回是否就绪"""
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}{HEALTH_PATH}", timeout=timeout) as resp:
+            return resp.status == 200
+    except OSError:
+        return False
+
+def wait_until_ready(port, process, timeout=READY_TIMEOUT):
+    """轮询健康检查接口直到应用就绪，返回耗时（秒）；进程退出或超时返回None"""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if process.poll() is not None:
+            return None
+        if probe_health(port, timeout=1):
+            return time.perf_counter() - start
+        time.sleep(PROBE_INTERVAL)
+    return None
+
 def start_streamlit():
     """启动Streamlit应用"""
     try:
@@ -91,19 +168,7 @@ def start_streamlit():
             return
         
         # 构建启动命令
-        cmd = [
-            sys.executable,  # Python解释器路径
-            "-m", "streamlit", "run",
-            str(current_dir / "app.py"),
-            "--server.port", str(port),
-            "--server.address", "127.0.0.1",  # 使用IP地址而不是localhost
-            "--browser.serverAddress", "127.0.0.1",
-            "--server.headless", "true",
-            "--server.enableCORS", "false",
-            "--server.enableXsrfProtection", "false",
-            "--server.maxUploadSize", "10",
-            "--server.maxMessageSize", "200"
-        ]
+        cmd = streamlit_command(current_dir / APP_FILE, port)
         
         print("正在启动应用...")
         print(f"启动命令: {' '.join(cmd)}")
@@ -114,28 +179,19 @@ def start_streamlit():
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
-            creationflags=subprocess.CREATE_NEW_CONSOLE  # 在新窗口中运行
+            **popen_options()
         )
         
-        # 等待应用启动
+        # 等待应用就绪：轮询健康检查接口，而不是固定等待
         print("等待应用启动...")
-        time.sleep(5)  # 增加等待时间
+        elapsed = wait_until_ready(port, process)
         
         # 检查进程是否还在运行
         if process.poll() is None:
-            # 尝试连接应用
-            max_retries = 3
-            for i in range(max_retries):
-                try:
-                    with socket.create_connection(("127.0.0.1", port), timeout=2):
-                        print("应用已成功启动！")
-                        break
-                except (socket.timeout, socket.error):
-                    if i < max_retries - 1:
-                        print(f"等待应用响应... ({i+1}/{max_retries})")
-                        time.sleep(2)
-                    else:
-                        print("警告：应用可能未正确启动，但仍在尝试打开浏览器")
+            if elapsed is not None:
+                print(f"应用已成功启动！（耗时 {elapsed:.2f} 秒）")
+            else:
+                print("警告：应用可能未正确启动，但仍在尝试打开浏览器")
             
             # 打开浏览器
             url = f"http://127.0.0.1:{port}"
@@ -164,6 +220,208 @@ def start_streamlit():
         input("按回车键退出...")
         sys.exit(1)
 
+class Worker:
+    """一个Streamlit工作进程"""
+
+    def __init__(self, index, port, app_path):
+        self.index = index
+        self.port = port
+        self.app_path = app_path
+        self.process = None
+        self.healthy = False
+
+    @property
+    def metrics_port(self):
+        """工作进程的指标服务端口：PPT_METRICS_PORT 加上工作进程序号，未设置时为None"""
+        base = int(os.environ.get('PPT_METRICS_PORT', 0) or 0)
+        return base + self.index if base else None
+
+    def start(self):
+        env = dict(os.environ)
+        # 多个工作进程共用同一份大模型配额，默认开启跨进程全局调度（PPT_SCHEDULER=0 可关闭）
+        env.setdefault('PPT_SCHEDULER', '1')
+        # 各工作进程的指标服务不能绑定同一个端口
+        if self.metrics_port:
+            env['PPT_METRICS_PORT'] = str(self.metrics_port)
+        # 工作进程的输出直接继承到当前控制台，避免管道写满阻塞
+        self.process = subprocess.Popen(streamlit_command(self.app_path, self.port), env=env, **popen_options())
+        self.healthy = False
+        return self
+
+    def wait_ready(self):
+        elapsed = wait_until_ready(self.port, self.process)
+        self.healthy = elapsed is not None
+        if self.healthy:
+            print(f"工作进程 {self.index} 已就绪：端口 {self.port}，PID {self.process.pid}，耗时 {elapsed:.2f} 秒"
+                  + (f"，指标端口 {self.metrics_port}" if self.metrics_port else ""))
+        else:
+            print(f"工作进程 {self.index} 启动失败：端口 {self.port}")
+        return self.healthy
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+# 记录会话所在工作进程的Cookie
+STICKY_COOKIE = 'ppt_worker'
+_STICKY_COOKIE_PATTERN = re.compile(rb'^cookie:.*?\b' + STICKY_COOKIE.encode() + rb'=(\d+)', re.IGNORECASE | re.MULTILINE)
+# 读取请求头和响应头的最大字节数
+MAX_HEAD_BYTES = 64 * 1024
+
+class StickyProxy:
+    """本地HTTP代理：按Cookie中记录的工作进程固定分配会话，新客户端轮流分配到健康的工作进程并写入Cookie
+
+    按Cookie而不是客户端IP分配，NAT或反向代理之后的多个用户也能分散到不同的工作进程；
+    记录的工作进程不健康时改派到下一个健康的工作进程。
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._next = 0
+
+    def pick(self, preferred=None):
+        if preferred is not None and 0 <= preferred < len(self.workers) and self.workers[preferred].healthy:
+            return self.workers[preferred]
+        for offset in range(len(self.workers)):
+            index = (self._next + offset) % len(self.workers)
+            if self.workers[index].healthy:
+                self._next = index + 1
+                return self.workers[index]
+        return None
+
+    @staticmethod
+    async def _read_head(reader):
+        """读取HTTP请求头或响应头（含结尾空行）；不是完整的HTTP头时返回已读到的数据"""
+        try:
+            return await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError as e:
+            return e.partial
+        except asyncio.LimitOverrunError:
+            return await reader.read(MAX_HEAD_BYTES)
+
+    async def handle(self, reader, writer):
+        head = await self._read_head(reader)
+        match = _STICKY_COOKIE_PATTERN.search(head)
+        preferred = int(match.group(1)) if match else None
+        worker = self.pick(preferred)
+        if worker is None:
+            writer.close()
+            return
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection('127.0.0.1', worker.port)
+        except OSError:
+            worker.healthy = False
+            writer.close()
+            return
+        upstream_writer.write(head)
+        # 新分配（或改派）的客户端在第一个响应中写入Cookie
+        cookie = None if worker.index == preferred else worker.index
+        # 双向转发，包括Streamlit的WebSocket连接
+        await asyncio.gather(
+            self._pipe(reader, upstream_writer),
+            self._pipe(upstream_reader, writer, cookie),
+        )
+
+    @classmethod
+    async def _pipe(cls, reader, writer, cookie=None):
+        try:
+            if cookie is not None:
+                head = await cls._read_head(reader)
+                if head.startswith(b'HTTP/'):
+                    status_line, rest = head.split(b'\r\n', 1)
+                    header = f"Set-Cookie: {STICKY_COOKIE}={cookie}; Path=/; HttpOnly; SameSite=Lax\r\n"
+                    head = status_line + b'\r\n' + header.encode() + rest
+                writer.write(head)
+                await writer.drain()
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+async def monitor_workers(workers):
+    """定期检查工作进程健康状态，状态变化时记录，退出的进程自动重启"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+        for worker in workers:
+            if worker.process.poll() is not None:
+                print(f"工作进程 {worker.index} 已退出（返回码 {worker.process.returncode}），正在重启")
+                worker.start()
+                await loop.run_in_executor(None, worker.wait_ready)
+                continue
+            healthy = await loop.run_in_executor(None, probe_health, worker.port)
+            if healthy != worker.healthy:
+                print(f"工作进程 {worker.index}（端口 {worker.port}）状态：{'正常' if healthy else '异常'}")
+            worker.healthy = healthy
+
+async def serve_cluster(workers, host, port):
+    proxy = StickyProxy(workers)
+    server = await asyncio.start_server(proxy.handle, host, port)
+    print(f"负载均衡代理已启动：http://{host}:{port}（{len(workers)} 个工作进程）")
+    async with server:
+        await asyncio.gather(server.serve_forever(), monitor_workers(workers))
+
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def start_cluster(num_workers, port=8501, worker_port=8601, host="127.0.0.1", open_browser=True):
+    """多进程模式：在端口段上启动多个工作进程，并通过粘性会话代理对外提供服务"""
+    start = time.perf_counter()
+    app_path = Path(__file__).parent.absolute() / APP_FILE
+    worker_ports = list(range(worker_port, worker_port + num_workers))
+
+    # 一次扫描释放代理端口和全部工作端口
+    busy = [p for p in [port] + worker_ports if is_port_in_use(p)]
+    if busy:
+        freed = kill_processes_on_ports(busy)
+        still_busy = [p for p in busy if p not in freed or is_port_in_use(p)]
+        if still_busy:
+            raise RuntimeError(f"端口仍被占用：{still_busy}")
+
+    # 收到终止信号时与Ctrl+C一样停止全部工作进程
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    workers = [Worker(i, p, app_path).start() for i, p in enumerate(worker_ports)]
+    try:
+        for worker in workers:
+            worker.wait_ready()
+        ready = sum(worker.healthy for worker in workers)
+        if not ready:
+            raise RuntimeError("没有可用的工作进程")
+        print(f"启动完成：{ready}/{num_workers} 个工作进程就绪，总耗时 {time.perf_counter() - start:.2f} 秒")
+
+        if open_browser:
+            webbrowser.open(f"http://{host}:{port}")
+        asyncio.run(serve_cluster(workers, host, port))
+    except KeyboardInterrupt:
+        print("正在停止...")
+    finally:
+        for worker in workers:
+            worker.stop()
+        for worker in workers:
+            try:
+                worker.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                worker.process.kill()
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="PPT制作工具启动器")
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('PPT_WORKERS', 1)),
+                        help="工作进程数，大于1时启用多进程模式和负载均衡代理")
+    parser.add_argument('--port', type=int, default=8501, help="多进程模式下代理监听的端口")
+    parser.add_argument('--worker-port', type=int, default=8601, help="工作进程的起始端口")
+    parser.add_argument('--host', default="127.0.0.1", help="代理监听的地址")
+    parser.add_argument('--no-browser', action='store_true', help="启动后不打开浏览器")
+    return parser
+
 if __name__ == "__main__":
     print("="*50)
     print("PPT制作工具启动器")
@@ -188,4 +446,12 @@ if __name__ == "__main__":
             input("按回车键退出...")
             sys.exit(1)
     
-    start_streamlit() 
\ No newline at end of file
+    args = build_parser().parse_args()
+    if args.workers > 1:
+        try:
+            start_cluster(args.workers, args.port, args.worker_port, args.host, not args.no_browser)
+        except RuntimeError as e:
+            print(f"错误: {str(e)}")
+            sys.exit(1)
+    else:
+        start_streamlit() 
\ No newline at end of file
@@ -0,0 +1,124 @@
+"""按步骤延迟导入重量级依赖，并提供启动耗时分析"""
+import os
+import sys
+import time
+import argparse
+import importlib
+import subprocess
+import threading
+
+# 各步骤需要的重量级依赖
+STEP_MODULES = {
+    1: ('chardet', 'docx', 'requests', 'bs4'),
+    2: ('langchain.text_splitter',),
+    3: ('langchain.chains', 'langchain_openai', 'pptx', 'ppt_utils', 'incremental_export'),
+}
+# 只在后台预热、渲染前不等待的依赖（步骤3的本地草稿，用到时才需要），进入步骤2后预热
+BACKGROUND_MODULES = ('sklearn.feature_extraction.text',)
+
+PROFILE = os.environ.get('PPT_PROFILE_STARTUP', '') not in ('', '0')
+
+# 本进程中各模块首次导入的耗时（秒）
+import_times = {}
+first_paint = {}
+
+# 后台预热与界面线程的导入互斥，避免两个线程同时初始化同一组模块
+_import_lock = threading.RLock()
+_warmed_steps = set()
+_warm_lock = threading.Lock()
+
+def import_modules(names):
+    """导入尚未加载的模块并记录耗时"""
+    for name in names:
+        if name in sys.modules:
+            continue
+        with _import_lock:
+            if name in sys.modules:
+                continue
+            start = time.perf_counter()
+            importlib.import_module(name)
+            import_times[name] = time.perf_counter() - start
+
+def ensure_step(step):
+    """确保指定步骤的依赖已导入（已导入时几乎没有开销）"""
+    import_modules(STEP_MODULES.get(step, ()))
+
+def warm_up(step):
+    """在后台预热下一步骤的依赖（每个进程每个步骤一次）；在页面渲染完成后调用，不与渲染争用CPU"""
+    names = STEP_MODULES.get(step + 1, ()) + (BACKGROUND_MODULES if step >= 2 else ())
+    with _warm_lock:
+        if step in _warmed_steps:
+            return None
+        _warmed_steps.add(step)
+
+    def run():
+        try:
+            import_modules(names)
+        except Exception:
+            # 预热失败不影响使用，真正用到时会再次导入并报错
+            pass
+    thread = threading.Thread(target=run, name=f'import-warmup-{step}', daemon=True)
+    thread.start()
+    return thread
+
+def record_first_paint():
+    """记录进程启动到首次渲染完成的耗时（每个进程一次）"""
+    if first_paint:
+        return
+    try:
+        import psutil
+        first_paint['seconds'] = time.time() - psutil.Process().create_time()
+    except Exception:
+        first_paint['seconds'] = None
+
+def parse_importtime(stderr):
+    """解析 python -X importtime 的输出，返回 [(模块, 自身耗时秒, 累计耗时秒)]"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return rows
+
+def profile_imports(statement='import app_new', cwd=None):
+    """在新进程中执行语句并返回导入耗时明细和总耗时"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        cwd=cwd or os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True
+    )
+    return parse_importtime(result.stderr), time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="启动导入耗时分析")
+    parser.add_argument('--top', type=int, default=20, help="显示累计耗时最多的模块数")
+    parser.add_argument('--steps', action='store_true', help="分别统计各步骤依赖的导入耗时")
+    args = parser.parse_args(argv)
+
+    rows, elapsed = profile_imports()
+    app_row = next((row for row in rows if row[0] == 'app_new'), None)
+    print(f"冷启动导入 app_new：{app_row[2] if app_row else 0:.3f} 秒（进程总耗时 {elapsed:.3f} 秒）")
+    print(f"{'模块':50s} {'自身(秒)':>10s} {'累计(秒)':>10s}")
+    for name, self_s, cumulative_s in sorted(rows, key=lambda row: -row[2])[:args.top]:
+        print(f"{name:50s} {self_s:10.3f} {cumulative_s:10.3f}")
+
+    if args.steps:
+        print("\n各步骤依赖的导入耗时（在已导入 app_new 的新进程中，按步骤顺序）：")
+        statement = (
+            "import app_new, startup\n"
+            "for step in sorted(startup.STEP_MODULES):\n"
+            "    startup.ensure_step(step)\n"
+            "for name, seconds in startup.import_times.items():\n"
+            "    print(f'{name}\\t{seconds}')"
+        )
+        result = subprocess.run([sys.executable, '-c', statement],
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True)
+        for line in result.stdout.splitlines():
+            name, seconds = line.split('\t')
+            print(f"{name:50s} {float(seconds):10.3f}")
+
+if __name__ == '__main__':
+    main()
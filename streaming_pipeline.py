@@ -0,0 +1,231 @@
+"""大文档模式的流式处理管道：读取、分块、提炼和追加幻灯片各阶段都是生成器"""
+import time
+import codecs
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+from metrics import span
+
+# 每次从文件读取的字节数
+BLOCK_SIZE = 64 * 1024
+# 默认文本块字符数
+CHUNK_SIZE = 2000
+# 在目标长度之前的这一比例范围内寻找段落或句子边界
+BOUNDARY_WINDOW = 0.4
+# 优先在段落处分块，其次在句子处
+SEPARATORS = ["\n\n", "\n", "。", "！", "？", ".", "!", "?", " "]
+# 同时进行提炼的文本块数上限
+MAX_IN_FLIGHT = 4
+# 刷新缩略图的间隔（页数和秒数）
+REFRESH_EVERY = 10
+REFRESH_SECONDS = 5.0
+
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+DRAWING_NS = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+VML_NS = '{urn:schemas-microsoft-com:vml}'
+REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PACKAGE_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+def _stream_encoding(encoding):
+    """流式解码使用的编码：GB2312按GB18030解码，ASCII按UTF-8解码"""
+    encoding = (encoding or 'utf-8').lower()
+    if encoding in ('gb2312', 'gbk'):
+        return 'gb18030'
+    if encoding == 'ascii':
+        return 'utf-8'
+    return encoding
+
+def read_txt_stream(file, block_size=BLOCK_SIZE):
+    """逐块读取txt文件并增量解码，编码根据开头部分检测"""
+    from chardet.universaldetector import UniversalDetector
+
+    first = file.read(block_size)
+    detector = UniversalDetector()
+    detector.feed(first)
+    detector.close()
+    decoder = codecs.getincrementaldecoder(_stream_encoding(detector.result['encoding']))(errors='replace')
+
+    block = first
+    while block:
+        text = decoder.decode(block)
+        if text:
+            yield text
+        block = file.read(block_size)
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+def _docx_image_targets(archive):
+    """读取正文的关系表，返回 {关系编号: 包内路径}，只包含嵌入的图片"""
+    from lxml import etree
+    import posixpath
+
+    try:
+        root = etree.fromstring(archive.read('word/_rels/document.xml.rels'))
+    except KeyError:
+        return {}
+    targets = {}
+    for rel in root.iter(f'{PACKAGE_REL_NS}Relationship'):
+        if rel.get('Type', '').endswith('/image') and rel.get('TargetMode') != 'External':
+            targets[rel.get('Id')] = posixpath.normpath(posixpath.join('word', rel.get('Target', '')))
+    return targets
+
+def read_docx_stream(file, on_image=None):
+    """逐段读取docx正文，解析XML时及时释放已处理的节点
+
+    传入 on_image 时，段落中的每个嵌入图片以 on_image(图片字节) 的返回值作为单独一段输出。
+    """
+    from lxml import etree
+
+    with zipfile.ZipFile(file) as archive:
+        images = _docx_image_targets(archive) if on_image else {}
+        with archive.open('word/document.xml') as xml:
+            for _, element in etree.iterparse(xml, events=('end',), tag=f'{WORD_NS}p'):
+                parts = []
+                for node in element.iter(f'{WORD_NS}t', f'{WORD_NS}tab', f'{WORD_NS}br'):
+                    if node.tag == f'{WORD_NS}t':
+                        parts.append(node.text or '')
+                    else:
+                        parts.append('\t' if node.tag == f'{WORD_NS}tab' else '\n')
+                text = ''.join(parts)
+                if text.strip():
+                    yield text + '\n\n'
+                if images:
+                    # DrawingML图片（a:blip）和旧版VML图片（v:imagedata）
+                    for node in element.iter(f'{DRAWING_NS}blip', f'{VML_NS}imagedata'):
+                        target = images.get(node.get(f'{REL_NS}embed') or node.get(f'{REL_NS}id'))
+                        if target:
+                            try:
+                                yield on_image(archive.read(target)) + '\n\n'
+                            except KeyError:
+                                pass
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+
+def read_text_stream(text, block_size=BLOCK_SIZE):
+    """把已在内存中的文本（例如从URL提取的文章）按块输出"""
+    for start in range(0, len(text), block_size):
+        yield text[start:start + block_size]
+
+def _cut_point(buffer, target):
+    """在目标长度之前寻找最近的段落或句子边界"""
+    window_start = int(target * (1 - BOUNDARY_WINDOW))
+    for separator in SEPARATORS:
+        pos = buffer.rfind(separator, window_start, target)
+        if pos >= 0:
+            return pos + len(separator)
+    return target
+
+def split_stream(pieces, chunk_size=CHUNK_SIZE):
+    """把文本流切分为文本块，边界确定后立即输出；None 表示文档边界，文本块不跨越文档"""
+    buffer = ''
+    for piece in pieces:
+        if piece is None:
+            chunk = buffer.strip()
+            buffer = ''
+            if chunk:
+                yield chunk
+            continue
+        buffer += piece
+        while len(buffer) >= chunk_size:
+            cut = _cut_point(buffer, chunk_size)
+            chunk = buffer[:cut].strip()
+            buffer = buffer[cut:]
+            if chunk:
+                yield chunk
+    chunk = buffer.strip()
+    if chunk:
+        yield chunk
+
+def extract_stream(chunks, extract_fn, max_in_flight=MAX_IN_FLIGHT):
+    """边读取文本块边提交提炼，按原顺序输出 (序号, 文本块长度, 结果, 错误信息)
+
+    最多同时保留 max_in_flight 个未完成的文本块，读取速度受提炼速度约束。
+    """
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        def drain_one():
+            index, length, future = pending.popleft()
+            try:
+                content, title, _ = future.result()
+                if content and title:
+                    return index, length, {'title': title, 'content': content, 'chunk_index': index}, None
+                return index, length, None, "模型输出中没有找到标题或内容"
+            except Exception as e:
+                return index, length, None, str(e)
+
+        try:
+            for index, chunk in enumerate(chunks):
+                # 复制当前上下文，使工作线程中的计时记录归属到本会话
+                pending.append((index, len(chunk), executor.submit(copy_context().run, extract_fn, chunk)))
+                if len(pending) >= max_in_flight:
+                    yield drain_one()
+            while pending:
+                yield drain_one()
+        finally:
+            # 提前停止（例如页面重新运行）时取消尚未开始的任务
+            for _, _, future in pending:
+                future.cancel()
+
+class StreamingDeck:
+    """随提炼结果逐页追加的演示文稿：每个结果到达时立即排版对应的幻灯片，结束时只补上封面并序列化"""
+
+    def __init__(self):
+        from incremental_export import IncrementalExporter
+        self._exporter = IncrementalExporter()
+        self.items = []
+        self._last_refresh = (0, time.perf_counter())
+
+    def add(self, item):
+        item = {'title': item['title'], 'content': item['content']}
+        self._exporter.append(item)
+        self.items.append(item)
+
+    def refresh_due(self):
+        """距上次刷新缩略图新增足够多的页数或经过足够长的时间，首页完成时也刷新一次"""
+        count, at = self._last_refresh
+        new = len(self.items) - count
+        if not new:
+            return False
+        return count == 0 or new >= REFRESH_EVERY or time.perf_counter() - at >= REFRESH_SECONDS
+
+    def mark_refreshed(self):
+        self._last_refresh = (len(self.items), time.perf_counter())
+
+    def finish(self, generate_title):
+        """生成总标题（只使用各页标题，不再传入全文）并返回最终的PPT字节；内容页已在 add 时排版，不再重建"""
+        titles_only = [{'title': item['title'], 'content': ''} for item in self.items]
+        main_title = generate_title(titles_only)
+        return self._exporter.export(self.items, lambda _: main_title)
+
+def run_pipeline(pieces, extract_fn, chunk_size=CHUNK_SIZE, max_in_flight=MAX_IN_FLIGHT):
+    """串联分块和提炼，逐个输出结果事件，同时记录首页耗时"""
+    start = time.perf_counter()
+    first = True
+    for index, length, item, error in extract_stream(split_stream(pieces, chunk_size), extract_fn,
+                                                     max_in_flight):
+        event = {'index': index, 'chars': length, 'item': item, 'error': error,
+                 'elapsed': time.perf_counter() - start}
+        if first and item is not None:
+            event['first_slide'] = True
+            first = False
+        yield event
+
+def open_stream(uploaded_file):
+    """根据文件类型返回文本流"""
+    name = uploaded_file.name.lower()
+    if name.endswith('.txt'):
+        return read_txt_stream(uploaded_file)
+    if name.endswith('.docx'):
+        return read_docx_stream(uploaded_file)
+    raise ValueError("不支持的文件格式")
+
+def open_streams(uploaded_files):
+    """依次输出多个文件的文本流，文件之间以 None 标记文档边界"""
+    for i, uploaded_file in enumerate(uploaded_files):
+        if i:
+            yield None
+        yield from open_stream(uploaded_file)
@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import time
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import batch_jobs
+from batch_jobs import LocalFileBackend, build_requests, chunk_index, collect, custom_id, to_jsonl
+
+FIRST = "第一段介绍项目的背景和目标，说明为什么需要这次改造以及预期的收益。" * 3
+SECOND = "第二段描述实施步骤，包括准备、迁移、验证和上线四个阶段的主要工作。" * 3
+
+def answer(title, content="- 要点"):
+    return {'choices': [{'message': {'content': f"标题：{title}\n内容：\n{content}"}}]}
+
+def ok_line(index, title):
+    return {'custom_id': custom_id(index, str(index)), 'error': None,
+            'response': {'status_code': 200, 'body': answer(title)}}
+
+class FakeBackend:
+    def __init__(self, lines):
+        self.lines = lines
+
+    def results(self, batch_id):
+        return self.lines
+
+def test_custom_id_is_stable():
+    assert custom_id(3, FIRST, 'full') == custom_id(3, FIRST, 'full')
+    assert custom_id(3, FIRST, 'full') != custom_id(3, SECOND, 'full')
+    assert custom_id(3, FIRST, 'full') != custom_id(3, FIRST, 'compact')
+    assert chunk_index(custom_id(42, FIRST)) == 42
+
+def test_build_requests_ids_stable_and_skip_duplicates():
+    pytest.importorskip('langchain_core')
+    pytest.importorskip('numpy')
+    chunks = [FIRST, SECOND, FIRST]
+    requests, duplicates = build_requests(chunks)
+    again, _ = build_requests(chunks)
+    assert [r['custom_id'] for r in requests] == [r['custom_id'] for r in again]
+    assert [chunk_index(r['custom_id']) for r in requests] == [0, 1]
+    assert duplicates == {2: (0, 1.0)}
+    assert requests[0]['url'] == batch_jobs.ENDPOINT
+    json_requests, _ = build_requests(chunks, json_mode=True)
+    assert json_requests[0]['custom_id'] != requests[0]['custom_id']
+    assert json_requests[0]['body']['response_format'] == {'type': 'json_object'}
+
+def test_collect_maps_results_to_chunks():
+    lines = [
+        ok_line(3, "第四页"),
+        {'custom_id': custom_id(0, '0'), 'response': None, 'error': {'message': "超时"}},
+        ok_line(1, "第二页"),
+        {'custom_id': 'garbage'},
+        ok_line(99, "越界"),
+    ]
+    record = {'batch_id': 'b', 'chunk_count': 5, 'duplicates': {'4': 1}}
+    results, errors = collect(record, FakeBackend(lines))
+    assert [item and item['title'] for item in results] == [None, "第二页", None, "第四页", "第二页"]
+    assert results[4]['chunk_index'] == 4
+    assert errors == {0: "超时", 2: "批处理结果中没有该文本块"}
+
+def test_collect_duplicate_of_failed_chunk_fails():
+    lines = [{'custom_id': custom_id(0, '0'), 'response': {'status_code': 500, 'body': {}}, 'error': None}]
+    results, errors = collect({'batch_id': 'b', 'chunk_count': 2, 'duplicates': {'1': 0}}, FakeBackend(lines))
+    assert results == [None, None]
+    assert errors[1] == errors[0]
+
+def request_lines(count):
+    return [{'custom_id': custom_id(i, str(i)), 'method': 'POST', 'url': batch_jobs.ENDPOINT,
+             'body': {'messages': [{'role': 'user', 'content': str(i)}]}} for i in range(count)]
+
+def wait_final(backend, batch_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = backend.status(batch_id)
+        if status['status'] in batch_jobs.FINAL_STATUSES:
+            return status
+        time.sleep(0.01)
+    raise AssertionError("batch did not finish")
+
+def test_local_backend_completes(tmp_path):
+    backend = LocalFileBackend(str(tmp_path), respond=lambda body: answer(body['messages'][0]['content']))
+    batch_id = backend.submit(to_jsonl(request_lines(3)))
+    status = wait_final(backend, batch_id)
+    assert status == {'status': 'completed', 'completed': 3, 'failed': 0, 'total': 3}
+    assert [chunk_index(line['custom_id']) for line in backend.results(batch_id)] == [0, 1, 2]
+
+def test_local_backend_cancel_survives_progress_writes(tmp_path):
+    started, release = threading.Event(), threading.Event()
+
+    def respond(body):
+        started.set()
+        release.wait(5)
+        return answer("页")
+
+    backend = LocalFileBackend(str(tmp_path), respond=respond)
+    batch_id = backend.submit(to_jsonl(request_lines(5)))
+    assert started.wait(5)
+    backend.cancel(batch_id)
+    # 处理线程写入进度时不能覆盖取消请求
+    release.set()
+    status = wait_final(backend, batch_id)
+    assert status['status'] == 'cancelled'
+    assert status['completed'] == 1
+    assert len(backend.results(batch_id)) == 1
+
+def test_local_backend_resumes_after_existing_output(tmp_path):
+    calls = []
+    backend = LocalFileBackend(str(tmp_path), respond=lambda body: calls.append(body) or answer("页"))
+    batch_id = "batch_local_resume"
+    os.makedirs(tmp_path / batch_id)
+    requests = request_lines(3)
+    (tmp_path / batch_id / 'input.jsonl').write_bytes(to_jsonl(requests))
+    done = {'custom_id': requests[0]['custom_id'], 'response': {'status_code': 200, 'body': answer("旧")}}
+    (tmp_path / batch_id / 'output.jsonl').write_text(json.dumps(done, ensure_ascii=False) + "\n", encoding='utf-8')
+    backend._write_status(batch_id, {'status': 'in_progress', 'total': 3, 'completed': 1, 'failed': 0,
+                                     'pid': -1, 'metadata': {}})
+
+    status = wait_final(backend, batch_id)
+    assert status['completed'] == 3
+    assert len(calls) == 2
+    assert [chunk_index(line['custom_id']) for line in backend.results(batch_id)] == [0, 1, 2]
@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip('numpy')
+
+from dedupe import find_duplicates, unique_chunks, minhash, normalize, similarity
+
+BASE = ("人工智能正在改变软件开发的方式，自动补全、代码审查和测试生成都在逐步引入大模型，"
+        "团队需要重新思考评审流程和质量标准，同时关注数据安全与合规要求。")
+OTHER = ("城市交通规划需要综合考虑公共交通、步行与骑行空间，合理布局地铁线路和公交站点，"
+         "并通过数据分析优化信号灯配时，减少拥堵和排放。")
+
+def test_normalize_ignores_whitespace_and_punctuation():
+    assert normalize("Hello, World！ 你好。") == normalize("hello world你好")
+
+def test_similarity_of_identical_text_is_one():
+    signature = minhash(normalize(BASE))
+    assert similarity(signature, signature) == 1.0
+
+def test_exact_and_formatting_duplicates():
+    chunks = [BASE, OTHER, BASE.replace("，", ", "), BASE]
+    duplicates = find_duplicates(chunks)
+    assert duplicates == {2: (0, 1.0), 3: (0, 1.0)}
+    assert unique_chunks(chunks) == [BASE, OTHER]
+
+def test_near_duplicate_grouped_with_first_occurrence():
+    near = BASE[:-4] + "等要求。"
+    duplicates = find_duplicates([BASE, OTHER, near], threshold=0.7)
+    assert set(duplicates) == {2}
+    representative, score = duplicates[2]
+    assert representative == 0
+    assert 0.7 <= score < 1.0
+
+def test_distinct_chunks_are_kept():
+    assert find_duplicates([BASE, OTHER]) == {}
+
+def test_short_chunks_only_match_exactly():
+    assert find_duplicates(["第一章", "第一章", "第二章"]) == {1: (0, 1.0)}
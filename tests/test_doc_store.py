@@ -0,0 +1,81 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import doc_store
+from doc_store import DocumentStore, DocumentTooLarge, _locate
+
+TEXT = "第一段，介绍背景。\n\n第二段，说明方法和步骤。\n\n第三段，总结结论并展望未来。"
+
+@pytest.fixture(autouse=True)
+def spill_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(doc_store, 'SPILL_DIR', str(tmp_path))
+    return tmp_path
+
+def test_locate_contiguous_chunk():
+    chunk = "第二段，说明方法和步骤。"
+    start = TEXT.index(chunk)
+    assert _locate(chunk, TEXT, 0) == ((start, start + len(chunk)),)
+
+def test_locate_chunk_without_separators():
+    # 分割器合并相邻块时去掉了中间的空白
+    first, second = "甲" * 40 + "。", "乙" * 40 + "。"
+    text = f"{first}\n\n{second}"
+    segments = _locate(first + second, text, 0)
+    assert segments == ((0, len(first)), (len(first) + 2, len(text)))
+
+def test_locate_unknown_text():
+    assert _locate("不在原文中", TEXT, 0) is None
+
+def test_chunks_round_trip_as_segments():
+    store = DocumentStore()
+    store.load(TEXT)
+    chunks = [part for part in TEXT.split("\n\n")]
+    store.set_chunks(chunks)
+    assert list(store.edited_chunks) == chunks
+    assert store.stats()['overrides'] == 0
+
+    store.edited_chunks[1] = "改写后的第二段"
+    assert store.chunk(1) == "改写后的第二段"
+    assert store.chunk(0) == chunks[0]
+    assert store.stats()['overrides'] == 1
+
+def test_editing_text_clears_chunks():
+    store = DocumentStore()
+    store.load(TEXT)
+    store.set_chunks(TEXT.split("\n\n"))
+    store.edited_text = TEXT + "\n\n补充一段。"
+    assert not store.has_chunks
+    assert store.extracted_text == TEXT
+    store.revert()
+    assert store.edited_text == TEXT
+
+def test_spill_and_reload(spill_dir):
+    store = DocumentStore()
+    store.load(TEXT)
+    store.set_chunks(TEXT.split("\n\n"))
+    store.edited_chunks[2] = "新的结论"
+
+    assert store.spill()
+    assert store.memory_bytes() == 0
+    assert store.stats()['spilled']
+    assert len(os.listdir(spill_dir)) == 1
+
+    assert store.edited_text == TEXT
+    assert list(store.edited_chunks) == TEXT.split("\n\n")[:2] + ["新的结论"]
+    assert store.stats()['overrides'] == 1
+
+def test_load_discards_spill_file(spill_dir):
+    store = DocumentStore()
+    store.load(TEXT)
+    store.spill()
+    store.load("新文档")
+    assert os.listdir(spill_dir) == []
+
+def test_document_too_large(monkeypatch):
+    monkeypatch.setattr(doc_store, 'MAX_DOCUMENT_CHARS', 10)
+    with pytest.raises(DocumentTooLarge):
+        DocumentStore().load("x" * 11)
@@ -0,0 +1,18 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from document_readers import merge_sections, allocate_chunks
+
+def test_more_sections_than_chunks_are_merged():
+    sections = ['aaaa', 'b', 'cc', 'dddddd', 'e']
+    merged = merge_sections(sections, 3)
+    assert len(merged) == 3
+    assert ''.join(merged) == ''.join(sections)
+    assert sum(allocate_chunks([len(s) for s in merged], 3)) == 3
+
+def test_sections_within_chunk_count_are_kept():
+    sections = ['aaaa', 'b', 'cc']
+    assert merge_sections(sections, 5) == sections
+    assert sum(allocate_chunks([len(s) for s in sections], 5)) == 5
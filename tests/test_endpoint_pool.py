@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import uuid
+from collections import deque
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm_client
+import endpoint_pool
+from endpoint_pool import Endpoint, EndpointPool, LLMCallError
+
+@pytest.fixture(autouse=True)
+def no_scheduler(monkeypatch):
+    monkeypatch.setattr(llm_client, 'get_scheduler', lambda: None)
+    # 对冲请求的独立连接需要httpx，这里只测试调度逻辑
+    real_attempt = endpoint_pool._Attempt
+    monkeypatch.setattr(endpoint_pool, '_Attempt', lambda endpoint, dedicated: real_attempt(endpoint, False))
+
+def make_pool(count, hedge=False):
+    # 每个测试使用不同的地址，避免共用进程内的调用闸门
+    prefix = uuid.uuid4().hex[:8]
+    return EndpointPool([Endpoint(f"http://{prefix}-{i}.test/v1", 'key') for i in range(count)], hedge)
+
+def test_pick_prefers_least_outstanding():
+    pool = make_pool(3)
+    picked = [pool.pick() for _ in range(3)]
+    assert len(set(picked)) == 3
+    pool._finish(picked[1], 'stage', latency=0.1)
+    assert pool.pick() is picked[1]
+
+def test_pick_skips_endpoint_in_cooldown():
+    pool = make_pool(2)
+    first, second = pool.endpoints
+    for _ in range(endpoint_pool.FAILURE_THRESHOLD):
+        pool.pick(exclude=(second,))
+        pool._finish(first, 'stage', error=RuntimeError("boom"))
+    assert not first.healthy()
+    assert pool.pick() is second
+
+def test_call_fails_over_to_next_endpoint():
+    pool = make_pool(2)
+    first, second = pool.endpoints
+
+    def fn(endpoint, client):
+        if endpoint is first:
+            raise LLMCallError("down")
+        return endpoint.base_url
+
+    assert pool.call(fn, 'stage') == second.base_url
+    assert first.errors == 1
+    assert first.outstanding == 0 and second.outstanding == 0
+
+def test_call_raises_when_all_endpoints_fail():
+    pool = make_pool(2)
+
+    def fn(endpoint, client):
+        raise LLMCallError("down")
+
+    with pytest.raises(LLMCallError):
+        pool.call(fn, 'stage')
+
+def slow_primary(pool, delay=0.3):
+    first = pool.endpoints[0]
+
+    def fn(endpoint, client):
+        if endpoint is first:
+            time.sleep(delay)
+        return endpoint.base_url
+    return fn
+
+def test_hedge_wins_when_primary_is_slow():
+    pool = make_pool(2, hedge=True)
+    pool._latencies['stage'] = deque([0.01] * endpoint_pool.HEDGE_MIN_SAMPLES)
+    pool._requests = 100
+    assert pool.call(slow_primary(pool), 'stage') == pool.endpoints[1].base_url
+    assert pool.stats()['hedges'] == 1
+    assert pool.stats()['hedge_wins'] == 1
+
+def test_hedge_budget_is_enforced():
+    pool = make_pool(2, hedge=True)
+    pool._latencies['stage'] = deque([0.01] * endpoint_pool.HEDGE_MIN_SAMPLES)
+    # 第一个请求时预算为 0.1 个对冲，不允许对冲
+    assert pool.call(slow_primary(pool, 0.05), 'stage') == pool.endpoints[0].base_url
+    assert pool.stats()['hedges'] == 0
+
+    pool._requests = 10
+    assert pool._hedge_allowed()
+    assert not pool._hedge_allowed()
@@ -0,0 +1,56 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hierarchical import group, plan_depth, build_tree, deck_items, AGENDA_TITLE
+
+def leaves(count):
+    return [{'title': f"块{i}", 'content': f"内容{i}", 'chunk_index': i} for i in range(count)]
+
+def merge(children):
+    return "、".join(child['title'] for child in children), f"{children[0]['title']}至{children[-1]['title']}"
+
+def test_group_keeps_order_and_merges_small_tail():
+    assert group(list(range(10)), 4) == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+    # 最后一组少于 max(2, fan_out // 4) 个时并入前一组
+    assert group(list(range(9)), 4) == [[0, 1, 2, 3], [4, 5, 6, 7, 8]]
+    assert group(list(range(3)), 8) == [[0, 1, 2]]
+
+def test_plan_depth():
+    assert plan_depth(1, 8, 2) == 0
+    assert plan_depth(5, 8, 2) == 1
+    assert plan_depth(64, 8, 3) == 1
+    assert plan_depth(100, 8, 3) == 2
+    assert plan_depth(1000, 8, 3) == 3
+    assert plan_depth(1000, 8, 2) == 2
+
+def test_build_tree_reduces_each_level():
+    levels = []
+    sections, failed = build_tree(leaves(24), merge, fan_out=4, max_depth=2, max_workers=2,
+                                  on_level=lambda level, depth: levels.append((level, depth)))
+    assert failed == 0
+    assert levels == [(1, 2), (2, 2)]
+    assert [section['chunk_range'] for section in sections] == [(0, 15), (16, 23)]
+    assert sections[0]['title'] == "块0至块3至块12至块15"
+    assert sections[1]['chunk_index'] == 16
+
+def test_build_tree_falls_back_on_failed_group():
+    def flaky(children):
+        if children[0]['chunk_index'] == 0:
+            raise RuntimeError("boom")
+        return merge(children)
+
+    sections, failed = build_tree(leaves(8), flaky, fan_out=4, max_depth=1)
+    assert failed == 1
+    assert sections[0]['title'] == "块0"
+    assert sections[0]['content'] == "1. 块0\n2. 块1\n3. 块2\n4. 块3"
+    assert sections[1]['title'] == "块4至块7"
+
+def test_deck_items_with_details():
+    sections, _ = build_tree(leaves(6), merge, fan_out=3, max_depth=1)
+    items = deck_items(sections, include_details=True)
+    assert items[0]['title'] == AGENDA_TITLE
+    assert [item['level'] for item in items[1:]] == ['section'] + ['detail'] * 3 + ['section'] + ['detail'] * 3
+    assert items[1]['chunk_range'] == [0, 2]
+    assert [item['chunk_index'] for item in items if item['level'] == 'detail'] == list(range(6))
@@ -0,0 +1,73 @@
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip('pptx')
+pytest.importorskip('streamlit')
+
+from pptx import Presentation
+from pptx.util import Inches
+
+from incremental_export import IncrementalExporter
+from ppt_utils import SLIDE_WIDTH, SLIDE_HEIGHT, fill_cover_slide, fill_content_slide
+
+def main_title(extracted_contents):
+    # 总标题只随标题集合变化，与页面顺序无关
+    return "总标题：" + "、".join(sorted({item['title'] for item in extracted_contents}))
+
+def full_export(extracted_contents):
+    """与 create_ppt 不带缓存时相同的完整导出"""
+    prs = Presentation()
+    prs.slide_width = Inches(SLIDE_WIDTH)
+    prs.slide_height = Inches(SLIDE_HEIGHT)
+    fill_cover_slide(prs.slides.add_slide(prs.slide_layouts[0]), main_title(extracted_contents))
+    for item in extracted_contents:
+        fill_content_slide(prs.slides.add_slide(prs.slide_layouts[6]), item['title'], item['content'])
+    buffer = io.BytesIO()
+    prs.save(buffer)
+    return buffer.getvalue()
+
+def slide_texts(data):
+    prs = Presentation(io.BytesIO(data))
+    return [[shape.text_frame.text for shape in slide.shapes if shape.has_text_frame]
+            for slide in prs.slides]
+
+def page(index, extra=""):
+    return {'title': f"第{index}页", 'content': f"- 要点{index}\n  - 细节{index}{extra}\n- 总结{index}"}
+
+EDITS = [
+    [page(1), page(2), page(3)],
+    [page(1), page(2, "（修改）"), page(3)],
+    [page(1), page(2, "（修改）"), page(3), page(4), page(5)],
+    [page(1), page(3)],
+    [page(3), page(1), page(2)],
+    [page(1), page(2), page(3)],
+]
+
+def test_incremental_matches_full_export():
+    exporter = IncrementalExporter()
+    for contents in EDITS:
+        incremental = slide_texts(exporter.export(contents, main_title))
+        assert incremental == slide_texts(full_export(contents))
+        assert len(incremental) == len(contents) + 1
+
+def test_unchanged_slides_are_not_rebuilt():
+    exporter = IncrementalExporter()
+    exporter.export(EDITS[0], main_title)
+    assert exporter.last_stats == {'slides': 3, 'rebuilt': 3, 'reused': 0}
+    exporter.export(EDITS[1], main_title)
+    assert exporter.last_stats == {'slides': 3, 'rebuilt': 1, 'reused': 0}
+    # 恢复原来的内容时复用缓存的形状树
+    exporter.export(EDITS[0], main_title)
+    assert exporter.last_stats == {'slides': 3, 'rebuilt': 0, 'reused': 1}
+
+def test_append_then_export_matches_full_export():
+    exporter = IncrementalExporter()
+    for item in EDITS[0]:
+        exporter.append(item)
+    assert slide_texts(exporter.export(EDITS[0], main_title)) == slide_texts(full_export(EDITS[0]))
+    assert exporter.last_stats['rebuilt'] == 0
@@ -0,0 +1,138 @@
+import os
+import sys
+import time
+from email.utils import formatdate
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm_client
+from llm_client import AdaptiveLimiter, CircuitBreaker, LLMCallError, LLMGate, retry_after_seconds
+
+class FakeResponse:
+    def __init__(self, headers=None):
+        self.headers = headers or {}
+
+class FakeAPIError(Exception):
+    def __init__(self, status, headers=None):
+        super().__init__(f"status {status}")
+        self.status_code = status
+        self.response = FakeResponse(headers)
+
+class Interrupted(BaseException):
+    pass
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    calls = []
+    monkeypatch.setattr(llm_client.time, 'sleep', calls.append)
+    monkeypatch.setattr(llm_client, 'get_scheduler', lambda: None)
+    return calls
+
+def half_open_gate(max_attempts=2):
+    gate = LLMGate(max_attempts=max_attempts)
+    gate.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0)
+    gate.breaker.record_failure()
+    gate.breaker._opened_at = time.monotonic() - 60
+    assert gate.breaker.state == 'half_open'
+    return gate
+
+def test_breaker_open_half_open_close():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.wait_time() > 0
+
+    time.sleep(0.06)
+    assert breaker.state == 'half_open'
+    assert breaker.wait_time() == 0
+    assert breaker.holds_probe()
+    # 探测进行中时其他请求继续等待
+    assert breaker.wait_time() > 0
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.wait_time() == 0
+
+def test_failed_probe_reopens_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.wait_time() == 0
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.holds_probe()
+
+def test_probe_released_on_success(sleeps):
+    gate = half_open_gate()
+    assert gate.call(lambda: 'ok') == 'ok'
+    assert gate.breaker.state == 'closed'
+
+def test_probe_released_on_non_retryable_error(sleeps):
+    gate = half_open_gate()
+    def rejected():
+        raise FakeAPIError(400)
+    with pytest.raises(FakeAPIError):
+        gate.call(rejected)
+    assert not gate.breaker.holds_probe()
+    assert gate.breaker.state == 'half_open'
+    assert gate.breaker.wait_time() == 0
+
+def test_probe_released_on_interrupt(sleeps):
+    gate = half_open_gate()
+    def interrupted():
+        raise Interrupted()
+    with pytest.raises(Interrupted):
+        gate.call(interrupted)
+    assert not gate.breaker.holds_probe()
+    assert gate.breaker.wait_time() == 0
+    assert gate.limiter.in_flight == 0
+
+def test_throttled_probe_reopens_breaker(sleeps):
+    gate = half_open_gate(max_attempts=1)
+    def throttled():
+        raise FakeAPIError(429)
+    with pytest.raises(LLMCallError):
+        gate.call(throttled)
+    assert not gate.breaker.holds_probe()
+    assert gate.breaker.state == 'open'
+
+def test_retry_after_header_sets_delay(sleeps):
+    gate = LLMGate(max_attempts=3)
+    calls = []
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise FakeAPIError(429, {'retry-after': '7'})
+        return 'ok'
+    assert gate.call(flaky) == 'ok'
+    assert sleeps == [7.0]
+
+def test_retry_after_formats():
+    assert retry_after_seconds(FakeAPIError(429, {'retry-after-ms': '1500'})) == 1.5
+    assert retry_after_seconds(FakeAPIError(429, {'retry-after': '3'})) == 3.0
+    date = formatdate(time.time() + 30, usegmt=True)
+    assert 25 <= retry_after_seconds(FakeAPIError(429, {'retry-after': date})) <= 30
+    assert retry_after_seconds(FakeAPIError(429, {'retry-after': 'soon'})) is None
+    assert retry_after_seconds(FakeAPIError(500)) is None
+
+def test_aimd_increase_and_decrease():
+    limiter = AdaptiveLimiter(initial=4, min_limit=1, max_limit=16, cooldown=0)
+    limiter.on_success(1.0)
+    assert limiter._limit == pytest.approx(4.25)
+    limiter.on_throttle()
+    assert limiter._limit == pytest.approx(2.125)
+    # 延迟远高于基线时乘性减小
+    limiter.on_success(10.0)
+    assert limiter._limit == pytest.approx(2.125 * 0.9)
+    for _ in range(3):
+        limiter.on_throttle()
+    assert limiter.limit == 1
+
+def test_aimd_decreases_once_per_cooldown():
+    limiter = AdaptiveLimiter(initial=8, cooldown=60)
+    limiter.on_throttle()
+    limiter.on_throttle()
+    assert limiter.limit == 4
@@ -0,0 +1,18 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_output import parse_extraction
+
+def test_nested_content_item_is_not_marker():
+    text = '标题：T\n1. 项目\n  - 内容：描述\n  - 其他'
+    assert parse_extraction(text) == ('T', '1. 项目\n  - 内容：描述\n  - 其他')
+
+def test_bulleted_points_item_is_not_marker():
+    text = '标题：T\n- 要点：a\n- b'
+    assert parse_extraction(text) == ('T', '- 要点：a\n- b')
+
+def test_bold_and_heading_markers():
+    assert parse_extraction('**标题：** T\n**内容：**\n1. a') == ('T', '1. a')
+    assert parse_extraction('## Title: T\n## Content:\n- a') == ('T', '- a')
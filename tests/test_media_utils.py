@@ -0,0 +1,86 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import media_utils
+
+class FakeResponse:
+    def __init__(self, location=None, body=b'image'):
+        self.is_redirect = location is not None
+        self.headers = {'location': location} if location else {}
+        self.body = body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, size):
+        yield self.body
+
+@pytest.fixture
+def fake_get(monkeypatch):
+    requests = pytest.importorskip('requests')
+    calls = []
+
+    def install(responses, public=lambda url: True):
+        def get(url, **kwargs):
+            assert kwargs['allow_redirects'] is False
+            calls.append(url)
+            return responses[url]
+        monkeypatch.setattr(requests, 'get', get)
+        monkeypatch.setattr(media_utils, '_public_url', public)
+        return calls
+    return install
+
+@pytest.mark.parametrize('url', [
+    'http://127.0.0.1/a.png', 'http://10.0.0.1/a.png', 'http://192.168.1.1/a.png',
+    'http://169.254.169.254/latest/meta-data', 'http://[::1]/a.png', 'http://0.0.0.0/a.png',
+    'http://224.0.0.1/a.png', 'ftp://8.8.8.8/a.png', 'http:///a.png',
+])
+def test_private_addresses_rejected(url):
+    assert not media_utils._public_url(url)
+
+def test_public_address_allowed():
+    assert media_utils._public_url('http://8.8.8.8/a.png')
+
+def test_redirects_are_checked_each_hop(fake_get):
+    calls = fake_get({
+        'http://cdn.example/a.png': FakeResponse(location='/b.png'),
+        'http://cdn.example/b.png': FakeResponse(location='http://169.254.169.254/'),
+    }, public=lambda url: '169.254' not in url)
+    assert media_utils._fetch('http://cdn.example/a.png') is None
+    assert calls == ['http://cdn.example/a.png', 'http://cdn.example/b.png']
+
+def test_redirect_followed_to_public_host(fake_get):
+    fake_get({
+        'http://cdn.example/a.png': FakeResponse(location='https://img.example/a.png'),
+        'https://img.example/a.png': FakeResponse(body=b'data'),
+    })
+    assert media_utils._fetch('http://cdn.example/a.png') == b'data'
+
+def test_redirect_loop_gives_up(fake_get):
+    calls = fake_get({'http://cdn.example/a.png': FakeResponse(location='/a.png')})
+    assert media_utils._fetch('http://cdn.example/a.png') is None
+    assert len(calls) == media_utils.MAX_REDIRECTS + 1
+
+def test_store_recovers_when_cleanup_removes_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(media_utils, 'MEDIA_DIR', str(tmp_path))
+    monkeypatch.setattr(media_utils, 'downscale', lambda data: (b'small', '.png'))
+    image_id = media_utils._store(b'original')[0]
+    path = media_utils.image_path(image_id)
+
+    def removed(target, *args):
+        # 模拟检查存在之后、更新修改时间之前文件被清理
+        os.unlink(target)
+        raise FileNotFoundError(target)
+    monkeypatch.setattr(media_utils.os, 'utime', removed)
+    assert media_utils._store(b'original') == (image_id, 8, 5, False)
+    assert os.path.exists(path)
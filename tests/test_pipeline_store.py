@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+import sqlite3
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pipeline_store
+from pipeline_store import PipelineStore
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline_store, 'FLUSH_INTERVAL', 0.01)
+    return PipelineStore(str(tmp_path / 'jobs' / 'pipeline.sqlite3'))
+
+def test_save_and_load_job(store):
+    store.save_document('job', '原文', '编辑后的原文')
+    store.save_step('job', 3)
+    store.save_chunks('job', ['块一', '块二'])
+    store.save_results('job', [
+        {'title': '标题一', 'content': '- 要点', 'chunk_index': 0},
+        {'title': '汇总', 'content': '- 概述', 'chunk_index': 1, 'level': 'section',
+         'chunk_range': [0, 1], 'draft': True},
+    ])
+    store.save_title('job', 'key', '总标题')
+
+    job = store.load_job('job')
+    assert job['step'] == 3
+    assert job['source_text'] == '原文'
+    assert job['edited_text'] == '编辑后的原文'
+    assert job['chunks'] == ['块一', '块二']
+    assert job['extracted_contents'] == [
+        {'title': '标题一', 'content': '- 要点', 'chunk_index': 0},
+        {'title': '汇总', 'content': '- 概述', 'chunk_index': 1, 'level': 'section',
+         'chunk_range': [0, 1], 'draft': True},
+    ]
+    assert (job['titles_key'], job['main_title']) == ('key', '总标题')
+
+def test_missing_job(store):
+    assert store.load_job('missing') is None
+
+def test_latest_write_wins(store):
+    store.save_chunks('job', ['旧'])
+    store.save_chunks('job', ['新一', '新二'])
+    store.save_results('job', [{'title': 'a', 'content': 'b'}])
+    store.save_results('job', [])
+    job = store.load_job('job')
+    assert job['chunks'] == ['新一', '新二']
+    assert job['extracted_contents'] == []
+
+def test_reopen_keeps_jobs(store):
+    store.save_document('job', '原文', None)
+    assert store.flush()
+    reopened = PipelineStore(store.path)
+    assert reopened.load_job('job')['source_text'] == '原文'
+
+def test_unchanged_document_is_not_requeued(store):
+    store.save_document('job', '原文', None)
+    store.flush()
+    store.save_document('job', '原文', None)
+    assert not store._pending
+    store.save_document('job', '原文', '改动')
+    assert store.load_job('job')['edited_text'] == '改动'
+
+def test_expired_jobs_are_purged(store):
+    store.save_document('old', '原文', None)
+    store.save_chunks('old', ['块'])
+    store.flush()
+    with sqlite3.connect(store.path) as conn:
+        conn.execute('UPDATE jobs SET updated = ?', (time.time() - 30 * 86400,))
+    PipelineStore(store.path)
+    assert store.load_job('old') is None
+
+@pytest.mark.skipif(sys.platform == 'win32', reason="POSIX permissions")
+def test_database_is_private(store):
+    assert os.stat(store.path).st_mode & 0o777 == 0o600
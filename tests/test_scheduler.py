@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import time
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scheduler
+from scheduler import GlobalScheduler
+
+def waiting_entry(user, enqueued, pid=None):
+    now = time.time()
+    return {'user': user, 'tokens': 0, 'pid': pid or os.getpid(), 'enqueued': enqueued, 'seen': now}
+
+def test_order_interleaves_users_fairly():
+    state = {
+        'waiting': {
+            'a1': waiting_entry('a', 1), 'a2': waiting_entry('a', 2), 'a3': waiting_entry('a', 3),
+            'b1': waiting_entry('b', 4),
+        },
+        'running': {}, 'tags': {}, 'vclock': 0.0,
+    }
+    assert GlobalScheduler._order(state) == ['a1', 'b1', 'a2', 'a3']
+
+def test_served_user_yields_to_new_user(tmp_path):
+    sched = GlobalScheduler(state_dir=str(tmp_path), max_concurrent=4)
+    for _ in range(3):
+        sched.release(sched.acquire('heavy'))
+    with sched._state() as state:
+        state['waiting']['h'] = waiting_entry('heavy', 1)
+        state['waiting']['l'] = waiting_entry('light', 2)
+        order = GlobalScheduler._order(state)
+    assert order == ['l', 'h']
+
+def test_concurrency_limit_and_release(tmp_path):
+    sched = GlobalScheduler(state_dir=str(tmp_path), max_concurrent=1)
+    ticket = sched.acquire('a')
+    with pytest.raises(TimeoutError):
+        sched.acquire('b', timeout=0.1)
+    sched.release(ticket)
+    sched.release(sched.acquire('b', timeout=1))
+    assert sched.status('b') == {'position': None, 'waiting': 0, 'running': 0,
+                                 'queued_total': 0, 'running_total': 0}
+
+def test_rpm_budget_refuses(tmp_path):
+    sched = GlobalScheduler(state_dir=str(tmp_path), rpm=1)
+    sched.release(sched.acquire('a'))
+    with pytest.raises(TimeoutError):
+        sched.acquire('a', timeout=0.1)
+
+def test_tpm_budget_refuses(tmp_path):
+    sched = GlobalScheduler(state_dir=str(tmp_path), tpm=1000)
+    sched.release(sched.acquire('a', tokens=800))
+    with pytest.raises(TimeoutError):
+        sched.acquire('a', tokens=800, timeout=0.1)
+    # 超过TPM上限的单个请求在令牌桶满时放行
+    fresh = GlobalScheduler(state_dir=str(tmp_path / 'fresh'), tpm=1000)
+    fresh.release(fresh.acquire('a', tokens=5000, timeout=1))
+
+def test_dead_pid_tickets_are_cleaned(tmp_path, monkeypatch):
+    dead_pid = 999999
+    monkeypatch.setattr(scheduler, '_pid_alive', lambda pid: pid != dead_pid)
+    sched = GlobalScheduler(state_dir=str(tmp_path), max_concurrent=1)
+    with open(sched.state_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'waiting': {'w': waiting_entry('gone', 1, dead_pid)},
+            'running': {'r': {'user': 'gone', 'pid': dead_pid, 'granted': time.time()}},
+        }, f)
+    status = sched.status('gone')
+    assert status['queued_total'] == 0
+    assert status['running_total'] == 0
+    sched.release(sched.acquire('a', timeout=1))
+
+def read_waiting(sched):
+    with sched._state() as state:
+        return dict(state['waiting'])
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = condition()
+        if result:
+            return result
+        time.sleep(0.01)
+    raise AssertionError("condition not met")
+
+def test_pruned_ticket_keeps_its_place(tmp_path):
+    sched = GlobalScheduler(state_dir=str(tmp_path), max_concurrent=1)
+    blocker = sched.acquire('x')
+    granted = []
+    thread = threading.Thread(target=lambda: granted.append(sched.acquire('a', timeout=5)))
+    thread.start()
+
+    waiting = wait_for(lambda: read_waiting(sched))
+    (ticket, entry), = waiting.items()
+    # 模拟排队请求被当作已放弃清理
+    with sched._state() as state:
+        del state['waiting'][ticket]
+    readded = wait_for(lambda: read_waiting(sched).get(ticket))
+    assert readded['enqueued'] == entry['enqueued']
+
+    sched.release(blocker)
+    thread.join(5)
+    assert granted == [ticket]
+    sched.release(ticket)